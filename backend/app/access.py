@@ -0,0 +1,42 @@
+from sqlalchemy import true, false
+from .models import FileMeta
+
+
+def file_visibility_clause(user):
+    """
+    SQL condition selecting the FileMeta rows a user may see and manage:
+    admins see everything, employees their client's files and client users
+    the files they uploaded themselves.
+    """
+    if user.role == "admin":
+        return true()
+    if user.role == "employee":
+        return FileMeta.client_id == user.client_id
+    if user.role == "client":
+        return FileMeta.uploaded_by == user.id
+    return false()
+
+
+def visibility_scope(user) -> str:
+    """
+    Cache key part and tag naming the set of files file_visibility_clause(user)
+    selects: "files" (everything), "client:<id>" or "uploader:<id>".
+    """
+    if user.role == "admin":
+        return "files"
+    if user.role == "employee":
+        return f"client:{user.client_id}"
+    if user.role == "client":
+        return f"uploader:{user.id}"
+    return "none"
+
+
+def file_tags(rows) -> set:
+    """Cache tags whose results change when the given files (rows with client_id, uploaded_by) change."""
+    tags = {"files", "usage"}
+    for row in rows:
+        if row.client_id is not None:
+            tags.add(f"client:{row.client_id}")
+        if row.uploaded_by is not None:
+            tags.add(f"uploader:{row.uploaded_by}")
+    return tags
@@ -0,0 +1,73 @@
+"""
+Out-of-band access logging.
+
+Request handlers that must not touch the database (signed downloads) queue
+their LogEntry rows here; a background thread inserts them in batches.
+"""
+import datetime
+import logging
+import queue
+import threading
+from collections import defaultdict
+from sqlalchemy import insert
+from .models import LogEntry
+from .sharding import file_client, session_for_client
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0  # seconds
+
+_log_queue = queue.Queue()
+_log_thread = None
+_log_lock = threading.Lock()
+
+
+def _write(rows):
+    # Entries go to the database (catalog or tenant shard) holding their file
+    by_client = defaultdict(list)
+    for row in rows:
+        by_client[file_client(row["file_id"])].append(row)
+    for client_id, entries in by_client.items():
+        db = session_for_client(client_id)
+        try:
+            db.execute(insert(LogEntry), entries)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error writing {len(entries)} access log entries: {str(e)}")
+        finally:
+            db.close()
+
+
+def _log_worker():
+    while True:
+        rows = [_log_queue.get()]
+        try:
+            # Collect whatever else arrives within the flush interval
+            while len(rows) < BATCH_SIZE:
+                try:
+                    rows.append(_log_queue.get(timeout=FLUSH_INTERVAL))
+                except queue.Empty:
+                    break
+            _write(rows)
+        finally:
+            for _ in rows:
+                _log_queue.task_done()
+
+
+def record_access(username: str, action: str, file_id: int):
+    """Queue a log entry; it is written within about FLUSH_INTERVAL seconds."""
+    global _log_thread
+    with _log_lock:
+        if _log_thread is None:
+            _log_thread = threading.Thread(target=_log_worker, name="access-log", daemon=True)
+            _log_thread.start()
+    _log_queue.put({"user": username, "action": action, "file_id": file_id,
+                    "timestamp": datetime.datetime.utcnow()})
+
+
+def drain_access_log():
+    """Block until every queued entry has been written."""
+    if _log_thread is not None:
+        _log_queue.join()
@@ -0,0 +1,299 @@
+"""
+Admission control for the heavy I/O endpoints (uploads and downloads).
+
+Before a transfer starts, its request must pass, in order:
+    - token-bucket rate limits per user and per client
+    - caps on concurrent transfers per user and per client
+    - a global budget of bytes in flight (upload Content-Length; downloads
+      count with their response size once it is known)
+Requests over a limit get 429 with Retry-After instead of queueing. Limits
+are keyed by the bearer token's claims (id, client_id), so no database lookup
+is needed, and slots are released when the response has been fully sent.
+
+State lives in a pluggable store: MemoryStore is per process, DatabaseStore
+shares it between workers through the admission_* tables.
+"""
+import logging
+import math
+import re
+import threading
+import time
+from jose import JWTError, jwt
+from sqlalchemy import insert, select, update, delete, func, literal, case
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+from .database import SessionLocal
+from .models import AdmissionBucket, AdmissionLease
+from .signed_urls import verify_download, InvalidSignedURL
+from .config import (
+    SECRET_KEY, ALGORITHM, ADMISSION_STORE, USER_RATE_LIMIT, USER_RATE_BURST,
+    CLIENT_RATE_LIMIT, CLIENT_RATE_BURST, USER_MAX_TRANSFERS, CLIENT_MAX_TRANSFERS,
+    MAX_BYTES_IN_FLIGHT, ADMISSION_LEASE_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+# Retry-After for requests rejected by a concurrency or bytes limit
+BUSY_RETRY_AFTER = 1
+BYTES_KEY = "bytes:global"
+
+# (method, path pattern) of the endpoints under admission control
+CONTROLLED_ROUTES = [
+    ("POST", re.compile(r"^/files/upload(/batch|/delta)?$")),
+    ("GET", re.compile(r"^/files/download/\d+$")),
+    ("GET", re.compile(r"^/files/signed/[^/]+$")),
+    ("GET", re.compile(r"^/files/\d+/export$")),
+    ("GET", re.compile(r"^/files/consolidate$")),
+]
+
+
+class MemoryStore:
+    """Limits for a single process."""
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._usage = {}  # key -> amount in use
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """Take one token; returns 0 when admitted, else seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+            return 0
+
+    def acquire(self, key: str, limit: int, amount: int = 1):
+        """Reserve amount under limit; returns a lease or None when it doesn't fit."""
+        with self._lock:
+            in_use = self._usage.get(key, 0)
+            if in_use + amount > limit:
+                return None
+            self._usage[key] = in_use + amount
+            return [key, amount]
+
+    def resize(self, lease, amount: int):
+        """Change a lease's amount without checking the limit (it is already admitted)."""
+        with self._lock:
+            self._usage[lease[0]] = self._usage.get(lease[0], 0) + amount - lease[1]
+            lease[1] = amount
+
+    def release(self, lease):
+        with self._lock:
+            remaining = self._usage.get(lease[0], 0) - lease[1]
+            if remaining > 0:
+                self._usage[lease[0]] = remaining
+            else:
+                self._usage.pop(lease[0], None)
+
+
+class DatabaseStore:
+    """
+    Limits shared by all workers. Bucket updates and slot reservations are
+    single conditional statements, so workers can't race past a limit; leases
+    expire after ADMISSION_LEASE_SECONDS so a crashed
+    worker cannot hold slots forever.
+
+    A reservation sums the key's leases and inserts a new one in the same
+    statement. SQLite runs writers one at a time, which makes that safe; on
+    PostgreSQL two READ COMMITTED transactions can both see the old sum, so
+    reservations for a key first take a transaction-scoped advisory lock on
+    it. Other databases aren't supported.
+    """
+    blocking = True
+
+    def __init__(self, lease_seconds: float = ADMISSION_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self._releases = 0
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        db = SessionLocal()
+        try:
+            if db.get(AdmissionBucket, key) is None:
+                try:
+                    db.add(AdmissionBucket(key=key, tokens=burst, updated_at=now))
+                    db.commit()
+                except Exception:
+                    db.rollback()  # another worker created it first
+            refilled = AdmissionBucket.tokens + (literal(now) - AdmissionBucket.updated_at) * rate
+            available = case((refilled > burst, literal(burst)), else_=refilled)
+            result = db.execute(
+                update(AdmissionBucket)
+                .where(AdmissionBucket.key == key, available >= 1)
+                .values(tokens=available - 1, updated_at=now)
+            )
+            db.commit()
+            if result.rowcount:
+                return 0
+            bucket = db.get(AdmissionBucket, key)
+            tokens = min(burst, bucket.tokens + (now - bucket.updated_at) * rate)
+            return max((1 - tokens) / rate, 0.001)
+        finally:
+            db.close()
+
+    def acquire(self, key: str, limit: int, amount: int = 1):
+        now = time.time()
+        in_use = (
+            select(func.coalesce(func.sum(AdmissionLease.amount), 0))
+            .where(AdmissionLease.key == key, AdmissionLease.expires_at > now)
+            .scalar_subquery()
+        )
+        db = SessionLocal()
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                db.execute(select(func.pg_advisory_xact_lock(func.hashtext(key))))
+            # Check and reserve in one statement so concurrent workers can't both fit
+            lease_id = db.execute(
+                insert(AdmissionLease).from_select(
+                    ["key", "amount", "expires_at"],
+                    select(literal(key), literal(amount), literal(now + self.lease_seconds))
+                    .where(in_use + amount <= limit)
+                ).returning(AdmissionLease.id)
+            ).scalar()
+            db.commit()
+            return lease_id
+        finally:
+            db.close()
+
+    def resize(self, lease, amount: int):
+        db = SessionLocal()
+        try:
+            db.execute(update(AdmissionLease).where(AdmissionLease.id == lease).values(amount=amount))
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, lease):
+        db = SessionLocal()
+        try:
+            db.execute(delete(AdmissionLease).where(AdmissionLease.id == lease))
+            self._releases += 1
+            if self._releases % 100 == 0:
+                db.execute(delete(AdmissionLease).where(AdmissionLease.expires_at <= time.time()))
+            db.commit()
+        finally:
+            db.close()
+
+
+def _create_store(kind: str):
+    if kind == "database":
+        return DatabaseStore()
+    if kind != "memory":
+        logger.warning(f"Unknown ADMISSION_STORE {kind!r}, using the in-process store")
+    return MemoryStore()
+
+
+store = _create_store(ADMISSION_STORE)
+
+
+def _claims(scope):
+    """Claims of the request's bearer token (header or ?token=) or signed link, or None."""
+    if scope["path"].startswith("/files/signed/"):
+        try:
+            link = verify_download(scope["path"].rsplit("/", 1)[1], check_file=False)
+        except InvalidSignedURL:
+            return None
+        return {"id": link["uid"], "client_id": link["cid"]}
+    authorization = Headers(scope=scope).get("authorization", "")
+    token = authorization[7:] if authorization.startswith("Bearer ") else QueryParams(scope["query_string"]).get("token")
+    if not token:
+        return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+
+def _too_many(detail: str, retry_after: float):
+    return JSONResponse(
+        {"detail": detail},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, store=None):
+        self.app = app
+        self.store = store
+
+    async def _call(self, method, *args):
+        current = self.store if self.store is not None else store
+        function = getattr(current, method)
+        if current.blocking:
+            return await run_in_threadpool(function, *args)
+        return function(*args)
+
+    async def _release(self, leases):
+        for lease in leases:
+            try:
+                await self._call("release", lease)
+            except Exception as e:
+                logger.error(f"Error releasing admission lease: {str(e)}")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            scope["method"] == method and pattern.match(scope["path"]) for method, pattern in CONTROLLED_ROUTES
+        ):
+            return await self.app(scope, receive, send)
+        claims = _claims(scope)
+        if claims is None or claims.get("id") is None:
+            # Unauthenticated: let the endpoint reject it
+            return await self.app(scope, receive, send)
+
+        user_key = f"user:{claims['id']}"
+        client_key = f"client:{claims['client_id']}" if claims.get("client_id") is not None else None
+
+        rates = [(user_key, USER_RATE_LIMIT, USER_RATE_BURST)]
+        if client_key:
+            rates.append((client_key, CLIENT_RATE_LIMIT, CLIENT_RATE_BURST))
+        for key, rate, burst in rates:
+            if rate <= 0:
+                continue
+            retry_after = await self._call("take", f"rate:{key}", rate, burst)
+            if retry_after:
+                logger.info(f"Rate limited {key} on {scope['path']}")
+                return await _too_many("Too many requests, slow down", retry_after)(scope, receive, send)
+
+        is_upload = scope["method"] == "POST"
+        size = Headers(scope=scope).get("content-length")
+        caps = [(f"transfers:{user_key}", USER_MAX_TRANSFERS, 1, "Too many concurrent transfers for this user")]
+        if client_key:
+            caps.append((f"transfers:{client_key}", CLIENT_MAX_TRANSFERS, 1, "Too many concurrent transfers for this client"))
+        if MAX_BYTES_IN_FLIGHT > 0:
+            # A download's size is only known from its response headers; until
+            # then it holds one byte, which still requires free budget
+            amount = min(int(size), MAX_BYTES_IN_FLIGHT) if is_upload and size and size.isdigit() else 1
+            caps.append((BYTES_KEY, MAX_BYTES_IN_FLIGHT, amount, "Server is busy with other transfers"))
+
+        leases = []
+        for key, limit, amount, detail in caps:
+            if limit <= 0:
+                continue
+            lease = await self._call("acquire", key, limit, amount)
+            if lease is None:
+                await self._release(leases)
+                logger.info(f"Admission rejected on {key} for {scope['path']}")
+                return await _too_many(detail, BUSY_RETRY_AFTER)(scope, receive, send)
+            leases.append(lease)
+
+        bytes_lease = leases[-1] if MAX_BYTES_IN_FLIGHT > 0 else None
+
+        async def send_with_size(message):
+            if message["type"] == "http.response.start" and not is_upload and bytes_lease is not None:
+                length = Headers(raw=message.get("headers", [])).get("content-length")
+                if length and length.isdigit():
+                    await self._call("resize", bytes_lease, int(length))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_size)
+        finally:
+            await self._release(leases)
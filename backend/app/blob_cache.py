@@ -0,0 +1,179 @@
+"""
+In-memory cache of hot file contents for downloads.
+
+Entries are keyed by the file's SHA-256, so a changed file can never be
+served from a stale entry and identical uploads share one. Only files up to
+BLOB_CACHE_MAX_FILE_BYTES are cached, within BLOB_CACHE_MAX_BYTES per worker.
+
+Eviction is W-TinyLFU, weighted by size: new entries go to a small LRU
+window; entries leaving the window only enter the main segmented LRU
+(probation, then protected on a second hit) if a count-min sketch says they
+are requested more often than the entries they would displace. The sketch
+is halved periodically so old popularity fades. This keeps the few files
+everyone downloads resident while one-off downloads pass through the window.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from .config import BLOB_CACHE_MAX_BYTES, BLOB_CACHE_MAX_FILE_BYTES
+
+logger = logging.getLogger(__name__)
+
+SKETCH_WIDTH = 4096  # counters per row; a power of two
+SKETCH_ROWS = 4
+MAX_COUNT = 15
+
+
+class FrequencySketch:
+    """Count-min sketch of request frequencies with periodic halving (aging)."""
+
+    def __init__(self, width: int = SKETCH_WIDTH):
+        self.mask = width - 1
+        self.rows = [bytearray(width) for _ in range(SKETCH_ROWS)]
+        self.sample_size = 10 * width
+        self.additions = 0
+
+    def _indexes(self, key: str):
+        # Keys are hex SHA-256 digests: disjoint slices are independent hashes
+        return [int(key[8 * row:8 * row + 8], 16) & self.mask for row in range(SKETCH_ROWS)]
+
+    def increment(self, key: str):
+        for row, index in zip(self.rows, self._indexes(key)):
+            if row[index] < MAX_COUNT:
+                row[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            for row in self.rows:
+                row[:] = bytes(count >> 1 for count in row)
+            self.additions //= 2
+
+    def frequency(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.rows, self._indexes(key)))
+
+
+class BlobCache:
+    def __init__(self, max_bytes: int, max_item_bytes: int):
+        self.max_bytes = max_bytes  # 0 disables the cache
+        self.max_item_bytes = min(max_item_bytes, max_bytes // 2)
+        self.window_capacity = max(max_bytes // 100, self.max_item_bytes)
+        self.main_capacity = max_bytes - self.window_capacity
+        self.protected_capacity = self.main_capacity * 4 // 5
+        self.sketch = FrequencySketch()
+        self.window, self.probation, self.protected = OrderedDict(), OrderedDict(), OrderedDict()
+        self.sizes = {"window": 0, "probation": 0, "protected": 0}
+        self.counters = {"hits": 0, "misses": 0, "bytes_saved": 0, "admitted": 0, "rejected": 0, "evicted": 0}
+        self._lock = threading.Lock()
+
+    def _segment(self, key: str):
+        for name in ("window", "probation", "protected"):
+            segment = getattr(self, name)
+            if key in segment:
+                return name, segment
+        return None, None
+
+    def get(self, key: Optional[str]) -> Optional[memoryview]:
+        """Contents for key (a SHA-256 hex digest) without copying, or None."""
+        if not self.max_bytes or not key:
+            return None
+        with self._lock:
+            self.sketch.increment(key)
+            name, segment = self._segment(key)
+            if segment is None:
+                self.counters["misses"] += 1
+                return None
+            data = segment[key]
+            if name == "probation":
+                # Second hit: promote, demoting the protected LRU entries it displaces
+                del self.probation[key]
+                self.sizes["probation"] -= len(data)
+                self.protected[key] = data
+                self.sizes["protected"] += len(data)
+                while self.sizes["protected"] > self.protected_capacity:
+                    demoted_key, demoted = self.protected.popitem(last=False)
+                    self.sizes["protected"] -= len(demoted)
+                    self.probation[demoted_key] = demoted
+                    self.sizes["probation"] += len(demoted)
+            else:
+                segment.move_to_end(key)
+            self.counters["hits"] += 1
+            self.counters["bytes_saved"] += len(data)
+            return memoryview(data)
+
+    def put(self, key: str, data: bytes):
+        if not self.max_bytes or len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            if self._segment(key)[1] is not None:
+                return
+            self.window[key] = data
+            self.sizes["window"] += len(data)
+            while self.sizes["window"] > self.window_capacity:
+                candidate_key, candidate = self.window.popitem(last=False)
+                self.sizes["window"] -= len(candidate)
+                self._admit(candidate_key, candidate)
+
+    def _admit(self, key: str, data: bytes):
+        """Move a window evictee into the main space if it is more popular than what it displaces."""
+        needed = self.sizes["probation"] + self.sizes["protected"] + len(data) - self.main_capacity
+        victims = []
+        for segment in (self.probation, self.protected):
+            for victim_key, victim in segment.items():
+                if needed <= 0:
+                    break
+                victims.append((segment, victim_key))
+                needed -= len(victim)
+        frequency = self.sketch.frequency(key)
+        if any(self.sketch.frequency(victim_key) >= frequency for _, victim_key in victims):
+            self.counters["rejected"] += 1
+            return
+        for segment, victim_key in victims:
+            victim = segment.pop(victim_key)
+            self.sizes["probation" if segment is self.probation else "protected"] -= len(victim)
+            self.counters["evicted"] += 1
+        self.probation[key] = data
+        self.sizes["probation"] += len(data)
+        self.counters["admitted"] += 1
+
+    def invalidate(self, key: Optional[str]):
+        with self._lock:
+            name, segment = self._segment(key)
+            if segment is not None:
+                self.sizes[name] -= len(segment.pop(key))
+
+    def load(self, path: str, key: Optional[str]) -> Optional[memoryview]:
+        """
+        Read a small enough file after a miss and offer it to the cache; None
+        for larger files (stream those instead). Contents that don't match key
+        are served but not cached.
+        """
+        if not self.max_bytes or not key:
+            return None
+        try:
+            if os.path.getsize(path) > self.max_item_bytes:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != key:
+            logger.warning(f"Contents of {path} don't match their recorded hash; not caching")
+        else:
+            self.put(key, data)
+        return memoryview(data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(
+                self.counters,
+                hit_rate=round(self.counters["hits"] / max(1, lookups), 3),
+                entries=len(self.window) + len(self.probation) + len(self.protected),
+                bytes=sum(self.sizes.values()),
+                max_bytes=self.max_bytes,
+            )
+
+
+blob_cache = BlobCache(BLOB_CACHE_MAX_BYTES, BLOB_CACHE_MAX_FILE_BYTES)
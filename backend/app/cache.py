@@ -0,0 +1,197 @@
+"""
+Result cache for read endpoints.
+
+Entries live in a bounded in-process LRU and expire after a TTL. An entry may
+depend on tags ("files", "client:3", "uploader:7", ...): writes bump the
+version of every tag they affect, and an entry computed under older tag
+versions counts as a miss. Tag versions are kept in a tag store:
+
+    memory    versions live in this process only (tests, single worker)
+    database  versions live in the cache_tags table, so an upload handled by
+              one worker invalidates what every other worker has cached
+
+Hit and miss counters are kept per key namespace (the part before the
+first ":") for GET /admin/cache/stats.
+"""
+import abc
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from sqlalchemy import select
+from sqlalchemy.dialects import sqlite, postgresql
+from .config import QUERY_CACHE_BACKEND, QUERY_CACHE_MAX_ENTRIES
+from .database import SessionLocal
+from .models import CacheTag
+
+logger = logging.getLogger(__name__)
+
+
+class TagStore(abc.ABC):
+    """Interface of a tag version store."""
+
+    @abc.abstractmethod
+    def versions(self, tags) -> tuple:
+        """Current version of each tag, in order (0 for tags never bumped)."""
+
+    @abc.abstractmethod
+    def bump(self, tags):
+        """Move every tag to a new version."""
+
+
+class MemoryTagStore(TagStore):
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def versions(self, tags) -> tuple:
+        with self._lock:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class DatabaseTagStore(TagStore):
+    """One primary-key lookup per cache hit; one upsert per tag on writes."""
+
+    def versions(self, tags) -> tuple:
+        db = SessionLocal()
+        try:
+            found = dict(db.execute(select(CacheTag.tag, CacheTag.version).where(CacheTag.tag.in_(tags))).all())
+        finally:
+            db.close()
+        return tuple(found.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        db = SessionLocal()
+        try:
+            dialect = db.get_bind().dialect.name
+            for tag in sorted(set(tags)):
+                if dialect in ("sqlite", "postgresql"):
+                    insert = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(CacheTag)
+                    db.execute(insert.values(tag=tag, version=1).on_conflict_do_update(
+                        index_elements=["tag"], set_={"version": CacheTag.version + 1}
+                    ))
+                    continue
+                updated = db.execute(
+                    CacheTag.__table__.update().where(CacheTag.tag == tag).values(version=CacheTag.version + 1)
+                )
+                if updated.rowcount == 0:
+                    db.add(CacheTag(tag=tag, version=1))
+            db.commit()
+        finally:
+            db.close()
+
+
+class ResultCache:
+    def __init__(self, tag_store: TagStore, max_entries: int):
+        self.tag_store = tag_store
+        self.max_entries = max_entries  # 0 disables caching
+        self._entries = OrderedDict()  # key -> (expires_at, tags, versions, value)
+        self._generation = 0
+        self._evictions = 0
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+        _, tags, versions, value = entry
+        if tags and self.tag_store.versions(tags) != versions:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return value
+
+    def _count(self, key: str, outcome: str):
+        with self._lock:
+            self._stats[key.split(":", 1)[0]][outcome] += 1
+
+    def get_or_compute(self, key: str, ttl: float, compute, tags=()):
+        """
+        Return the cached value for key, computing and storing it if missing.
+        The value is dropped as soon as any of tags is invalidated.
+        """
+        value = self.get(key)
+        if value is not None:
+            self._count(key, "hits")
+            return value
+        self._count(key, "misses")
+        tags = tuple(tags)
+        # Read the versions first: a write during compute() then leaves the entry stale, not wrong
+        versions = self.tag_store.versions(tags) if tags else ()
+        with self._lock:
+            generation = self._generation
+        value = compute()
+        if not self.max_entries:
+            return value
+        with self._lock:
+            # Don't store a value computed before an invalidation that happened meanwhile
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + ttl, tags, versions, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._evictions += 1
+        return value
+
+    def invalidate(self, prefix: str = ""):
+        """Drop every entry of this process whose key starts with prefix (all entries by default)."""
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def invalidate_tags(self, tags):
+        """Invalidate every entry depending on any of tags, in all workers sharing the tag store."""
+        tags = sorted(set(tags))
+        if not tags:
+            return
+        try:
+            self.tag_store.bump(tags)
+        except Exception as e:
+            # Without the bump other workers could serve stale results: drop what we can
+            logger.error(f"Error invalidating cache tags {tags}: {str(e)}")
+            self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = {
+                name: dict(counts, hit_rate=round(counts["hits"] / max(1, counts["hits"] + counts["misses"]), 3))
+                for name, counts in sorted(self._stats.items())
+            }
+            return {
+                "backend": type(self.tag_store).__name__,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+                "namespaces": namespaces,
+            }
+
+
+def _create_tag_store(kind: str) -> TagStore:
+    if kind == "database":
+        return DatabaseTagStore()
+    if kind != "memory":
+        logger.warning(f"Unknown QUERY_CACHE_BACKEND {kind!r}, using the in-process tag store")
+    return MemoryTagStore()
+
+
+cache = ResultCache(_create_tag_store(QUERY_CACHE_BACKEND), QUERY_CACHE_MAX_ENTRIES)
+
+
+def set_tag_store(store: TagStore):
+    """Swap the tag store, e.g. for a MemoryTagStore in tests."""
+    cache.tag_store = store
@@ -0,0 +1,119 @@
+"""
+Optional columnar cache of converted sheets for fast exports.
+
+When pyarrow is installed, a sheet that has been exported once is converted
+in the background to an Arrow IPC file (row number + JSON-encoded values per
+row, in record batches). Later exports memory-map it and skip straight to the
+batches covering the requested rows instead of re-parsing the workbook. The
+cache key includes the source file's size and mtime, so a changed file is
+never served from a stale conversion.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from .config import UPLOAD_DIR, COLUMNAR_CACHE_ENABLED
+from .workbook import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # optional: exports then always stream from the workbook
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(UPLOAD_DIR, ".columnar")
+BATCH_ROWS = 10_000
+
+_executor = None
+_pending = set()
+
+
+def enabled() -> bool:
+    return COLUMNAR_CACHE_ENABLED and pa is not None
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+def cache_path(file_id: int, path: str, sheet: str) -> str:
+    stat = os.stat(path)
+    key = hashlib.sha256(f"{sheet}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()[:32]
+    return os.path.join(CACHE_DIR, str(file_id), f"{key}.arrow")
+
+
+def convert(file_id: int, path: str, sheet: str):
+    """Write the sheet's Arrow file; written to a temporary name and renamed when complete."""
+    target = cache_path(file_id, path, sheet)
+    partial = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    schema = pa.schema([("row", pa.int64()), ("values", pa.large_string())])
+    try:
+        with Workbook(path) as book, pa.OSFile(partial, "wb") as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                numbers, values = [], []
+                for row_number, row in book.iter_rows(sheet):
+                    numbers.append(row_number)
+                    values.append(json.dumps(row, default=_json_default))
+                    if len(numbers) >= BATCH_ROWS:
+                        writer.write_batch(pa.record_batch([numbers, values], schema=schema))
+                        numbers, values = [], []
+                if numbers:
+                    writer.write_batch(pa.record_batch([numbers, values], schema=schema))
+        os.replace(partial, target)
+        logger.info(f"Columnar cache written for file {file_id} sheet {sheet!r}")
+    except Exception as e:
+        logger.error(f"Error converting file {file_id} sheet {sheet!r}: {str(e)}")
+        if os.path.exists(partial):
+            os.remove(partial)
+    finally:
+        _pending.discard((file_id, sheet))
+
+
+def schedule_conversion(file_id: int, path: str, sheet: str):
+    global _executor
+    if not enabled() or (file_id, sheet) in _pending:
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="columnar")
+    _pending.add((file_id, sheet))
+    _executor.submit(convert, file_id, path, sheet)
+
+
+def cached_rows(file_id: int, path: str, sheet: str, start: int, end):
+    """
+    (row_number, values) of rows start..end (end None = open) from the cache,
+    or None when there is no conversion for this version of the file.
+    """
+    if not enabled():
+        return None
+    target = cache_path(file_id, path, sheet)
+    if not os.path.exists(target):
+        return None
+
+    def rows():
+        with pa.memory_map(target) as source:
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                batch = reader.get_batch(index)
+                numbers = batch.column(0)
+                if batch.num_rows == 0 or numbers[batch.num_rows - 1].as_py() < start:
+                    continue
+                for number, values in zip(numbers.to_pylist(), batch.column(1).to_pylist()):
+                    if number < start:
+                        continue
+                    if end is not None and number > end:
+                        return
+                    yield number, json.loads(values)
+
+    return rows()
+
+
+def remove_files(file_ids):
+    """Drop the conversions of deleted files."""
+    for file_id in file_ids:
+        shutil.rmtree(os.path.join(CACHE_DIR, str(file_id)), ignore_errors=True)
@@ -3,10 +3,10 @@ from pathlib import Path
 
 # Directory paths
 BASE_DIR = Path(__file__).parent.parent
-UPLOAD_DIR = BASE_DIR / "storage"
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(BASE_DIR / "storage")))
 
 # Ensure storage directory exists
-UPLOAD_DIR.mkdir(exist_ok=True)
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # JWT Configuration
 SECRET_KEY = "mysupersecretkey"
@@ -14,4 +14,101 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Database Configuration
-DATABASE_URL = "sqlite:///" + str(BASE_DIR / "app.db")
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///" + str(BASE_DIR / "app.db"))
+
+# Tenant sharding: clients split off with scripts/split_tenants.py keep their
+# files, logs and usage in their own database under SHARD_DIR (see app/sharding.py)
+SHARDING_ENABLED = os.getenv("SHARDING_ENABLED", "false").lower() == "true"
+SHARD_DIR = Path(os.getenv("SHARD_DIR", str(BASE_DIR / "shards")))
+
+# Server
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))  # 0 = derive from CPU count
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+# Uploads
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", "4"))  # files written to storage at once
+BOOTSTRAP_CONCURRENCY = int(os.getenv("BOOTSTRAP_CONCURRENCY", "4"))  # dashboard sub-queries run at once
+DEFAULT_CLIENT_QUOTA_BYTES = int(os.getenv("DEFAULT_CLIENT_QUOTA_BYTES", "0"))  # 0 = unlimited
+# Default block size of the signatures delta uploads are computed against (see app/versions.py)
+DELTA_BLOCK_SIZE = int(os.getenv("DELTA_BLOCK_SIZE", str(64 * 1024)))
+
+# Signed download links (POST /files/download-links)
+DOWNLOAD_SIGNING_KEY = os.getenv("DOWNLOAD_SIGNING_KEY", SECRET_KEY + ":downloads")
+DOWNLOAD_URL_TTL = int(os.getenv("DOWNLOAD_URL_TTL", "300"))  # seconds
+DOWNLOAD_URL_MAX_TTL = int(os.getenv("DOWNLOAD_URL_MAX_TTL", "3600"))
+
+# "nginx" hands file bytes to the reverse proxy via X-Accel-Redirect instead
+# of streaming them from Python; OFFLOAD_PREFIX must match its internal location.
+DOWNLOAD_OFFLOAD = os.getenv("DOWNLOAD_OFFLOAD", "none")
+OFFLOAD_PREFIX = os.getenv("OFFLOAD_PREFIX", "/protected-storage/")
+
+# In-memory cache of hot file contents for downloads, per worker; 0 disables it
+BLOB_CACHE_MAX_BYTES = int(os.getenv("BLOB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+BLOB_CACHE_MAX_FILE_BYTES = int(os.getenv("BLOB_CACHE_MAX_FILE_BYTES", str(4 * 1024 * 1024)))
+
+# Sheet exports: cache converted sheets as Arrow files (requires pyarrow)
+COLUMNAR_CACHE_ENABLED = os.getenv("COLUMNAR_CACHE_ENABLED", "true").lower() == "true"
+
+# Consolidated datasets across a client's files (GET /files/consolidate)
+CONSOLIDATE_WORKERS = int(os.getenv("CONSOLIDATE_WORKERS", "2"))  # parser processes
+CONSOLIDATE_MAX_FILES = int(os.getenv("CONSOLIDATE_MAX_FILES", "200"))
+CONSOLIDATE_CACHE_FILES = int(os.getenv("CONSOLIDATE_CACHE_FILES", "50"))  # merged outputs kept on disk
+
+# Storage lifecycle (see app/lifecycle.py): days after a file's end_date at
+# which it moves to the cold tier or is deleted, for clients without their own
+# rules; 0 = never. Cold blobs are zstd-compressed when zstandard is installed.
+COLD_STORAGE_DIR = Path(os.getenv("COLD_STORAGE_DIR", str(UPLOAD_DIR / "cold")))
+LIFECYCLE_COLD_AFTER_DAYS = int(os.getenv("LIFECYCLE_COLD_AFTER_DAYS", "0"))
+LIFECYCLE_PURGE_AFTER_DAYS = int(os.getenv("LIFECYCLE_PURGE_AFTER_DAYS", "0"))
+LIFECYCLE_INTERVAL = float(os.getenv("LIFECYCLE_INTERVAL", "0"))  # seconds between runs in the API; 0 = script only
+LIFECYCLE_BATCH_SIZE = int(os.getenv("LIFECYCLE_BATCH_SIZE", "100"))  # files per transaction
+LIFECYCLE_ZSTD_LEVEL = int(os.getenv("LIFECYCLE_ZSTD_LEVEL", "19"))
+LIFECYCLE_THAW_CACHE_FILES = int(os.getenv("LIFECYCLE_THAW_CACHE_FILES", "20"))  # decompressed copies for parsing
+
+# Admin dashboard overview cache (seconds); uploads and deletes also invalidate it
+OVERVIEW_CACHE_TTL = float(os.getenv("OVERVIEW_CACHE_TTL", "30"))
+
+# Result cache of listing/search endpoints. Uploads and deletes invalidate
+# exactly the affected entries; "database" shares those invalidations between
+# workers, "memory" only reaches the worker that handled the write.
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "database")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000"))  # per worker; 0 disables
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+
+# File change events (GET /events/files). "memory" only reaches subscribers of
+# the same worker; use "database" when running several workers.
+EVENT_BROKER = os.getenv("EVENT_BROKER", "memory")
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))  # events kept for resuming clients
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "1"))  # seconds, database broker
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+
+# Admission control for uploads/downloads; a limit of 0 disables that check.
+# "memory" limits each worker separately; "database" shares them.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", "memory")
+USER_RATE_LIMIT = float(os.getenv("USER_RATE_LIMIT", "5"))  # transfers per second
+USER_RATE_BURST = float(os.getenv("USER_RATE_BURST", "20"))
+CLIENT_RATE_LIMIT = float(os.getenv("CLIENT_RATE_LIMIT", "20"))
+CLIENT_RATE_BURST = float(os.getenv("CLIENT_RATE_BURST", "50"))
+USER_MAX_TRANSFERS = int(os.getenv("USER_MAX_TRANSFERS", "4"))
+CLIENT_MAX_TRANSFERS = int(os.getenv("CLIENT_MAX_TRANSFERS", "16"))
+MAX_BYTES_IN_FLIGHT = int(os.getenv("MAX_BYTES_IN_FLIGHT", str(1024 * 1024 * 1024)))
+ADMISSION_LEASE_SECONDS = float(os.getenv("ADMISSION_LEASE_SECONDS", "600"))  # crash safety, database store
+
+# Content validation of uploads (first sheet; comma-separated column names,
+# numeric columns may carry bounds as "Amount:0:" or "Quantity:1:1000")
+VALIDATION_ENABLED = os.getenv("VALIDATION_ENABLED", "true").lower() == "true"
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", "1"))
+VALIDATION_REQUIRED_COLUMNS = os.getenv("VALIDATION_REQUIRED_COLUMNS", "")
+VALIDATION_DATE_COLUMNS = os.getenv("VALIDATION_DATE_COLUMNS", "Date")
+VALIDATION_NUMERIC_COLUMNS = os.getenv("VALIDATION_NUMERIC_COLUMNS", "")
+
+# Spreadsheet cell content index
+CELL_INDEX_ENABLED = os.getenv("CELL_INDEX_ENABLED", "true").lower() == "true"
+CELL_INDEX_WORKERS = int(os.getenv("CELL_INDEX_WORKERS", "1"))
+
+# Profiling (disabled by default; adds no middleware or engine listeners when off)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
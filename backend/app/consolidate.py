@@ -0,0 +1,232 @@
+"""
+Consolidated dataset across several workbooks.
+
+The first row of each file's sheet is its header. Columns are aligned by
+header name (in order of first appearance), rows identical after alignment
+are emitted once, and the result streams as CSV or NDJSON.
+
+Workbooks are parsed in parallel on a process pool; each worker spills its
+rows to a temporary pickle file that the request then reads back in file
+order, so no worker result has to fit in memory. Finished outputs are cached
+on disk under a key derived from the content hashes of the files involved.
+"""
+import csv
+import datetime
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from .config import UPLOAD_DIR, CONSOLIDATE_WORKERS, CONSOLIDATE_CACHE_FILES
+from .workbook import Workbook, WorkbookError
+from .storage import thaw_to
+from .process import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(UPLOAD_DIR, ".consolidated")
+SPILL_BATCH = 1000
+CHUNK_SIZE = 64 * 1024
+
+_pool = WorkerPool("consolidation", CONSOLIDATE_WORKERS)
+
+
+def _cell(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _header(values) -> list:
+    return [str(value).strip() if value is not None else f"column_{index + 1}" for index, value in enumerate(values)]
+
+
+def read_header(path: str, sheet=None) -> list:
+    """Header row of the sheet (first sheet by default); raises WorkbookError."""
+    with Workbook(path) as book:
+        for _, values in book.iter_rows(sheet):
+            return _header(values)
+    return []
+
+
+def parse_to_spill(path: str, sheet, spill_path: str) -> int:
+    """Process pool task: pickle the data rows of a sheet to spill_path in batches."""
+    count = 0
+    with Workbook(path) as book, open(spill_path, "wb") as spill:
+        rows = book.iter_rows(sheet)
+        next(rows, None)  # header
+        batch = []
+        for _, values in rows:
+            if all(value is None for value in values):
+                continue
+            batch.append([_cell(value) for value in values])
+            if len(batch) >= SPILL_BATCH:
+                pickle.dump(batch, spill, protocol=pickle.HIGHEST_PROTOCOL)
+                count += len(batch)
+                batch = []
+        if batch:
+            pickle.dump(batch, spill, protocol=pickle.HIGHEST_PROTOCOL)
+            count += len(batch)
+    return count
+
+
+def _read_spill(spill_path: str):
+    with open(spill_path, "rb") as spill:
+        while True:
+            try:
+                yield from pickle.load(spill)
+            except EOFError:
+                return
+
+
+def stop_pool():
+    _pool.shutdown()
+
+
+def cache_key(hashes, sheet, fmt: str) -> str:
+    material = json.dumps({"files": sorted(hashes), "sheet": sheet, "format": fmt})
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def cached_path(key: str, fmt: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.{fmt}")
+
+
+def cached_skipped(key: str, fmt: str) -> list:
+    """Paths skipped when the cached output under key was built."""
+    try:
+        with open(f"{cached_path(key, fmt)}.skipped") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _prune_cache():
+    outputs = glob.glob(os.path.join(CACHE_DIR, "*.csv")) + glob.glob(os.path.join(CACHE_DIR, "*.ndjson"))
+    outputs.sort(key=os.path.getmtime, reverse=True)
+    for stale in outputs[CONSOLIDATE_CACHE_FILES:]:
+        for path in (stale, f"{stale}.skipped"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _merged_rows(sources, columns, spills, failed):
+    """Aligned, deduplicated rows in file order as each file's parse completes."""
+    position = {name: index for index, name in enumerate(columns)}
+    seen = set()
+    for (header, path, stored_path), (future, spill_path) in zip(sources, spills):
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Error parsing {path} for consolidation: {str(e)}")
+            failed.append(stored_path)
+            continue
+        mapping = [position[name] for name in header]
+        for values in _read_spill(spill_path):
+            row = [None] * len(columns)
+            for index, value in enumerate(values[:len(mapping)]):
+                row[mapping[index]] = value
+            # The row itself, not its hash: rows whose hashes collide are still different
+            key = tuple(row)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield row
+
+
+def _csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(columns, rows):
+    lines, size = [], 0
+    for row in rows:
+        line = json.dumps(dict(zip(columns, row)), default=str)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines, size = [], 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def consolidate(files, sheet, fmt: str, key: str):
+    """
+    Stream the merged output of the stored files (rows with path, filename
+    and compression) while writing it to the cache under key. Returns
+    (chunks, skipped paths). Compressed cold-tier files are decompressed
+    into this run's own directory rather than the shared thaw cache, which
+    could prune them before the pool gets to them. Files that cannot be
+    opened are skipped up front; the key covers their content, so the
+    output is still cached. A failure while parsing leaves it uncached.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    spill_dir = tempfile.mkdtemp(prefix="spill-", dir=CACHE_DIR)
+    sources, skipped = [], []
+    try:
+        for index, file in enumerate(files):
+            try:
+                path = file.path
+                if file.compression:
+                    extension = os.path.splitext(file.filename or "")[1].lower()
+                    path = thaw_to(file, os.path.join(spill_dir, f"{index}{extension}"))
+                sources.append((read_header(path, sheet), path, file.path))
+            except (WorkbookError, OSError, RuntimeError) as e:  # RuntimeError: zstandard missing
+                logger.warning(f"Skipping {file.path} in consolidation: {str(e)}")
+                skipped.append(file.path)
+    except BaseException:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        raise
+
+    columns = []
+    for header, _, _ in sources:
+        columns.extend(name for name in header if name not in columns)
+
+    spills = []
+    for index, (_, path, _) in enumerate(sources):
+        spill_path = os.path.join(spill_dir, f"{index}.pickle")
+        spills.append((_pool.submit(parse_to_spill, path, sheet, spill_path), spill_path))
+
+    def chunks():
+        target = cached_path(key, fmt)
+        partial = f"{target}.{os.getpid()}.partial"
+        complete = False
+        failed = []
+        try:
+            with open(partial, "w", encoding="utf-8", newline="") as cache_file:
+                formatter = _csv_chunks if fmt == "csv" else _ndjson_chunks
+                for chunk in formatter(columns, _merged_rows(sources, columns, spills, failed)):
+                    cache_file.write(chunk)
+                    yield chunk
+            if not failed:
+                if skipped:
+                    with open(f"{target}.skipped", "w") as f:
+                        json.dump(skipped, f)
+                os.replace(partial, target)
+                complete = True
+                _prune_cache()
+        finally:
+            for future, _ in spills:
+                future.cancel()
+            if not complete and os.path.exists(partial):
+                os.remove(partial)
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return chunks(), skipped
@@ -0,0 +1,138 @@
+"""
+Inverted index over spreadsheet cell contents.
+
+Every non-empty cell is split into lowercase terms and each term gets a
+posting (term, file, sheet, cell) in the cell_postings table. Uploaded files
+are indexed off the request path by a small thread pool; deleting a file
+removes its postings in the same transaction.
+"""
+import datetime
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import delete, insert, select, func
+from .database import IN_BATCH_SIZE
+from .sharding import session_for_file
+from .models import CellPosting, CellIndexStatus, FileMeta
+from .workbook import Workbook, cell_ref
+from .storage import readable_path
+from .config import CELL_INDEX_ENABLED, CELL_INDEX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+TERM_PATTERN = re.compile(r"[^\W_]+")
+MAX_TERM_LENGTH = 64
+BATCH_SIZE = 5000
+
+_executor = None
+
+
+def terms(value) -> set:
+    """Lowercase word/number terms of a cell value or query."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    return {term for term in TERM_PATTERN.findall(str(value).lower()) if len(term) <= MAX_TERM_LENGTH}
+
+
+def index_file(file_id: int):
+    """(Re)build the postings of one file, committing in batches."""
+    db = session_for_file(file_id)
+    try:
+        file_meta = db.get(FileMeta, file_id)
+        if not file_meta or not file_meta.path:
+            return
+        db.execute(delete(CellPosting).where(CellPosting.file_id == file_id))
+        db.commit()
+
+        cells, batch = 0, []
+        status, error = "indexed", None
+        try:
+            with Workbook(readable_path(file_meta)) as book:
+                for sheet in book.sheet_names():
+                    for row_number, values in book.iter_rows(sheet):
+                        for column, value in enumerate(values):
+                            if value is None:
+                                continue
+                            cell_terms = terms(value)
+                            if not cell_terms:
+                                continue
+                            cells += 1
+                            ref = cell_ref(row_number, column)
+                            batch.extend(
+                                {"term": term, "file_id": file_id, "sheet": sheet, "cell": ref}
+                                for term in cell_terms
+                            )
+                            if len(batch) >= BATCH_SIZE:
+                                db.execute(insert(CellPosting), batch)
+                                db.commit()
+                                batch = []
+            if batch:
+                db.execute(insert(CellPosting), batch)
+        except Exception as e:
+            logger.error(f"Error indexing cells of file {file_id}: {str(e)}")
+            db.rollback()
+            db.execute(delete(CellPosting).where(CellPosting.file_id == file_id))
+            status, error = "failed", str(e)
+
+        # The file may have been deleted while we were reading it
+        if db.execute(select(FileMeta.id).where(FileMeta.id == file_id)).first() is None:
+            db.execute(delete(CellPosting).where(CellPosting.file_id == file_id))
+        else:
+            db.merge(CellIndexStatus(file_id=file_id, status=status, cells=cells, error=error,
+                                     indexed_at=datetime.datetime.utcnow()))
+        db.commit()
+        logger.info(f"Cell index for file {file_id}: {status}, {cells} cells")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error indexing cells of file {file_id}: {str(e)}")
+    finally:
+        db.close()
+
+
+def schedule_indexing(file_ids):
+    """
+    Index the given files in the background. Never raises: the files are
+    already stored, and unindexed ones can be picked up by scripts/index_cells.py.
+    """
+    global _executor
+    if not CELL_INDEX_ENABLED:
+        return
+    try:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CELL_INDEX_WORKERS, thread_name_prefix="cell-index")
+        for file_id in file_ids:
+            _executor.submit(index_file, file_id)
+    except Exception as e:
+        logger.error(f"Error scheduling cell indexing: {str(e)}")
+
+
+def stop_indexing():
+    """Drop queued indexing work; unindexed files can be picked up by scripts/index_cells.py."""
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def remove_files(db, file_ids):
+    """Delete the postings of files being deleted (caller commits)."""
+    file_ids = list(file_ids)
+    for i in range(0, len(file_ids), IN_BATCH_SIZE):
+        batch = file_ids[i:i + IN_BATCH_SIZE]
+        db.execute(delete(CellPosting).where(CellPosting.file_id.in_(batch)))
+        db.execute(delete(CellIndexStatus).where(CellIndexStatus.file_id.in_(batch)))
+
+
+def search_cells(db, q: str, filters, limit: int):
+    """Cells containing every term of q, as (file_id, filename, sheet, cell) rows."""
+    query_terms = sorted(terms(q))
+    if not query_terms:
+        return []
+    query = (
+        select(CellPosting.file_id, FileMeta.filename, CellPosting.sheet, CellPosting.cell)
+        .join(FileMeta, FileMeta.id == CellPosting.file_id)
+        .where(CellPosting.term.in_(query_terms), *filters)
+        .group_by(CellPosting.file_id, FileMeta.filename, CellPosting.sheet, CellPosting.cell)
+        .having(func.count(CellPosting.term.distinct()) == len(query_terms))
+        .order_by(CellPosting.file_id.desc())
+        .limit(limit)
+    )
+    return db.execute(query).all()
@@ -1,15 +1,29 @@
+from fastapi import Request
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .config import DATABASE_URL, SHARDING_ENABLED
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./app.db"
+SQLALCHEMY_DATABASE_URL = DATABASE_URL
+# Values per IN (...) list; keeps statements under SQLite's bound-parameter limit
+IN_BATCH_SIZE = 900
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-def get_db():
+def session_for_request(request: Request):
+    """A new session routed like the request's own (see get_db); the caller closes it."""
     db = SessionLocal()
+    if SHARDING_ENABLED:
+        # Imported here: app.sharding builds on this module
+        from .sharding import route_request
+        route_request(db, request)
+    return db
+
+def get_db(request: Request):
+    db = session_for_request(request)
     try:
         yield db
     finally:
@@ -0,0 +1,73 @@
+"""
+Responses that send a stored file to the client.
+
+With DOWNLOAD_OFFLOAD=nginx the backend only answers with an
+X-Accel-Redirect header naming the file under OFFLOAD_PREFIX; nginx then
+serves the bytes itself with sendfile from its internal storage location (see
+frontend/nginx.conf). Otherwise small hot files are answered from the
+in-memory blob cache (app/blob_cache.py) and the rest is streamed by the app.
+Compressed cold-tier blobs (app/lifecycle.py) are always decompressed and
+streamed by the app.
+"""
+import os
+from typing import Optional
+from urllib.parse import quote
+from fastapi import Response
+from fastapi.responses import FileResponse, StreamingResponse
+from .config import UPLOAD_DIR, DOWNLOAD_OFFLOAD, OFFLOAD_PREFIX
+from .blob_cache import blob_cache
+from .storage import iter_blob
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+def cached_content(sha256: Optional[str]) -> Optional[memoryview]:
+    """Contents of a hot file from memory, or None (always None when nginx sends the bytes)."""
+    if DOWNLOAD_OFFLOAD == "nginx":
+        return None
+    return blob_cache.get(sha256)
+
+
+def file_response(
+    path: str,
+    filename: str,
+    media_type: str = XLSX_MEDIA_TYPE,
+    sha256: Optional[str] = None,
+    content: Optional[memoryview] = None,
+    compression: Optional[str] = None
+) -> Response:
+    """
+    Send a stored file. content is what cached_content() returned for sha256;
+    on a miss, files small enough for the blob cache are read and offered to it.
+    A blob stored with compression is decompressed while it is sent.
+    """
+    if compression and content is None:
+        headers = {"Content-Disposition": content_disposition(filename)}
+        if sha256:
+            headers["ETag"] = f'"{sha256}"'
+        return StreamingResponse(iter_blob(path, compression), media_type=media_type, headers=headers)
+    if DOWNLOAD_OFFLOAD == "nginx":
+        relative = os.path.relpath(os.path.realpath(path), os.path.realpath(UPLOAD_DIR))
+        if not relative.startswith(".."):
+            return Response(
+                media_type=media_type,
+                headers={
+                    "X-Accel-Redirect": OFFLOAD_PREFIX + quote(relative.replace(os.sep, "/")),
+                    "Content-Disposition": content_disposition(filename),
+                }
+            )
+    if content is None:
+        content = blob_cache.load(path, sha256)
+    if content is not None:
+        headers = {"Content-Disposition": content_disposition(filename)}
+        if sha256:
+            headers["ETag"] = f'"{sha256}"'
+        return Response(content=content, media_type=media_type, headers=headers)
+    return FileResponse(path, filename=filename, media_type=media_type)
@@ -0,0 +1,273 @@
+"""
+File change events for live dashboards.
+
+Uploads and deletes publish events to a broker; GET /events/files streams
+them to subscribers as server-sent events. Every event gets an increasing id
+and brokers keep the last EVENT_BUFFER_SIZE events, so a reconnecting client
+resumes from its Last-Event-ID instead of reloading everything.
+
+Brokers:
+    InProcessBroker  in-memory ring buffer; only reaches subscribers of the
+                     same process. The default, and the stand-in for tests.
+    DatabaseBroker   events are written to the shared events table and every
+                     process polls it into its own ring buffer, so subscribers
+                     on any worker see every event.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+from sqlalchemy import select, delete, insert, func
+from .database import SessionLocal
+from .models import Event
+from .config import EVENT_BROKER, EVENT_BUFFER_SIZE, EVENT_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+GAP_TIMEOUT = 5.0  # seconds the database broker waits for an id to commit before skipping it
+GAP_RECHECK = 0.1  # seconds between polls while it waits
+
+
+class Broker:
+    """Interface of an event broker."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, events):
+        """Publish event dicts (type plus payload); ids are assigned by the broker."""
+        raise NotImplementedError
+
+    def latest_id(self) -> int:
+        raise NotImplementedError
+
+    async def wait(self, after_id: int, timeout: float) -> Optional[list]:
+        """
+        Events with an id above after_id, waiting up to timeout seconds for
+        one to arrive (an empty list on timeout). None means events after
+        after_id are no longer retained and the client must reload.
+        """
+        raise NotImplementedError
+
+
+class InProcessBroker(Broker):
+    def __init__(self, size: int = EVENT_BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._floor = 0  # events up to this id are not retained
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._waiters = set()  # (loop, asyncio.Event) of subscribers waiting for events
+
+    def publish(self, events):
+        with self._lock:
+            numbered = []
+            for event in events:
+                self._last_id += 1
+                numbered.append(dict(event, id=self._last_id))
+        self._append(numbered)
+
+    def _append(self, events):
+        if not events:
+            return
+        with self._lock:
+            for event in events:
+                if len(self._events) == self._events.maxlen:
+                    self._floor = self._events[0]["id"]
+                self._events.append(event)
+                self._last_id = max(self._last_id, event["id"])
+            waiters = list(self._waiters)
+        for loop, flag in waiters:
+            try:
+                loop.call_soon_threadsafe(flag.set)
+            except RuntimeError:  # loop already closed
+                pass
+
+    def latest_id(self) -> int:
+        with self._lock:
+            return self._last_id
+
+    def _since(self, after_id: int):
+        with self._lock:
+            # after_id beyond the last id: the client saw ids from before a restart
+            if after_id < self._floor or after_id > self._last_id:
+                return None
+            return [event for event in self._events if event["id"] > after_id]
+
+    async def wait(self, after_id: int, timeout: float):
+        flag = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), flag)
+        # Register before checking so an event published in between still wakes us
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            events = self._since(after_id)
+            if events is None or events:
+                return events
+            try:
+                await asyncio.wait_for(flag.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            return self._since(after_id)
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+class DatabaseBroker(InProcessBroker):
+    """
+    Shares events between processes through the events table. Ids come from
+    the database. SQLite serializes commits, so they become visible in id
+    order; elsewhere a smaller id can commit after a bigger one, so the poller
+    holds back events behind a missing id until it shows up or GAP_TIMEOUT
+    passes (the id of a rolled back insert is never filled).
+    """
+
+    def __init__(self, size: int = EVENT_BUFFER_SIZE, poll_interval: float = EVENT_POLL_INTERVAL):
+        super().__init__(size)
+        self._size = size
+        self._poll_interval = poll_interval
+        self._poke = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._gap = None  # (first missing id, monotonic time it was noticed)
+
+    def start(self):
+        db = SessionLocal()
+        try:
+            rows = db.execute(select(Event).order_by(Event.id.desc()).limit(self._size)).scalars().all()
+            latest = rows[0].id if rows else 0
+        finally:
+            db.close()
+        with self._lock:
+            self._last_id = latest
+            self._floor = rows[-1].id - 1 if rows else latest
+        self._append([self._to_event(row) for row in reversed(rows)])
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._poll, name="event-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._poke.set()
+
+    def publish(self, events):
+        rows = [{"type": event["type"], "data": json.dumps(event["data"], default=str),
+                 "created_at": datetime.datetime.utcnow()} for event in events]
+        if not rows:
+            return
+        db = SessionLocal()
+        try:
+            db.execute(insert(Event), rows)
+            db.commit()
+        finally:
+            db.close()
+        self._poke.set()
+
+    @staticmethod
+    def _to_event(row):
+        return {"id": row.id, "type": row.type, "data": json.loads(row.data)}
+
+    def _deliverable(self, rows):
+        """The rows that can be handed out in order: up to the first missing id still in its grace period."""
+        expected = self.latest_id() + 1
+        ready = []
+        for row in rows:
+            if row.id > expected:
+                if self._gap is None or self._gap[0] != expected:
+                    self._gap = (expected, time.monotonic())
+                if time.monotonic() - self._gap[1] < GAP_TIMEOUT:
+                    break
+                logger.warning(f"Events {expected} to {row.id - 1} never committed, skipping them")
+            ready.append(row)
+            expected = row.id + 1
+        if self._gap is not None and self._gap[0] < expected:
+            self._gap = None
+        return ready
+
+    def _poll(self):
+        polls = 0
+        while not self._stopped.is_set():
+            # Look again soon while events wait behind a missing id
+            self._poke.wait(min(self._poll_interval, GAP_RECHECK) if self._gap else self._poll_interval)
+            self._poke.clear()
+            db = SessionLocal()
+            try:
+                rows = db.execute(
+                    select(Event).where(Event.id > self.latest_id()).order_by(Event.id)
+                ).scalars().all()
+                self._append([self._to_event(row) for row in self._deliverable(rows)])
+                polls += 1
+                if polls % 60 == 0:
+                    # Keep the table about as long as the buffers
+                    newest = db.execute(select(func.max(Event.id))).scalar() or 0
+                    db.execute(delete(Event).where(Event.id <= newest - self._size))
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error polling events: {str(e)}")
+            finally:
+                db.close()
+
+
+def _create_broker(kind: str) -> Broker:
+    if kind == "database":
+        return DatabaseBroker()
+    if kind != "memory":
+        logger.warning(f"Unknown EVENT_BROKER {kind!r}, using the in-process broker")
+    return InProcessBroker()
+
+
+broker = _create_broker(EVENT_BROKER)
+
+
+def set_broker(new_broker: Broker):
+    """Swap the broker, e.g. for an InProcessBroker in tests."""
+    global broker
+    broker = new_broker
+
+
+def file_event(event_type: str, file_meta) -> dict:
+    """Event for an uploaded or deleted file (a FileMeta or a row with the same fields)."""
+    data = {
+        "file_id": file_meta.id,
+        "filename": file_meta.filename,
+        "client_id": file_meta.client_id,
+        "uploaded_by": file_meta.uploaded_by,
+    }
+    if event_type == "file.uploaded":
+        data.update(
+            start_date=file_meta.start_date.strftime("%Y-%m-%d") if file_meta.start_date else None,
+            end_date=file_meta.end_date.strftime("%Y-%m-%d") if file_meta.end_date else None,
+            uploaded_at=file_meta.uploaded_at.strftime("%Y-%m-%d %H:%M:%S") if file_meta.uploaded_at else None
+        )
+    return {"type": event_type, "data": data}
+
+
+def publish(events):
+    """Publish after the change is committed; a failure never fails the request."""
+    events = list(events)
+    if not events:
+        return
+    try:
+        broker.publish(events)
+    except Exception as e:
+        logger.error(f"Error publishing {len(events)} events: {str(e)}")
+
+
+def visible_to(event: dict, role: str, user_id: int, client_id: Optional[int]) -> bool:
+    """Same rules as file_visibility_clause in access.py."""
+    data = event["data"]
+    if role == "admin":
+        return True
+    if role == "employee":
+        return client_id is not None and data.get("client_id") == client_id
+    if role == "client":
+        return data.get("uploaded_by") == user_id
+    return False
@@ -0,0 +1,93 @@
+"""
+Streaming CSV/NDJSON export of a sheet or a range of its rows.
+
+Rows come from the columnar cache when a conversion of the file exists and
+otherwise straight from the streaming workbook reader; output is produced in
+chunks of about CHUNK_SIZE characters, so memory stays constant.
+"""
+import csv
+import datetime
+import io
+import json
+from typing import Optional, Tuple
+from . import columnar
+
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def parse_rows(rows: Optional[str]) -> Tuple[int, Optional[int]]:
+    """
+    Parse a one-based, inclusive row range: "a:b", "a:" (to the end), ":b" or
+    a single row "a". Raises ValueError for malformed or empty ranges.
+    """
+    if not rows:
+        return 1, None
+    first, separator, last = rows.partition(":")
+    start = int(first) if first.strip() else 1
+    end = int(last) if last.strip() else None
+    if not separator:
+        end = start
+    if start < 1 or (end is not None and end < start):
+        raise ValueError("rows must be a:b with 1 <= a <= b")
+    return start, end
+
+
+def _cell(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def sheet_rows(book, file_id: int, path: str, sheet: str, start: int, end: Optional[int]):
+    """(row_number, values) of the requested rows; closes the workbook when done."""
+    try:
+        cached = columnar.cached_rows(file_id, path, sheet, start, end)
+        if cached is not None:
+            yield from cached
+            return
+        columnar.schedule_conversion(file_id, path, sheet)
+        for row_number, values in book.iter_rows(sheet):
+            if row_number < start:
+                continue
+            if end is not None and row_number > end:
+                break
+            yield row_number, values
+    finally:
+        book.close()
+
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for _, values in rows:
+        writer.writerow(["" if value is None else _cell(value) for value in values])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(rows):
+    lines, size = [], 0
+    for row_number, values in rows:
+        line = json.dumps({"row": row_number, "values": [_cell(value) for value in values]}, default=str)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines, size = [], 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+FORMATTERS = {
+    "csv": csv_chunks,
+    "ndjson": ndjson_chunks,
+}
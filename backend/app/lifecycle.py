@@ -0,0 +1,242 @@
+"""
+Storage lifecycle: files whose period ended long ago move to a cold tier and
+are eventually deleted.
+
+A client's rules (lifecycle_policies, set with PUT
+/admin/clients/{id}/lifecycle) give the days after a file's end_date at which
+it moves to the cold tier and at which it is purged; clients without rules
+use LIFECYCLE_COLD_AFTER_DAYS / LIFECYCLE_PURGE_AFTER_DAYS. run() applies them
+in batches of LIFECYCLE_BATCH_SIZE files per transaction, in the catalog and
+every tenant shard: from scripts/apply_lifecycle.py, or every
+LIFECYCLE_INTERVAL seconds from a thread in each API worker.
+
+Moving a file copies its blob to the same place under COLD_STORAGE_DIR,
+zstd-compressed unless it is a zip container already (.xlsx; legacy .xls
+shrinks several times), and points the row there with storage_tier "cold".
+size keeps the original length, so usage and quotas don't change. Downloads
+decompress while streaming; exports, consolidation and indexing parse a
+decompressed copy (storage.readable_path). A move only commits if the row
+still points at the hot blob, so concurrent runs in several workers repeat
+work but don't conflict.
+"""
+import datetime
+import hashlib
+import logging
+import os
+import threading
+from typing import Optional
+from sqlalchemy import select, delete, insert, update, func, or_
+from .config import (
+    UPLOAD_DIR, COLD_STORAGE_DIR, LIFECYCLE_COLD_AFTER_DAYS, LIFECYCLE_PURGE_AFTER_DAYS, LIFECYCLE_INTERVAL,
+    LIFECYCLE_BATCH_SIZE
+)
+from .database import SessionLocal
+from .models import FileMeta, LogEntry, LifecyclePolicy
+from .storage import choose_compression, copy_blob, remove_quietly, remove_thawed, schedule_removal
+from .access import file_tags
+from .usage import record_usage, release_usage
+from .cache import cache
+from .blob_cache import blob_cache
+from . import content_index, validation, columnar, events, sharding
+
+logger = logging.getLogger(__name__)
+
+# User name of the audit log entries of moves ("archive") and purges
+LIFECYCLE_USER = "lifecycle"
+
+# Columns a purge needs to release usage, drop caches and publish events
+_PURGED_COLUMNS = (
+    FileMeta.id, FileMeta.filename, FileMeta.path, FileMeta.client_id, FileMeta.uploaded_by, FileMeta.size,
+    FileMeta.sha256, FileMeta.compression
+)
+
+
+def effective_policy(policy: Optional[LifecyclePolicy]) -> tuple:
+    """(cold_after_days, purge_after_days) of a client's rules, with the defaults filled in; 0 = never."""
+    cold = policy.cold_after_days if policy and policy.cold_after_days is not None else LIFECYCLE_COLD_AFTER_DAYS
+    purge = policy.purge_after_days if policy and policy.purge_after_days is not None else LIFECYCLE_PURGE_AFTER_DAYS
+    return cold, purge
+
+
+def _rules(db) -> list:
+    """(condition on files, cold_after_days, purge_after_days): one per client with rules, then the defaults."""
+    policies = db.execute(select(LifecyclePolicy)).scalars().all()
+    rules = [(FileMeta.client_id == policy.client_id, *effective_policy(policy)) for policy in policies]
+    others = or_(FileMeta.client_id.is_(None), FileMeta.client_id.not_in([policy.client_id for policy in policies]))
+    rules.append((others, LIFECYCLE_COLD_AFTER_DAYS, LIFECYCLE_PURGE_AFTER_DAYS))
+    return rules
+
+
+def cold_path(path: str, compression: Optional[str]) -> str:
+    """Where a hot blob goes in the cold tier: the same place relative to COLD_STORAGE_DIR."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(UPLOAD_DIR))
+    if relative.startswith(".."):
+        relative = os.path.basename(path)
+    return os.path.join(COLD_STORAGE_DIR, relative + (".zst" if compression == "zstd" else ""))
+
+
+def _archive(session, rows, totals: dict):
+    """Copy the rows' blobs to the cold tier and repoint the rows; the hot blobs are removed after the commit."""
+    moved, abandoned = [], []
+    for row in rows:
+        try:
+            size = os.path.getsize(row.path)
+            compression = choose_compression(row.path)
+            target = cold_path(row.path, compression)
+            digest = hashlib.sha256()
+            written = copy_blob(row.path, target, compression, digest)
+        except FileNotFoundError:
+            logger.warning(f"Not moving file {row.id} to the cold tier: {row.path} is missing")
+            continue
+        if row.sha256 and row.sha256 != digest.hexdigest():
+            logger.warning(f"Contents of {row.path} don't match the recorded hash of file {row.id}")
+        # Only if no delete or other worker got to the file first. A missing
+        # size is recorded now: reconcile would measure the compressed blob.
+        updated = session.execute(
+            update(FileMeta)
+            .where(FileMeta.id == row.id, FileMeta.path == row.path, FileMeta.storage_tier.is_(None))
+            .values(
+                path=target, storage_tier="cold", compression=compression,
+                sha256=row.sha256 or digest.hexdigest(), size=size if row.size is None else row.size
+            )
+        ).rowcount
+        if updated:
+            if row.size is None:
+                record_usage(session, row.client_id, row.uploaded_by, size, 0)
+            moved.append(row)
+            totals["hot_bytes"] += size
+            totals["cold_bytes"] += written
+        else:
+            abandoned.append(target)
+    if moved:
+        session.execute(insert(LogEntry), [
+            {"user": LIFECYCLE_USER, "action": "archive", "file_id": row.id} for row in moved
+        ])
+    session.commit()
+
+    for target in abandoned:
+        # Another worker may have moved the same file to the same place
+        if session.execute(select(FileMeta.id).where(FileMeta.path == target)).first() is None:
+            remove_quietly(target)
+    if moved:
+        schedule_removal(row.path for row in moved)
+        columnar.remove_files([row.id for row in moved])  # converted from the hot blob
+        cache.invalidate_tags(file_tags(moved))  # listings show the path
+    totals["archived"] += len(moved)
+
+
+def _purge(session, file_ids, totals: dict):
+    """Delete files like a bulk delete does, as the lifecycle user."""
+    rows = session.execute(delete(FileMeta).where(FileMeta.id.in_(file_ids)).returning(*_PURGED_COLUMNS)).all()
+    purged_ids = [row.id for row in rows]
+    content_index.remove_files(session, purged_ids)
+    validation.remove_reports(session, purged_ids)
+    release_usage(session, rows)
+    if rows:
+        session.execute(insert(LogEntry), [
+            {"user": LIFECYCLE_USER, "action": "purge", "file_id": file_id} for file_id in purged_ids
+        ])
+    session.commit()
+
+    schedule_removal(row.path for row in rows)
+    columnar.remove_files(purged_ids)
+    for row in rows:
+        blob_cache.invalidate(row.sha256)
+        remove_thawed(row)
+    if rows:
+        cache.invalidate_tags(file_tags(rows))
+    events.publish(events.file_event("file.deleted", row) for row in rows)
+    totals["purged"] += len(rows)
+
+
+def _apply(session, condition, action, totals: dict, stop: Optional[threading.Event]):
+    """Run action on the matching files in id order, LIFECYCLE_BATCH_SIZE at a time."""
+    last = 0
+    while stop is None or not stop.is_set():
+        rows = session.execute(
+            select(
+                FileMeta.id, FileMeta.path, FileMeta.size, FileMeta.sha256, FileMeta.client_id, FileMeta.uploaded_by
+            )
+            .where(*condition, FileMeta.id > last)
+            .order_by(FileMeta.id)
+            .limit(LIFECYCLE_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        last = rows[-1].id
+        try:
+            if action == "purge":
+                _purge(session, [row.id for row in rows], totals)
+            else:
+                _archive(session, rows, totals)
+        except Exception:
+            session.rollback()
+            raise
+
+
+def run(dry_run: bool = False, stop: Optional[threading.Event] = None) -> dict:
+    """
+    Apply every client's rules: purge expired files, then move the remaining
+    old files to the cold tier. With dry_run, only count the files either
+    step would take. Returns the counts (and bytes before/after moving).
+    """
+    today = datetime.date.today()
+    totals = {"purged": 0, "archived": 0, "hot_bytes": 0, "cold_bytes": 0}
+    db = SessionLocal()
+    try:
+        rules = _rules(db)
+        for session in sharding.sessions(db):
+            for client_condition, cold_after_days, purge_after_days in rules:
+                steps = []
+                if purge_after_days:
+                    purge_before = today - datetime.timedelta(days=purge_after_days)
+                    steps.append(("purge", [client_condition, FileMeta.end_date < purge_before]))
+                if cold_after_days:
+                    archive = [
+                        client_condition, FileMeta.storage_tier.is_(None), FileMeta.path.isnot(None),
+                        FileMeta.end_date < today - datetime.timedelta(days=cold_after_days)
+                    ]
+                    if purge_after_days:
+                        archive.append(FileMeta.end_date >= purge_before)
+                    steps.append(("archive", archive))
+                for action, condition in steps:
+                    if dry_run:
+                        totals[f"{action}d"] += session.execute(select(func.count(FileMeta.id)).where(*condition)).scalar()
+                    else:
+                        _apply(session, condition, action, totals, stop)
+    finally:
+        db.close()
+    return totals
+
+
+_stopped = threading.Event()
+_thread = None
+
+
+def _schedule():
+    while not _stopped.wait(LIFECYCLE_INTERVAL):
+        try:
+            totals = run(stop=_stopped)
+            if totals["purged"] or totals["archived"]:
+                logger.info(f"Lifecycle run: {totals}")
+        except Exception as e:
+            logger.error(f"Lifecycle run failed: {str(e)}")
+
+
+def start_scheduler():
+    """Run the lifecycle every LIFECYCLE_INTERVAL seconds in this process (if set)."""
+    global _thread
+    if LIFECYCLE_INTERVAL <= 0 or _thread is not None:
+        return
+    _stopped.clear()
+    _thread = threading.Thread(target=_schedule, name="lifecycle", daemon=True)
+    _thread.start()
+
+
+def stop_scheduler():
+    """Stop after the current batch (waiting a few seconds for it)."""
+    global _thread
+    _stopped.set()
+    if _thread is not None:
+        _thread.join(timeout=10)
+        _thread = None
@@ -1,16 +1,75 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import Base, engine
-from .routes import auth, files, analytics, admin
+from .database import engine
+from .routes import auth, files, analytics, admin, health, events, dashboard
+from .config import PROFILING_ENABLED, LOG_LEVEL, ADMISSION_ENABLED
+from .admission import AdmissionMiddleware
+from .profiling import install_sql_profiling, profile_requests
+from .process import rss_bytes, process_age_seconds
+from .schema import prepare_database
+from .storage import drain_removals, check_compression
+from .access_log import drain_access_log
+from .content_index import stop_indexing
+from .consolidate import stop_pool as stop_consolidation
+from .validation import stop_validation
+from .lifecycle import start_scheduler as start_lifecycle, stop_scheduler as stop_lifecycle
+from . import events as event_broker
+
+logger = logging.getLogger(__name__)
+
+IMPORT_MS = (time.perf_counter() - IMPORT_STARTED) * 1000
+
 
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.basicConfig(level=LOG_LEVEL)
+    started = time.perf_counter()
+    # Under gunicorn the master already did this before forking, so workers
+    # only pay for the schema check.
+    prepare_database(engine)
+    auth.seed_demo_users()
+    event_broker.broker.start()
+    check_compression()
+    start_lifecycle()
 
-app = FastAPI()
+    process_age = process_age_seconds()
+    app.state.startup = {
+        "pid": os.getpid(),
+        "import_ms": round(IMPORT_MS, 1),
+        "startup_ms": round((time.perf_counter() - started) * 1000, 1),
+        "cold_start_ms": round(process_age * 1000, 1) if process_age is not None else None,
+        "rss_mb": round(rss_bytes() / 2**20, 1),
+    }
+    logger.info(f"Worker ready: {app.state.startup}")
+    yield
+    event_broker.broker.stop()
+    stop_lifecycle()
+    stop_indexing()
+    stop_validation()
+    drain_removals()
+    drain_access_log()
+    stop_consolidation()
+    logger.info(f"Worker {os.getpid()} shut down")
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 def root():
     return {"message": "API running!"}
 
+# Rate and concurrency limits for uploads/downloads (see app/admission.py).
+# Added before CORS so 429 responses still carry CORS headers.
+if ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 # CORS settings
 app.add_middleware(
     CORSMiddleware,
@@ -20,9 +79,17 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],  # Only allow needed headers
 )
 
+# Per-request SQL timing and opt-in sampling profiles (see app/profiling.py)
+if PROFILING_ENABLED:
+    install_sql_profiling(engine)
+    app.middleware("http")(profile_requests)
+
 
 # Routers
 app.include_router(auth.router)
 app.include_router(files.router)
 app.include_router(analytics.router)
 app.include_router(admin.router)
+app.include_router(health.router)
+app.include_router(events.router)
+app.include_router(dashboard.router)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, Date, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from .database import Base
 import datetime
@@ -29,6 +29,12 @@ class FileMeta(Base):
     start_date = Column(Date)
     end_date = Column(Date)
     uploaded_at = Column(DateTime, default=datetime.datetime.utcnow)
+    size = Column(BigInteger, nullable=True)  # bytes; NULL for files uploaded before sizes were recorded
+    sha256 = Column(String(64), nullable=True)  # content hash; computed lazily for older files
+    storage_tier = Column(String, nullable=True)  # NULL (hot) or "cold", see app/lifecycle.py
+    compression = Column(String, nullable=True)  # "zstd" for compressed cold-tier blobs
+    version = Column(Integer, nullable=True)  # 1, 2, ... within a report's versions; NULL for older files (1)
+    previous_version_id = Column(Integer, nullable=True)  # the version this upload replaced, see app/versions.py
     client = relationship("Client", back_populates="files")
 
 class LogEntry(Base):
@@ -38,3 +44,101 @@ class LogEntry(Base):
     action = Column(String)
     file_id = Column(Integer, ForeignKey("files.id"))
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
+
+class CellPosting(Base):
+    """Inverted index entry: `term` occurs in `cell` of `sheet` in file `file_id`."""
+    __tablename__ = "cell_postings"
+    term = Column(String, primary_key=True)
+    file_id = Column(Integer, ForeignKey("files.id"), primary_key=True, index=True)
+    sheet = Column(String, primary_key=True)
+    cell = Column(String, primary_key=True)
+
+class CellIndexStatus(Base):
+    __tablename__ = "cell_index_status"
+    file_id = Column(Integer, ForeignKey("files.id"), primary_key=True)
+    status = Column(String)  # indexed, failed
+    cells = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    indexed_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ValidationReport(Base):
+    __tablename__ = "validation_reports"
+    file_id = Column(Integer, ForeignKey("files.id"), primary_key=True)
+    status = Column(String)  # passed, failed, error
+    rows = Column(Integer, default=0)
+    issues = Column(Integer, default=0)  # violating cells
+    report = Column(Text)  # JSON: sheet, issues with examples, duration_ms
+    validated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ClientUsage(Base):
+    """Running storage totals per client, maintained by upload and delete."""
+    __tablename__ = "client_usage"
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    bytes = Column(BigInteger, nullable=False, default=0)
+    files = Column(Integer, nullable=False, default=0)
+    quota_bytes = Column(BigInteger, nullable=True)  # overrides DEFAULT_CLIENT_QUOTA_BYTES
+
+class LifecyclePolicy(Base):
+    """Storage lifecycle rules of a client; NULL falls back to the LIFECYCLE_* defaults, 0 = never."""
+    __tablename__ = "lifecycle_policies"
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    cold_after_days = Column(Integer, nullable=True)
+    purge_after_days = Column(Integer, nullable=True)
+
+class UserUsage(Base):
+    __tablename__ = "user_usage"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    bytes = Column(BigInteger, nullable=False, default=0)
+    files = Column(Integer, nullable=False, default=0)
+
+class Event(Base):
+    """File change events shared between worker processes (EVENT_BROKER=database)."""
+    __tablename__ = "events"
+    __table_args__ = {"sqlite_autoincrement": True}  # never reuse ids of pruned events
+    id = Column(Integer, primary_key=True)
+    type = Column(String)
+    data = Column(Text)  # JSON
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class AdmissionBucket(Base):
+    """Token bucket of a rate limit (ADMISSION_STORE=database)."""
+    __tablename__ = "admission_buckets"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # unix time
+
+class AdmissionLease(Base):
+    """A transfer slot or bytes held by an in-flight request (ADMISSION_STORE=database)."""
+    __tablename__ = "admission_leases"
+    id = Column(Integer, primary_key=True)
+    key = Column(String, index=True)
+    amount = Column(BigInteger, nullable=False)
+    expires_at = Column(Float, nullable=False)  # unix time
+
+class CacheTag(Base):
+    """Version of a result cache tag, shared by all workers (see app/cache.py)."""
+    __tablename__ = "cache_tags"
+    tag = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class TenantShard(Base):
+    """Database and storage root of a client split off the catalog (see app/sharding.py)."""
+    __tablename__ = "tenant_shards"
+    client_id = Column(Integer, ForeignKey("clients.id"), primary_key=True)
+    database_url = Column(String, nullable=False)
+    storage_root = Column(String, nullable=False)
+    state = Column(String, nullable=False, default="copying")  # copying, active
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    activated_at = Column(DateTime, nullable=True)
+
+class ShardedFile(Base):
+    """Shard of a file moved out of the catalog; ids of files created in a shard encode it."""
+    __tablename__ = "sharded_files"
+    file_id = Column(Integer, primary_key=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+
+class SplitChange(Base):
+    """Key of a tenant table row changed in the catalog during a split (recorded by triggers)."""
+    __tablename__ = "split_changes"
+    table_name = Column(String, primary_key=True)
+    key = Column(Integer, primary_key=True)
@@ -0,0 +1,207 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from fastapi.responses import Response
+from jose import JWTError, jwt
+from sqlalchemy import event
+
+from .config import SECRET_KEY, ALGORITHM, SLOW_QUERY_MS, PROFILING_ENABLED, PROFILE_SAMPLE_INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+# SQL statistics for the request currently being handled. The middleware sets a
+# fresh SQLStats object per request; the engine listeners below update it from
+# whichever thread runs the query (context is copied into the threadpool).
+_request_stats: ContextVar = ContextVar("request_sql_stats", default=None)
+# Idents of the threads running the endpoint of the request being profiled
+_profiled_threads: ContextVar = ContextVar("profiled_threads", default=None)
+
+
+class SQLStats:
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({elapsed * 1000:.1f} ms): {statement} | params: {parameters!r}")
+
+
+def _handle_error(exception_context):
+    start_times = exception_context.connection.info.get("query_start_time") if exception_context.connection else None
+    if start_times:
+        start_times.pop()
+
+
+def install_sql_profiling(engine):
+    """Attach the SQL timing listeners to an engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _tracked(call):
+    """Wrap an endpoint so a profiled request records the thread running it."""
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def endpoint(*args, **kwargs):
+            threads = _profiled_threads.get()
+            if threads is None:
+                return await call(*args, **kwargs)
+            ident = threading.get_ident()
+            threads.add(ident)
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                threads.discard(ident)
+        return endpoint
+
+    @functools.wraps(call)
+    def endpoint(*args, **kwargs):
+        threads = _profiled_threads.get()
+        if threads is None:
+            return call(*args, **kwargs)
+        ident = threading.get_ident()
+        threads.add(ident)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            threads.discard(ident)
+    return endpoint
+
+
+class ProfiledRoute(APIRoute):
+    """Route class of the API routers: request profiles find the thread running the endpoint."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _tracked(endpoint) if PROFILING_ENABLED else endpoint, **kwargs)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the given threads (a set that may change
+    while sampling) at a fixed interval and aggregates them in the folded
+    format understood by flamegraph.pl and speedscope ("frame;frame;frame
+    count" per line).
+    """
+
+    def __init__(self, interval: float, threads: set):
+        self.interval = interval
+        self.threads = threads
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+def _is_admin_request(request: Request) -> bool:
+    """Check the bearer token's role claim without touching the database."""
+    authorization = request.headers.get("Authorization", "")
+    token = authorization[7:] if authorization.startswith("Bearer ") else request.query_params.get("token")
+    if not token:
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("role") == "admin"
+
+
+def _profile_requested(request: Request) -> bool:
+    return request.headers.get("X-Profile") == "1" or request.query_params.get("profile") == "1"
+
+
+async def profile_requests(request: Request, call_next):
+    """
+    Count and time the SQL statements of every request and report them in the
+    Server-Timing header. Admins can send "X-Profile: 1" (or ?profile=1) to get
+    a sampled flamegraph of the request back instead of the normal body.
+
+    The profile samples only the thread running the request's endpoint: a
+    worker thread for plain def endpoints, the event loop for async ones,
+    where other requests' coroutines can show up too as they share it.
+    """
+    stats = SQLStats()
+    stats_token = _request_stats.set(stats)
+    threads_token = None
+    sampler = None
+    if _profile_requested(request) and _is_admin_request(request):
+        threads = set()
+        threads_token = _profiled_threads.set(threads)
+        sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000, threads)
+        sampler.start()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+        if sampler is not None:
+            # The profile replaces the body, so the response must be finished first
+            async for _ in response.body_iterator:
+                pass
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            _profiled_threads.reset(threads_token)
+        _request_stats.reset(stats_token)
+    total_ms = (time.perf_counter() - started) * 1000
+    sql_ms = stats.duration * 1000
+    logger.debug(f"{request.method} {request.url.path}: {stats.count} queries, {sql_ms:.1f} ms SQL, {total_ms:.1f} ms total")
+
+    if sampler is not None:
+        filename = f"profile-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.folded"
+        response = Response(
+            sampler.folded(),
+            media_type="text/plain",
+            headers={
+                "Content-Disposition": f"attachment; filename=\"{filename}\"",
+                "X-Profiled-Status": str(response.status_code),
+            },
+        )
+    response.headers["X-SQL-Queries"] = str(stats.count)
+    response.headers["Server-Timing"] = (
+        f"sql;dur={sql_ms:.1f};desc=\"{stats.count} queries\", app;dur={total_ms - sql_ms:.1f}"
+    )
+    return response
@@ -2,5 +2,7 @@ from .auth import router as auth_router
 from .files import router as files_router
 from .analytics import router as analytics_router
 from .admin import router as admin_router
+from .health import router as health_router
+from .events import router as events_router
 
-__all__ = ['auth_router', 'files_router', 'analytics_router', 'admin_router']
+__all__ = ['auth_router', 'files_router', 'analytics_router', 'admin_router', 'health_router', 'events_router']
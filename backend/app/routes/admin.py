@@ -1,19 +1,221 @@
-from fastapi import APIRouter, Depends, HTTPException
+import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from typing import List
-from .. import models, schemas, database
+from .. import models, schemas, database, sharding, lifecycle
 from ..database import get_db
 from ..utils import get_current_user
+from ..cache import cache
+from ..blob_cache import blob_cache
+from ..config import DEFAULT_CLIENT_QUOTA_BYTES, OVERVIEW_CACHE_TTL, QUERY_CACHE_TTL
+from ..profiling import ProfiledRoute
 
-router = APIRouter(prefix="/admin", tags=["admin"])
+router = APIRouter(prefix="/admin", tags=["admin"], route_class=ProfiledRoute)
 
 @router.get("/clients", response_model=List[schemas.Client])
 def get_clients(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    clients = db.query(models.Client).all()
-    return clients
+    return cache.get_or_compute(
+        "clients", QUERY_CACHE_TTL,
+        lambda: [{"id": client.id, "name": client.name} for client in db.query(models.Client).all()],
+        tags=["clients"]
+    )
+
+def _format_datetime(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+def _format_date(value):
+    return value.strftime("%Y-%m-%d") if value else None
+
+def build_overview(db: Session, activity_days: int):
+    """Per-client file statistics and recent activity in a fixed number of queries."""
+    FileMeta, LogEntry = models.FileMeta, models.LogEntry
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=activity_days)
+
+    file_stats, activity = [], []
+    # A client's files and logs live in one database (the catalog or its shard)
+    for session in sharding.sessions(db):
+        file_stats.extend(session.execute(
+            select(
+                FileMeta.client_id,
+                func.count(FileMeta.id),
+                func.max(FileMeta.uploaded_at),
+                func.min(FileMeta.start_date),
+                func.max(FileMeta.end_date),
+                func.sum(FileMeta.size)
+            ).group_by(FileMeta.client_id)
+        ).all())
+        # Activity on files that still exist; log rows carry no client of their own
+        activity.extend(session.execute(
+            select(FileMeta.client_id, LogEntry.action, func.count(LogEntry.id), func.max(LogEntry.timestamp))
+            .join(FileMeta, FileMeta.id == LogEntry.file_id)
+            .where(LogEntry.timestamp >= since)
+            .group_by(FileMeta.client_id, LogEntry.action)
+        ).all())
+    clients = db.execute(select(models.Client.id, models.Client.name).order_by(models.Client.id)).all()
+
+    def empty(client_id, name):
+        return {
+            "client_id": client_id,
+            "client_name": name,
+            "files": 0,
+            "bytes": 0,
+            "latest_upload": None,
+            "coverage_start": None,
+            "coverage_end": None,
+            "activity": {},
+            "last_activity": None
+        }
+
+    overview = {client_id: empty(client_id, name) for client_id, name in clients}
+    for client_id, count, latest, start, end, size in file_stats:
+        entry = overview.setdefault(client_id, empty(client_id, "No Client"))
+        entry.update(
+            files=count,
+            bytes=size or 0,
+            latest_upload=_format_datetime(latest),
+            coverage_start=_format_date(start),
+            coverage_end=_format_date(end)
+        )
+    last_activity = {}
+    for client_id, action, count, latest in activity:
+        entry = overview.setdefault(client_id, empty(client_id, "No Client"))
+        entry["activity"][action] = count
+        if latest and (client_id not in last_activity or latest > last_activity[client_id]):
+            last_activity[client_id] = latest
+    for client_id, latest in last_activity.items():
+        overview[client_id]["last_activity"] = _format_datetime(latest)
+
+    clients = list(overview.values())
+    return {
+        "generated_at": _format_datetime(datetime.datetime.utcnow()),
+        "activity_days": activity_days,
+        "totals": {
+            "clients": len(clients),
+            "files": sum(entry["files"] for entry in clients),
+            "bytes": sum(entry["bytes"] for entry in clients)
+        },
+        "clients": clients
+    }
+
+@router.get("/overview")
+def get_overview(
+    activity_days: int = Query(30, ge=1, le=365),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Everything the admin dashboard shows per client (file count, latest
+    upload, date coverage, recent activity) in one response. Cached for
+    OVERVIEW_CACHE_TTL seconds and dropped whenever files are uploaded or
+    deleted; download counts may lag by up to the TTL.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return cache.get_or_compute(
+        f"overview:{activity_days}", OVERVIEW_CACHE_TTL, lambda: build_overview(db, activity_days), tags=["files"]
+    )
+
+@router.get("/clients/usage")
+def get_clients_usage(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """Storage used per client, read from the usage counters (no file scan)."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    def load():
+        usages = {}
+        # Counters of a split-off client are in its shard
+        for session in sharding.sessions(db):
+            usages.update((usage.client_id, usage) for usage in session.query(models.ClientUsage).all())
+        result = []
+        for client in db.query(models.Client).order_by(models.Client.id).all():
+            usage = usages.get(client.id)
+            quota = usage.quota_bytes if usage and usage.quota_bytes is not None else DEFAULT_CLIENT_QUOTA_BYTES
+            result.append({
+                "client_id": client.id,
+                "client_name": client.name,
+                "bytes": usage.bytes if usage else 0,
+                "files": usage.files if usage else 0,
+                "quota_bytes": quota or None
+            })
+        return result
+
+    return cache.get_or_compute("clients-usage", QUERY_CACHE_TTL, load, tags=["usage"])
+
+@router.put("/clients/{client_id}/quota")
+def set_client_quota(
+    client_id: int,
+    update: schemas.QuotaUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not db.query(models.Client).filter(models.Client.id == client_id).first():
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    usage = db.get(models.ClientUsage, client_id)
+    if usage is None:
+        usage = models.ClientUsage(client_id=client_id, bytes=0, files=0)
+        db.add(usage)
+    usage.quota_bytes = update.quota_bytes
+    db.commit()
+    cache.invalidate_tags(["usage"])
+    return {"client_id": client_id, "quota_bytes": update.quota_bytes}
+
+def _lifecycle_response(client_id: int, policy):
+    cold_after_days, purge_after_days = lifecycle.effective_policy(policy)
+    return {
+        "client_id": client_id,
+        "cold_after_days": cold_after_days or None,
+        "purge_after_days": purge_after_days or None,
+        "custom": policy is not None
+    }
+
+@router.get("/clients/{client_id}/lifecycle")
+def get_client_lifecycle(
+    client_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Days after a file's end_date at which the client's files move to the cold tier and are purged (None = never)."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not db.query(models.Client).filter(models.Client.id == client_id).first():
+        raise HTTPException(status_code=404, detail="Client not found")
+    return _lifecycle_response(client_id, db.get(models.LifecyclePolicy, client_id))
+
+@router.put("/clients/{client_id}/lifecycle")
+def set_client_lifecycle(
+    client_id: int,
+    update: schemas.LifecycleUpdate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Set the client's lifecycle rules; they take effect at the next lifecycle run."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if not db.query(models.Client).filter(models.Client.id == client_id).first():
+        raise HTTPException(status_code=404, detail="Client not found")
+    if any(days is not None and days < 0 for days in (update.cold_after_days, update.purge_after_days)):
+        raise HTTPException(status_code=400, detail="Days must not be negative")
+
+    policy = db.get(models.LifecyclePolicy, client_id)
+    if update.cold_after_days is None and update.purge_after_days is None:
+        if policy is not None:  # back to the defaults
+            db.delete(policy)
+            policy = None
+    else:
+        if policy is None:
+            policy = models.LifecyclePolicy(client_id=client_id)
+            db.add(policy)
+        policy.cold_after_days = update.cold_after_days
+        policy.purge_after_days = update.purge_after_days
+    db.commit()
+    return _lifecycle_response(client_id, policy)
 
 @router.get("/files/client/{client_id}")
 def get_client_files(
@@ -24,14 +226,28 @@ def get_client_files(
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    files = db.query(models.FileMeta).filter(models.FileMeta.client_id == client_id).all()
-    return [{
-        "id": file.id,
-        "filename": file.filename,
-        "path": file.path,
-        "uploaded_by": file.uploaded_by,
-        "client_id": file.client_id,
-        "start_date": file.start_date.strftime("%Y-%m-%d"),
-        "end_date": file.end_date.strftime("%Y-%m-%d"),
-        "uploaded_at": file.uploaded_at.strftime("%Y-%m-%d %H:%M:%S")
-    } for file in files]
+    def load():
+        files = db.query(models.FileMeta).filter(models.FileMeta.client_id == client_id).all()
+        return [{
+            "id": file.id,
+            "filename": file.filename,
+            "path": file.path,
+            "uploaded_by": file.uploaded_by,
+            "client_id": file.client_id,
+            "start_date": file.start_date.strftime("%Y-%m-%d"),
+            "end_date": file.end_date.strftime("%Y-%m-%d"),
+            "uploaded_at": file.uploaded_at.strftime("%Y-%m-%d %H:%M:%S")
+        } for file in files]
+
+    scope = f"client:{client_id}"
+    return cache.get_or_compute(f"client-files:{scope}", QUERY_CACHE_TTL, load, tags=[scope])
+
+@router.get("/cache/stats")
+def get_cache_stats(current_user: models.User = Depends(get_current_user)):
+    """
+    Hit rates of the result cache and of the download blob cache (with the
+    bytes served from memory) of the worker that answers; each has its own.
+    """
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return dict(cache.stats(), blobs=blob_cache.stats())
@@ -1,16 +1,31 @@
-from fastapi import APIRouter, Depends
+import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..models import LogEntry
+from .. import sharding
+from ..profiling import ProfiledRoute
 from .files import get_current_user
 
-router = APIRouter(prefix="/analytics", tags=["analytics"])
+router = APIRouter(prefix="/analytics", tags=["analytics"], route_class=ProfiledRoute)
 
 @router.get("/logs")
-def get_logs(db: Session = Depends(get_db), user=Depends(get_current_user)):
+def get_logs(
+    limit: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """Audit log, newest first; with limit, only the latest entries."""
     if user.role != "admin":
         return []
-    logs = db.query(LogEntry).order_by(LogEntry.timestamp.desc()).all()
+    parts = [
+        session.query(LogEntry).order_by(LogEntry.timestamp.desc()).limit(limit).all()
+        for session in sharding.sessions(db, user)
+    ]
+    logs = parts[0] if len(parts) == 1 else sorted(
+        (l for part in parts for l in part), key=lambda l: l.timestamp or datetime.datetime.min, reverse=True
+    )[:limit]
     return [{
         "user": l.user,
         "action": l.action,
@@ -4,9 +4,10 @@ from fastapi.security import OAuth2PasswordRequestForm
 from ..models import User
 from ..database import get_db
 from ..utils import verify_password, create_access_token, get_password_hash
+from ..profiling import ProfiledRoute
 from datetime import timedelta
 
-router = APIRouter(prefix="/auth", tags=["auth"])
+router = APIRouter(prefix="/auth", tags=["auth"], route_class=ProfiledRoute)
 
 @router.post("/login")
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
@@ -19,11 +20,11 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-# For demo only: seed users on first run
-@router.on_event("startup")
+# For demo only: seed users on first run (called from the app lifespan)
 def seed_demo_users():
     from ..models import Client, User
     from ..database import SessionLocal
+    from ..cache import cache
     db = SessionLocal()
     if db.query(Client).count() == 0:
         c1 = Client(name="AcmeCorp")
@@ -37,4 +38,5 @@ def seed_demo_users():
         ]
         db.add_all(users)
         db.commit()
+        cache.invalidate_tags(["clients"])
     db.close()
@@ -0,0 +1,75 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from ..database import session_for_request
+from ..auth import get_current_user
+from ..schemas import BootstrapRequest
+from ..config import BOOTSTRAP_CONCURRENCY
+from . import files, admin, analytics
+from ..profiling import ProfiledRoute
+
+router = APIRouter(prefix="/dashboard", tags=["dashboard"], route_class=ProfiledRoute)
+
+MAX_QUERIES = 20
+
+# What each sub-query runs: the endpoint it stands for, with its parameters
+QUERIES = {
+    "files": lambda query, db, user: files.list_files(db=db, user=user),
+    "history": lambda query, db, user: files.get_upload_history(db=db, user=user, client_id=query.client_id),
+    "clients": lambda query, db, user: admin.get_clients(db=db, current_user=user),
+    "overview": lambda query, db, user: admin.get_overview(
+        activity_days=query.activity_days, db=db, current_user=user
+    ),
+    "logs": lambda query, db, user: analytics.get_logs(limit=query.limit, db=db, user=user),
+    "usage": lambda query, db, user: admin.get_clients_usage(db=db, current_user=user),
+}
+
+@router.post("/bootstrap")
+async def bootstrap(request: BootstrapRequest, http_request: Request, user=Depends(get_current_user)):
+    """
+    Several dashboard queries in one request: files (GET /files/list),
+    history (GET /files/history), clients (GET /admin/clients), overview
+    (GET /admin/overview), logs (GET /analytics/logs) and usage (GET
+    /admin/clients/usage). The token is checked once; the queries are
+    independent and run concurrently on the thread pool, up to
+    BOOTSTRAP_CONCURRENCY at a time, each with its own session. Returns each
+    result under its key in "results", or the status and detail the endpoint
+    would have answered with in "errors".
+    """
+    queries = request.queries
+    if len(queries) > MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUERIES} queries per request")
+    keys = [query.key or query.name for query in queries]
+    if len(set(keys)) != len(keys):
+        raise HTTPException(status_code=400, detail="Query keys must be unique")
+    for query in queries:
+        if query.name not in QUERIES:
+            raise HTTPException(status_code=400, detail=f"Unknown query {query.name}")
+        if not 1 <= query.activity_days <= 365:
+            raise HTTPException(status_code=400, detail="activity_days must be between 1 and 365")
+        if query.limit is not None and query.limit < 1:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+
+    semaphore = asyncio.Semaphore(BOOTSTRAP_CONCURRENCY)
+
+    def run(query):
+        db = session_for_request(http_request)
+        try:
+            return QUERIES[query.name](query, db, user)
+        finally:
+            db.close()
+
+    async def run_limited(query):
+        async with semaphore:
+            return await run_in_threadpool(run, query)
+
+    outcomes = await asyncio.gather(*(run_limited(query) for query in queries), return_exceptions=True)
+    results, errors = {}, {}
+    for key, outcome in zip(keys, outcomes):
+        if isinstance(outcome, HTTPException):
+            errors[key] = {"status_code": outcome.status_code, "detail": outcome.detail}
+        elif isinstance(outcome, Exception):
+            raise outcome
+        else:
+            results[key] = outcome
+    return {"results": results, "errors": errors}
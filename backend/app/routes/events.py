@@ -0,0 +1,81 @@
+import json
+import logging
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Query, Request, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..database import SessionLocal
+from ..auth import get_current_user
+from ..config import EVENT_KEEPALIVE_SECONDS
+from .. import events
+from ..profiling import ProfiledRoute
+from .files import optional_oauth2_scheme
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/events", tags=["events"], route_class=ProfiledRoute)
+
+RETRY_MS = 3000
+
+
+def resolve_subscriber(token: str):
+    """Look the user up once; the stream itself holds no database session."""
+    db = SessionLocal()
+    try:
+        user = get_current_user(token=token, db=db)
+        return user.username, user.role, user.id, user.client_id
+    finally:
+        db.close()
+
+
+def format_event(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@router.get("/files")
+async def file_events(
+    request: Request,
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+    token: Optional[str] = Query(None),
+    last_event_id: Optional[int] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-sent events for uploads ("file.uploaded") and deletions
+    ("file.deleted") the user is allowed to see. EventSource cannot set
+    headers, so the token may be passed as ?token=. Reconnecting browsers
+    send Last-Event-ID and get the events they missed; a "reset" event means
+    those are gone and the client should reload its file list.
+    """
+    if not header_token and not token:
+        raise HTTPException(status_code=401, detail="No authentication provided")
+    username, role, user_id, client_id = await run_in_threadpool(resolve_subscriber, header_token or token)
+
+    if last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = int(last_event_id_header)
+    broker = events.broker
+    cursor = last_event_id if last_event_id is not None else broker.latest_id()
+    logger.info(f"Event stream opened by {username} from event {cursor}")
+
+    async def stream():
+        nonlocal cursor
+        yield f"retry: {RETRY_MS}\n\n"
+        while not await request.is_disconnected():
+            batch = await broker.wait(cursor, EVENT_KEEPALIVE_SECONDS)
+            if batch is None:
+                cursor = broker.latest_id()
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+                continue
+            if not batch:
+                yield ": keepalive\n\n"
+                continue
+            for event in batch:
+                cursor = event["id"]
+                if events.visible_to(event, role, user_id, client_id):
+                    yield format_event(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,24 +1,52 @@
+import io
 import os
-import shutil
+import json
+import asyncio
+import hashlib
 from typing import List, Optional
 from datetime import date
+from types import SimpleNamespace
+from urllib.parse import quote
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, status, Query
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select, delete, insert, true
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..models import FileMeta, User, LogEntry, Client
+from ..database import get_db, IN_BATCH_SIZE
+from ..models import FileMeta, User, LogEntry, Client, ValidationReport
 from ..auth import get_current_user
-from ..config import UPLOAD_DIR
+from ..config import (
+    UPLOAD_DIR, BATCH_UPLOAD_CONCURRENCY, DOWNLOAD_URL_TTL, DOWNLOAD_URL_MAX_TTL, CONSOLIDATE_MAX_FILES,
+    QUERY_CACHE_TTL, DELTA_BLOCK_SIZE
+)
+from ..storage import (
+    storage_path, save_stream, remove_quietly, schedule_removal, StorageLimitExceeded, content_hash, readable_path,
+    remove_thawed, is_plain_filename
+)
+from ..access import file_visibility_clause, visibility_scope, file_tags
+from ..search import search_files
+from .. import content_index
+from ..usage import check_quota, remaining_quota, reserve_quota, settle_quota, record_usage, release_usage
+from ..cache import cache
+from .. import events
+from ..schemas import BulkDeleteRequest, DownloadLinksRequest
+from ..signed_urls import sign_download, verify_download, InvalidSignedURL
+from ..access_log import record_access
+from ..downloads import file_response, cached_content, content_disposition
+from ..blob_cache import blob_cache
+from ..workbook import Workbook, WorkbookError
+from .. import export, columnar, consolidate, validation, sharding, versions
+from ..profiling import ProfiledRoute
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/files", tags=["files"])
+router = APIRouter(prefix="/files", tags=["files"], route_class=ProfiledRoute)
 
-# Ensure storage directory exists
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Like auth.oauth2_scheme, but lets downloads fall back to a query token
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 @router.get("/debug/files")
 def debug_list_files(
@@ -90,54 +118,132 @@ def get_upload_history(
     try:
         if user.role == "admin":
             query = db.query(FileMeta)
+            scope = "files"
             if client_id:
                 query = query.filter(FileMeta.client_id == client_id)
+                scope = f"client:{client_id}"
         elif user.role == "employee":
             query = db.query(FileMeta).filter(FileMeta.client_id == user.client_id)
+            scope = f"client:{user.client_id}"
             if client_id and client_id != user.client_id:
                 raise HTTPException(status_code=403, detail="Not authorized to view this client's files")
         else:  # client user
             query = db.query(FileMeta).filter(FileMeta.uploaded_by == user.id)
-        
-        # Add client name to the results for better visibility
-        results = query.all()
-        for file in results:
-            if file.client:
-                file.client_name = file.client.name
-            else:
-                file.client_name = "No Client"
-        
-        return results
+            scope = f"uploader:{user.id}"
+
+        def load():
+            results = []
+            for session in sharding.sessions(db, user):
+                files = query.with_session(session).all()
+                # Add client name to the results for better visibility
+                for file in files:
+                    if file.client:
+                        file.client_name = file.client.name
+                    else:
+                        file.client_name = "No Client"
+                results.extend(jsonable_encoder(files))
+            return results
+
+        return cache.get_or_compute(f"history:{scope}", QUERY_CACHE_TTL, load, tags=[scope])
     except Exception as e:
         logger.error(f"Error getting file history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def get_download_user(
+    header_token: Optional[str] = Depends(optional_oauth2_scheme),
+    token: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Authenticate a download from the Authorization header, falling back to the
+    ?token= query parameter used by plain browser downloads.
+    """
+    if not header_token and not token:
+        raise HTTPException(status_code=401, detail="No authentication provided")
+    return get_current_user(token=header_token or token, db=db)
+
+@router.get("/search")
+def search(
+    q: str = Query(..., min_length=1),
+    fuzzy: bool = False,
+    client_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Search files by filename, client name and uploader. Every word of q must
+    match as a substring (prefixes included); fuzzy=true tolerates typos.
+    start_date/end_date keep files whose period overlaps the given range.
+    """
+    filters = [file_visibility_clause(user)]
+    if client_id is not None:
+        filters.append(FileMeta.client_id == client_id)
+    if start_date is not None:
+        filters.append(FileMeta.end_date >= start_date)
+    if end_date is not None:
+        filters.append(FileMeta.start_date <= end_date)
+
+    def load():
+        results = []
+        # With shards each ranks its own matches; the best of the first shards come first
+        for session in sharding.sessions(db, user):
+            results.extend({
+                "id": file.id,
+                "filename": file.filename,
+                "client_id": file.client_id,
+                "client_name": client_name or "No Client",
+                "uploaded_by": file.uploaded_by,
+                "uploader": uploader,
+                "start_date": file.start_date.strftime("%Y-%m-%d") if file.start_date else None,
+                "end_date": file.end_date.strftime("%Y-%m-%d") if file.end_date else None,
+                "uploaded_at": file.uploaded_at.strftime("%Y-%m-%d %H:%M:%S") if file.uploaded_at else None
+            } for file, client_name, uploader in search_files(session, q, fuzzy, filters, limit))
+        return results[:limit]
+
+    scope = visibility_scope(user)
+    key = f"search:{scope}:" + json.dumps([q, fuzzy, client_id, str(start_date), str(end_date), limit])
+    try:
+        return cache.get_or_compute(key, QUERY_CACHE_TTL, load, tags=[scope])
+    except Exception as e:
+        logger.error(f"Error searching files for {q!r}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/content-search")
+def content_search(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Find the files, sheets and cells whose contents contain every word of q
+    (e.g. "invoice A-1234"), limited to files the user may download.
+    """
+    try:
+        rows = []
+        for session in sharding.sessions(db, user):
+            rows.extend(content_index.search_cells(session, q, [file_visibility_clause(user)], limit))
+    except Exception as e:
+        logger.error(f"Error searching cell contents for {q!r}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    rows = sorted(rows, key=lambda row: row[0], reverse=True)[:limit]
+
+    results = {}
+    for file_id, filename, sheet, cell in rows:
+        entry = results.setdefault(file_id, {"file_id": file_id, "filename": filename, "matches": []})
+        entry["matches"].append({"sheet": sheet, "cell": cell})
+    return list(results.values())
+
 @router.get("/download/{file_id}")
 def download_file(
     file_id: int,
     db: Session = Depends(get_db),
-    token: str = Query(None)
+    user=Depends(get_download_user)
 ):
     try:
-        # First try to get user from Authorization header
-        try:
-            user = get_current_user(token=None, db=db)
-        except HTTPException:
-            if not token:
-                raise HTTPException(status_code=401, detail="No authentication provided")
-            
-            # If token in query parameter, verify it
-            try:
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                username = payload.get("sub")
-                if not username:
-                    raise ValueError("Invalid token")
-                user = db.query(User).filter(User.username == username).first()
-                if not user:
-                    raise ValueError("User not found")
-            except (JWTError, ValueError) as e:
-                raise HTTPException(status_code=401, detail=str(e))
-
         # Get file metadata
         file_meta = db.query(FileMeta).filter(FileMeta.id == file_id).first()
         if not file_meta:
@@ -156,8 +262,11 @@ def download_file(
         # Get absolute file path
         file_path = os.path.join(UPLOAD_DIR, file_meta.path)
         
+        # Hot files are served from memory, skipping the disk entirely
+        content = cached_content(file_meta.sha256)
+
         # Check if file exists
-        if not os.path.exists(file_path):
+        if content is None and not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail=f"File not found at path: {file_path}")
 
         # Log the download
@@ -165,12 +274,9 @@ def download_file(
         db.add(log)
         db.commit()
 
-        # Return file as response
-        return FileResponse(
-            file_path,
-            filename=file_meta.filename,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=\"{file_meta.filename}\""}
+        # Return file as response (or hand it to the reverse proxy)
+        return file_response(
+            file_path, file_meta.filename, sha256=file_meta.sha256, content=content, compression=file_meta.compression
         )
     except HTTPException as e:
         logger.error(f"Error downloading file {file_id}: {str(e.detail)}")
@@ -178,186 +284,286 @@ def download_file(
     except Exception as e:
         logger.error(f"Unexpected error downloading file {file_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/{file_id}/export")
+def export_sheet(
+    file_id: int,
+    sheet: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    rows: Optional[str] = Query(None, description="one-based inclusive range a:b, a: or :b"),
+    db: Session = Depends(get_db),
+    user=Depends(get_download_user)
+):
+    """
+    Stream one sheet (the first by default), or a range of its rows, as CSV
+    or NDJSON ({"row": n, "values": [...]} per line) without converting the
+    whole workbook.
+    """
     try:
-        # First try to get user from Authorization header
-        try:
-            user = get_current_user(token=None, db=db)
-        except HTTPException:
-            if not token:
-                raise HTTPException(status_code=401, detail="No authentication provided")
-            
-            # If token in query parameter, verify it
-            try:
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                username = payload.get("sub")
-                if not username:
-                    raise ValueError("Invalid token")
-                user = db.query(User).filter(User.username == username).first()
-                if not user:
-                    raise ValueError("User not found")
-            except (JWTError, ValueError) as e:
-                raise HTTPException(status_code=401, detail=str(e))
+        start, end = export.parse_rows(rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rows: {str(e)}")
 
-        # Get file metadata
-        file_meta = db.query(FileMeta).filter(FileMeta.id == file_id).first()
-        if not file_meta:
-            raise HTTPException(status_code=404, detail="File not found")
+    file_meta = db.execute(
+        select(FileMeta).where(FileMeta.id == file_id, file_visibility_clause(user))
+    ).scalar_one_or_none()
+    if not file_meta or not file_meta.path:
+        raise HTTPException(status_code=404, detail="File not found")
+    file_path = os.path.join(UPLOAD_DIR, file_meta.path)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found in storage")
+    file_path = readable_path(file_meta)  # decompressed copy of a cold-tier file
 
-        # Check if user has access to this file
-        if user.role == "admin":
-            pass  # Admin can download any file
-        elif user.role == "employee":
-            if file_meta.client_id != user.client_id:
-                raise HTTPException(status_code=403, detail="Not authorized to download this file")
-        else:  # client user
-            if file_meta.uploaded_by != user.id:
-                raise HTTPException(status_code=403, detail="Not authorized to download this file")
+    try:
+        book = Workbook(file_path)
+    except WorkbookError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    names = book.sheet_names()
+    if sheet is None and names:
+        sheet = names[0]
+    if sheet not in names:
+        book.close()
+        raise HTTPException(status_code=404, detail=f"Sheet {sheet!r} not found")
 
-        # Get absolute file path
-        file_path = os.path.join(UPLOAD_DIR, file_meta.path)
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail=f"File not found at path: {file_path}")
+    db.add(LogEntry(user=user.username, action="export", file_id=file_id))
+    db.commit()
 
-        # Log the download
-        log = LogEntry(user=user.username, action="download", file_id=file_id)
-        db.add(log)
-        db.commit()
+    stem = os.path.splitext(file_meta.filename)[0]
+    chunks = export.FORMATTERS[format](export.sheet_rows(book, file_id, file_path, sheet, start, end))
+    return StreamingResponse(
+        chunks,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": content_disposition(f"{stem}-{sheet}.{format}")}
+    )
 
-        # Return file as response
-        return FileResponse(
-            file_path,
-            filename=filename or file_meta.filename,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f"attachment; filename=\"{filename or file_meta.filename}\""}
-        )
-    except HTTPException as e:
-        logger.error(f"Error downloading file {file_id}: {str(e.detail)}")
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error downloading file {file_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
-        # First try to get user from Authorization header
-        try:
-            user = get_current_user(token=None, db=db)
-        except HTTPException:
-            if not token:
-                raise HTTPException(status_code=401, detail="No authentication provided")
-            
-            # If token in query parameter, verify it
-            try:
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                username = payload.get("sub")
-                if not username:
-                    raise ValueError("Invalid token")
-                user = db.query(User).filter(User.username == username).first()
-                if not user:
-                    raise ValueError("User not found")
-            except (JWTError, ValueError) as e:
-                raise HTTPException(status_code=401, detail=str(e))
+@router.get("/{file_id}/validation")
+def get_validation_report(
+    file_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Outcome of the content checks of an upload: status is pending until the
+    background check has run, then passed, failed (see issues) or error.
+    """
+    file_meta = db.execute(
+        select(FileMeta.id).where(FileMeta.id == file_id, file_visibility_clause(user))
+    ).first()
+    if not file_meta:
+        raise HTTPException(status_code=404, detail="File not found")
+    report = db.get(ValidationReport, file_id)
+    if report is None:
+        return {"file_id": file_id, "status": "pending"}
+    return {
+        "file_id": file_id,
+        **json.loads(report.report),
+        "validated_at": report.validated_at.strftime("%Y-%m-%d %H:%M:%S") if report.validated_at else None
+    }
 
-        # Get file metadata
-        file_meta = db.query(FileMeta).filter(FileMeta.id == file_id).first()
-        if not file_meta:
-            raise HTTPException(status_code=404, detail="File not found")
+@router.get("/{file_id}/versions")
+def get_file_versions(
+    file_id: int,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """Every stored version of the file's report the user can see, oldest first."""
+    file_meta = db.execute(
+        select(FileMeta).where(FileMeta.id == file_id, file_visibility_clause(user))
+    ).scalar_one_or_none()
+    if not file_meta:
+        raise HTTPException(status_code=404, detail="File not found")
+    chain = versions.version_chain(db, file_meta)
+    visible = set(db.execute(
+        select(FileMeta.id).where(FileMeta.id.in_([version.id for version in chain]), file_visibility_clause(user))
+    ).scalars())
+    return [{
+        "id": version.id,
+        "version": version.version or 1,
+        "filename": version.filename,
+        "size": version.size,
+        "sha256": version.sha256,
+        "uploaded_by": version.uploaded_by,
+        "uploaded_at": version.uploaded_at.strftime("%Y-%m-%d %H:%M:%S") if version.uploaded_at else None,
+        "storage_tier": version.storage_tier or "hot"
+    } for version in chain if version.id in visible]
 
-        # Check if user has access to this file
-        if user.role == "admin":
-            pass  # Admin can download any file
-        elif user.role == "employee":
-            if file_meta.client_id != user.client_id:
-                raise HTTPException(status_code=403, detail="Not authorized to download this file")
-        else:  # client user
-            if file_meta.uploaded_by != user.id:
-                raise HTTPException(status_code=403, detail="Not authorized to download this file")
+@router.get("/{file_id}/signatures")
+def get_block_signatures(
+    file_id: int,
+    block_size: int = Query(DELTA_BLOCK_SIZE, ge=versions.MIN_BLOCK_SIZE, le=versions.MAX_BLOCK_SIZE),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Block signatures of a stored file, to send its next version as a delta
+    (POST /files/upload/delta): blocks[i] is [Adler-32, first 16 bytes of
+    SHA-256 in hex] of bytes i * block_size up to (i + 1) * block_size.
+    """
+    file_meta = db.execute(
+        select(FileMeta).where(FileMeta.id == file_id, file_visibility_clause(user))
+    ).scalar_one_or_none()
+    if not file_meta or not file_meta.path:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not os.path.exists(os.path.join(UPLOAD_DIR, file_meta.path)):
+        raise HTTPException(status_code=404, detail="File not found in storage")
+    path = readable_path(file_meta)  # decompressed copy of a cold-tier file
+    return {
+        "file_id": file_id,
+        "size": os.path.getsize(path),
+        "sha256": file_meta.sha256,
+        "block_size": block_size,
+        "blocks": versions.block_signatures(path, block_size)
+    }
 
-        # Get absolute file path
+@router.get("/consolidate")
+def consolidate_files(
+    client_id: int,
+    start_date: date,
+    end_date: date,
+    sheet: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    db: Session = Depends(get_db),
+    user=Depends(get_download_user)
+):
+    """
+    Merge the given sheet (each file's first by default) of every visible
+    file of a client whose period overlaps start_date..end_date into one
+    dataset: columns aligned by header, duplicate rows dropped. Files that
+    cannot be read are skipped and listed in the X-Skipped-Files header.
+    """
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    files = db.execute(
+        select(FileMeta)
+        .where(
+            FileMeta.client_id == client_id,
+            FileMeta.start_date <= end_date,
+            FileMeta.end_date >= start_date,
+            FileMeta.path.isnot(None),
+            file_visibility_clause(user)
+        )
+        .order_by(FileMeta.start_date, FileMeta.id)
+    ).scalars().all()
+    if not files:
+        raise HTTPException(status_code=404, detail="No files in this period")
+    if len(files) > CONSOLIDATE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"More than {CONSOLIDATE_MAX_FILES} files in this period")
+
+    stored, names, hashes, hashed = [], {}, [], []
+    for file_meta in files:
         file_path = os.path.join(UPLOAD_DIR, file_meta.path)
-        
-        # Check if file exists
         if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail=f"File not found at path: {file_path}")
+            continue
+        if file_meta.sha256 is None:  # uploaded before content hashes were recorded
+            file_meta.sha256 = content_hash(file_path)
+            hashed.append(file_meta)
+        stored.append(file_meta)
+        names[file_meta.path] = file_meta.filename
+        hashes.append(file_meta.sha256)
+    if not stored:
+        raise HTTPException(status_code=404, detail="Files not found in storage")
 
-        # Log the download
-        log = LogEntry(user=user.username, action="download", file_id=file_id)
-        db.add(log)
-        db.commit()
+    tags = file_tags(hashed) if hashed else None
+    db.add(LogEntry(user=user.username, action="consolidate", file_id=None))
+    db.commit()
+    if tags:  # listings show the hashes just filled in
+        cache.invalidate_tags(tags)
 
-        # Return file as response
-        return FileResponse(
-            file_path,
-            filename=file_meta.filename,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-    try:
-        # First try to get user from Authorization header
-        try:
-            user = get_current_user(token=None, db=db)
-        except HTTPException:
-            if not token:
-                raise HTTPException(status_code=401, detail="No authentication provided")
-            
-            # If token in query parameter, verify it
-            try:
-                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-                username = payload.get("sub")
-                if not username:
-                    raise ValueError("Invalid token")
-                user = db.query(User).filter(User.username == username).first()
-                if not user:
-                    raise ValueError("User not found")
-            except (JWTError, ValueError) as e:
-                raise HTTPException(status_code=401, detail=str(e))
+    key = consolidate.cache_key(hashes, sheet, format)
+    filename = f"client-{client_id}-{start_date}-{end_date}.{format}"
+    headers = {"Content-Disposition": content_disposition(filename)}
+    cached = consolidate.cached_path(key, format)
+    if os.path.exists(cached):
+        skipped = [path for path in consolidate.cached_skipped(key, format) if path in names]
+        headers["X-Consolidate-Cache"] = "hit"
+        if skipped:
+            headers["X-Skipped-Files"] = ", ".join(quote(names[path]) for path in skipped)
+        return FileResponse(cached, media_type=export.MEDIA_TYPES[format], headers=headers)
 
-        # Get file metadata
-        file_meta = db.query(FileMeta).filter(FileMeta.id == file_id).first()
-        if not file_meta:
-            raise HTTPException(status_code=404, detail="File not found")
+    # Cold-tier files are only decompressed on a miss, by consolidate()
+    chunks, skipped = consolidate.consolidate(stored, sheet, format, key)
+    headers["X-Consolidate-Cache"] = "miss"
+    if skipped:
+        headers["X-Skipped-Files"] = ", ".join(quote(names[path]) for path in skipped)
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[format], headers=headers)
 
-        # Check if user has access to this file
-        if user.role == "admin":
-            pass  # Admin can download any file
-        elif user.role == "employee":
-            if file_meta.client_id != user.client_id:
-                raise HTTPException(status_code=403, detail="Not authorized to download this file")
-        else:  # client user
-            if file_meta.uploaded_by != user.id:
-                raise HTTPException(status_code=403, detail="Not authorized to download this file")
+@router.post("/download-links")
+def create_download_links(
+    request: DownloadLinksRequest,
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Issue short-lived signed URLs for the given files. The links are served by
+    GET /files/signed/{token} without any database access; files that are
+    missing or not visible to the user are reported as skipped.
+    """
+    expires_in = request.expires_in or DOWNLOAD_URL_TTL
+    if not 0 < expires_in <= DOWNLOAD_URL_MAX_TTL:
+        raise HTTPException(status_code=400, detail=f"expires_in must be between 1 and {DOWNLOAD_URL_MAX_TTL} seconds")
 
-        # Get absolute file path and ensure it exists
-        file_path = os.path.join(UPLOAD_DIR, file_meta.path)
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail=f"File not found at path: {file_path}")
+    requested = list(dict.fromkeys(request.file_ids))
+    files = []
+    for session in sharding.sessions(db, user):
+        for i in range(0, len(requested), IN_BATCH_SIZE):
+            files.extend(session.execute(
+                select(FileMeta)
+                .where(FileMeta.id.in_(requested[i:i + IN_BATCH_SIZE]), file_visibility_clause(user))
+            ).scalars().all())
+    links, issued = [], set()
+    for file_meta in files:
+        try:
+            token, expires_at = sign_download(file_meta, user, expires_in)
+        except (OSError, TypeError):  # no stored blob
+            continue
+        issued.add(file_meta.id)
+        links.append({
+            "file_id": file_meta.id,
+            "filename": file_meta.filename,
+            "url": f"/files/signed/{token}",
+            "expires_at": expires_at
+        })
+    return {"links": links, "skipped": sorted(set(request.file_ids) - issued)}
 
-        # Log the download
-        log = LogEntry(user=user.username, action="download", file_id=file_id)
-        db.add(log)
-        db.commit()
+@router.get("/signed/{token}")
+def signed_download(token: str):
+    """Serve a link from POST /files/download-links; the signature replaces user and file lookups."""
+    try:
+        # The blob is checked even when this worker has it cached: a delete
+        # handled by another worker only leaves the blob gone
+        claims = verify_download(token)
+        content = cached_content(claims.get("sha"))
+    except InvalidSignedURL as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    record_access(claims["user"], "download", claims["fid"])
+    return file_response(
+        claims["path"], claims["name"], sha256=claims.get("sha"), content=content, compression=claims.get("z")
+    )
 
-        # Read file content and return as response
-        try:
-            with open(file_path, 'rb') as f:
-                content = f.read()
-                return Response(
-                    content,
-                    headers={
-                        'Content-Disposition': f'attachment; filename="{file_meta.filename}"',
-                        'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                    }
-                )
-        except Exception as e:
-            logger.error(f"Error reading file {file_path}: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
-    except HTTPException as e:
-        logger.error(f"Error downloading file {file_id}: {str(e.detail)}")
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error downloading file {file_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Internal server error")
-    except HTTPException as e:
-        logger.error(f"Error downloading file {file_id}: {str(e.detail)}")
-        raise
+MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB in bytes
+
+def validate_upload(file: UploadFile) -> Optional[str]:
+    """Return why an uploaded file is rejected, or None if it is acceptable."""
+    if not file.filename or not file.filename.lower().endswith(('.xls', '.xlsx')):
+        return "File must be XLS or XLSX"
+    if not is_plain_filename(file.filename):
+        return "File name must not contain a path"
+    if file.size is not None and file.size > MAX_FILE_SIZE:
+        return "File size exceeds 100MB limit"
+    return None
+
+def check_upload_client(db: Session, user, client_id: Optional[int]):
+    """Admins upload on behalf of a client and must name an existing one."""
+    if user.role != "admin":
+        return
+    if client_id is None:
+        logger.error("Error: Admin must provide client_id for upload")
+        raise HTTPException(status_code=400, detail="Client ID is required for admin uploads")
+    client = db.query(Client).filter(Client.id == client_id).first()
+    if not client:
+        logger.error(f"Error: Client {client_id} not found")
+        raise HTTPException(status_code=404, detail="Client not found")
 
 @router.post("/upload")
 async def upload_file(
@@ -375,29 +581,21 @@ async def upload_file(
         logger.info(f"Start date: {start_date}, End date: {end_date}")
         logger.info(f"Client ID: {client_id if user.role == 'admin' else user.client_id}")
         
-        # Validate file type
-        if not file.filename.lower().endswith(('.xls', '.xlsx')):
-            logger.error(f"Error: Invalid file type for {file.filename}")
-            raise HTTPException(status_code=400, detail="File must be XLS or XLSX")
-        
-        # Validate file size (100MB limit)
-        MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB in bytes
-        file_size = file.size
-        if file_size > MAX_FILE_SIZE:
-            logger.error(f"Error: File size {file_size} exceeds limit")
-            raise HTTPException(status_code=400, detail=f"File size exceeds 100MB limit")
+        # Validate file type and size
+        error = validate_upload(file)
+        if error:
+            logger.error(f"Error: {error} ({file.filename})")
+            raise HTTPException(status_code=400, detail=error)
 
         # Validate client_id for admin users
-        if user.role == "admin":
-            if client_id is None:
-                logger.error("Error: Admin must provide client_id for upload")
-                raise HTTPException(status_code=400, detail="Client ID is required for admin uploads")
-            
-            # Verify client exists
-            client = db.query(Client).filter(Client.id == client_id).first()
-            if not client:
-                logger.error(f"Error: Client {client_id} not found")
-                raise HTTPException(status_code=404, detail="Client not found")
+        check_upload_client(db, user, client_id)
+        target_client_id = client_id if user.role == "admin" else user.client_id
+        sharding.bind_client(db, target_client_id)
+
+        # Reject up front when the declared size can't fit; the copy below
+        # enforces the limit on the actual bytes either way
+        remaining = check_quota(db, target_client_id, file.size)
+        reserved = file.size or 0
         
         # Create file metadata first to get the ID
         logger.info("=== Creating File Metadata ===")
@@ -407,12 +605,25 @@ async def upload_file(
                 start_date=start_date,
                 end_date=end_date,
                 uploaded_by=user.id,
-                client_id=client_id if user.role == "admin" else user.client_id
+                client_id=target_client_id
+            )
+            # A re-upload of the same report becomes its next version
+            versions.link_version(
+                file_meta, versions.previous_version(db, target_client_id, file.filename, start_date, end_date)
             )
             db.add(file_meta)
+            # Hold the declared bytes while copying so concurrent uploads can't overrun the quota
+            if not reserve_quota(db, target_client_id, reserved):
+                db.rollback()
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Storage quota exceeded: {remaining_quota(db, target_client_id)} bytes remaining"
+                )
             db.commit()
             db.refresh(file_meta)
             logger.info(f"File metadata created with ID: {file_meta.id}")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error creating file metadata: {str(e)}")
             db.rollback()
@@ -421,30 +632,45 @@ async def upload_file(
         # Save file to disk using the generated ID
         logger.info("=== Saving File to Disk ===")
         try:
-            file_path = os.path.join(UPLOAD_DIR, str(file_meta.id) + "_" + file.filename)
+            file_path = storage_path(file_meta.id, file.filename)
             logger.info(f"File path: {file_path}")
             logger.info(f"Storage directory: {UPLOAD_DIR}")
-            
-            # Ensure storage directory exists
-            os.makedirs(UPLOAD_DIR, exist_ok=True)
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
+
+            digest = hashlib.sha256()
+            size = await run_in_threadpool(save_stream, file.file, file_path, remaining, digest)
             logger.info("File saved to disk successfully")
         except Exception as e:
             logger.error(f"Error saving file: {str(e)}")
             db.rollback()
+            db.delete(file_meta)
+            record_usage(db, target_client_id, None, -reserved, 0)
+            db.commit()
+            if isinstance(e, StorageLimitExceeded):
+                raise HTTPException(status_code=413, detail=f"Storage quota exceeded: {remaining} bytes remaining")
             raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
-        # Update the file path in the database
+        # Update the file path and usage counters in the database
         logger.info("=== Updating File Path ===")
         try:
             file_meta.path = file_path
+            file_meta.size = size
+            file_meta.sha256 = digest.hexdigest()
+            if not settle_quota(db, file_meta.client_id, user.id, reserved, size):
+                raise StorageLimitExceeded("Upload exceeds the remaining storage quota")
             db.commit()
             logger.info("File path updated in database")
         except Exception as e:
             logger.error(f"Error updating file path: {str(e)}")
             db.rollback()
+            remove_quietly(file_path)
+            db.delete(file_meta)
+            record_usage(db, target_client_id, None, -reserved, 0)
+            db.commit()
+            if isinstance(e, StorageLimitExceeded):
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Storage quota exceeded: {remaining_quota(db, target_client_id)} bytes remaining"
+                )
             raise HTTPException(status_code=500, detail=f"Failed to update file path: {str(e)}")
 
         # Log the upload
@@ -459,118 +685,285 @@ async def upload_file(
             db.rollback()
             raise HTTPException(status_code=500, detail=f"Failed to log upload: {str(e)}")
 
+        content_index.schedule_indexing([file_meta.id])
+        validation.schedule_validation([file_meta])
+        cache.invalidate_tags(file_tags([file_meta]))
+        # The database broker writes the event; keep that off the event loop
+        await run_in_threadpool(events.publish, [events.file_event("file.uploaded", file_meta)])
         logger.info(f"=== Upload Successful ===")
-        return {"msg": "File uploaded successfully", "file_id": file_meta.id}
+        return {"msg": "File uploaded successfully", "file_id": file_meta.id, "version": file_meta.version}
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         logger.error(f"=== Upload Failed ===")
         logger.error(f"Error during upload: {str(e)}")
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    except Exception as e:
-        logger.error(f"Error downloading file {file_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/upload/batch")
+async def upload_files_batch(
+    files: List[UploadFile] = File(...),
+    start_dates: List[date] = Form(...),
+    end_dates: List[date] = Form(...),
+    client_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Upload many files in one request. start_dates[i] and end_dates[i] belong to
+    files[i]. Files are written to storage concurrently and all metadata and
+    log rows are committed in a single transaction; the response reports the
+    outcome of every file in request order.
+    """
+    if not (len(files) == len(start_dates) == len(end_dates)):
+        raise HTTPException(status_code=400, detail="Each file needs exactly one start_date and end_date")
+    check_upload_client(db, user, client_id)
+    target_client_id = client_id if user.role == "admin" else user.client_id
+    sharding.bind_client(db, target_client_id)
+    logger.info(f"Batch upload of {len(files)} files by {user.username} for client {target_client_id}")
+
+    results = [{"filename": file.filename} for file in files]
+    admitted = []  # (index, file)
+    for index, file in enumerate(files):
+        error = validate_upload(file)
+        if not error and start_dates[index] > end_dates[index]:
+            error = "start_date must not be after end_date"
+        # Files are admitted in request order until the quota is used up; their
+        # declared bytes are reserved so concurrent uploads can't overrun it
+        if not error and not reserve_quota(db, target_client_id, file.size or 0):
+            error = f"Storage quota exceeded: {remaining_quota(db, target_client_id)} bytes remaining"
+        if error:
+            results[index].update(status="failed", error=error)
+            continue
+        admitted.append((index, file))
     try:
-        logger.info(f"=== Upload Request Received ===")
-        logger.info(f"User: {user.username} (ID: {user.id}, Role: {user.role})")
-        logger.info(f"File info: {file.filename}, size: {file.size} bytes")
-        logger.info(f"Start date: {start_date}, End date: {end_date}")
-        logger.info(f"Client ID: {user.client_id if hasattr(user, 'client_id') else 'None'}")
-        
-        # Validate file type
-        if not file.filename.lower().endswith(('.xls', '.xlsx')):
-            logger.error(f"Error: Invalid file type for {file.filename}")
-            raise HTTPException(status_code=400, detail="File must be XLS or XLSX")
-        
-        # Validate file size (100MB limit)
-        MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB in bytes
-        file_size = file.size
-        if file_size > MAX_FILE_SIZE:
-            logger.error(f"Error: File size {file_size} exceeds limit")
-            raise HTTPException(status_code=400, detail=f"File size exceeds 100MB limit")
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error reserving storage for batch upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to reserve storage: {str(e)}")
+    reserved = sum(file.size or 0 for _, file in admitted)
 
-        # Create file metadata first to get the ID
-        logger.info("=== Creating File Metadata ===")
+    def release_reservations():
         try:
-            file_meta = FileMeta(
-                filename=file.filename,
-                start_date=start_date,
-                end_date=end_date,
-                uploaded_by=user.id,
-                client_id=getattr(user, 'client_id', None)  # Get client_id safely
-            )
-            db.add(file_meta)
+            record_usage(db, target_client_id, None, -reserved, 0)
             db.commit()
-            db.refresh(file_meta)
-            logger.info(f"File metadata created with ID: {file_meta.id}")
         except Exception as e:
-            logger.error(f"Error creating file metadata: {str(e)}")
             db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to create file metadata: {str(e)}")
+            logger.error(f"Error releasing reserved storage of batch upload: {str(e)}")
 
-        # Save file to disk using the generated ID
-        logger.info("=== Saving File to Disk ===")
-        try:
-            file_path = os.path.join(UPLOAD_DIR, str(file_meta.id) + "_" + file.filename)
-            logger.info(f"File path: {file_path}")
-            logger.info(f"Storage directory: {UPLOAD_DIR}")
-            
-            # Ensure storage directory exists
-            os.makedirs(UPLOAD_DIR, exist_ok=True)
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            logger.info("File saved to disk successfully")
-        except Exception as e:
-            logger.error(f"Error saving file: {str(e)}")
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    pending = []  # (index, file, file_meta, byte limit)
+    remaining = remaining_quota(db, target_client_id)  # unreserved bytes, for files of unknown size
+    for index, file in admitted:
+        limit = None if remaining is None else (file.size or 0) + remaining
+        file_meta = FileMeta(
+            filename=file.filename,
+            start_date=start_dates[index],
+            end_date=end_dates[index],
+            uploaded_by=user.id,
+            client_id=target_client_id
+        )
+        versions.link_version(file_meta, versions.previous_version(
+            db, target_client_id, file.filename, start_dates[index], end_dates[index]
+        ))
+        db.add(file_meta)
+        pending.append((index, file, file_meta, limit))
 
-        # Update the file path in the database
-        logger.info("=== Updating File Path ===")
-        try:
-            file_meta.path = file_path
-            db.commit()
-            logger.info("File path updated in database")
-        except Exception as e:
-            logger.error(f"Error updating file path: {str(e)}")
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to update file path: {str(e)}")
+    try:
+        # Assign ids (needed for the storage names) without committing yet
+        db.flush()
+    except Exception as e:
+        db.rollback()
+        release_reservations()
+        logger.error(f"Error creating batch file metadata: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to create file metadata: {str(e)}")
 
-        # Log the upload
-        logger.info("=== Logging Upload ===")
-        try:
-            log = LogEntry(user=user.username, action="upload", file_id=file_meta.id)
-            db.add(log)
-            db.commit()
-            logger.info("Upload logged successfully")
-        except Exception as e:
-            logger.error(f"Error logging upload: {str(e)}")
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to log upload: {str(e)}")
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
 
-        logger.info(f"=== Upload Successful ===")
-        return {"msg": "File uploaded successfully", "file_id": file_meta.id}
+    async def save(file, file_meta, limit):
+        async with semaphore:
+            path = storage_path(file_meta.id, file.filename)
+            digest = hashlib.sha256()
+            size = await run_in_threadpool(save_stream, file.file, path, limit, digest)
+            return path, size, digest.hexdigest()
+
+    outcomes = await asyncio.gather(
+        *(save(file, file_meta, limit) for _, file, file_meta, limit in pending),
+        return_exceptions=True
+    )
+
+    written, uploaded_events, checks = [], [], []
+    for (index, file, file_meta, _), outcome in zip(pending, outcomes):
+        if not isinstance(outcome, Exception) and not settle_quota(
+            db, target_client_id, user.id, file.size or 0, outcome[1]
+        ):
+            outcome = StorageLimitExceeded("Upload exceeds the remaining storage quota")
+        if isinstance(outcome, Exception):
+            logger.error(f"Error saving {file.filename}: {str(outcome)}")
+            remove_quietly(storage_path(file_meta.id, file.filename))
+            db.delete(file_meta)
+            record_usage(db, target_client_id, None, -(file.size or 0), 0)
+            if isinstance(outcome, StorageLimitExceeded):
+                error = f"Storage quota exceeded: {remaining_quota(db, target_client_id)} bytes remaining"
+            else:
+                error = f"Failed to save file: {str(outcome)}"
+            results[index].update(status="failed", error=error)
+            continue
+        file_meta.path, file_meta.size, file_meta.sha256 = outcome
+        written.append(file_meta.path)
+        uploaded_events.append(events.file_event("file.uploaded", file_meta))
+        checks.append(SimpleNamespace(id=file_meta.id, path=file_meta.path, client_id=file_meta.client_id,
+                                      uploaded_by=file_meta.uploaded_by, start_date=file_meta.start_date,
+                                      end_date=file_meta.end_date))
+        db.add(LogEntry(user=user.username, action="upload", file_id=file_meta.id))
+        results[index].update(status="uploaded", file_id=file_meta.id, version=file_meta.version)
+
+    try:
+        db.commit()
     except Exception as e:
-        logger.error(f"=== Upload Failed ===")
-        logger.error(f"Error during upload: {str(e)}")
         db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+        for path in written:
+            remove_quietly(path)
+        release_reservations()
+        logger.error(f"Error committing batch upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to record uploads: {str(e)}")
 
+    content_index.schedule_indexing(result["file_id"] for result in results if result["status"] == "uploaded")
+    validation.schedule_validation(checks)
+    if checks:
+        cache.invalidate_tags(file_tags(checks))
+    await run_in_threadpool(events.publish, uploaded_events)
+    uploaded = sum(1 for result in results if result["status"] == "uploaded")
+    logger.info(f"Batch upload finished: {uploaded} uploaded, {len(results) - uploaded} failed")
+    return {
+        "msg": f"{uploaded} of {len(results)} files uploaded",
+        "uploaded": uploaded,
+        "failed": len(results) - uploaded,
+        "results": results
+    }
 
-        return {"msg": "File uploaded successfully", "file_id": file_meta.id}
+@router.post("/upload/delta")
+def upload_delta(
+    base_file_id: int = Form(...),
+    start_date: date = Form(...),
+    end_date: date = Form(...),
+    block_size: int = Form(..., ge=versions.MIN_BLOCK_SIZE, le=versions.MAX_BLOCK_SIZE),
+    ops: str = Form(...),
+    sha256: str = Form(...),
+    filename: Optional[str] = Form(None),
+    data: Optional[UploadFile] = File(None),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    """
+    Upload the next version of a file as a delta against it (see
+    app/versions.py): ops reuse blocks of the base file (as listed by GET
+    /files/{id}/signatures with this block_size) or take the next bytes of
+    data. The rebuilt file must have the given SHA-256, otherwise it is
+    rejected and the whole file should be uploaded. The file belongs to the
+    base file's client, keeps its filename unless one is given and, like a
+    whole upload, becomes the next version after the latest of its report.
+    """
+    if user.role == "admin":
+        sharding.bind_client(db, sharding.file_client(base_file_id))
+    base = db.execute(
+        select(FileMeta).where(FileMeta.id == base_file_id, file_visibility_clause(user))
+    ).scalar_one_or_none()
+    if not base or not base.path or not os.path.exists(os.path.join(UPLOAD_DIR, base.path)):
+        raise HTTPException(status_code=404, detail="Base file not found")
+    filename = filename or base.filename
+    if not filename.lower().endswith(('.xls', '.xlsx')):
+        raise HTTPException(status_code=400, detail="File must be XLS or XLSX")
+    if not is_plain_filename(filename):
+        raise HTTPException(status_code=400, detail="File name must not contain a path")
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+
+    base_path = readable_path(base)
+    try:
+        parsed, size = versions.parse_ops(ops, os.path.getsize(base_path), block_size)
+    except versions.DeltaError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail="File size exceeds 100MB limit")
+    if not reserve_quota(db, base.client_id, size):
+        db.rollback()
+        raise HTTPException(
+            status_code=413, detail=f"Storage quota exceeded: {remaining_quota(db, base.client_id)} bytes remaining"
+        )
+
+    file_meta = FileMeta(
+        filename=filename,
+        start_date=start_date,
+        end_date=end_date,
+        uploaded_by=user.id,
+        client_id=base.client_id
+    )
+    # The next version of the report, which needn't be the base: a delta may
+    # be computed against any version the client still has
+    versions.link_version(
+        file_meta, versions.previous_version(db, base.client_id, filename, start_date, end_date)
+    )
+    db.add(file_meta)
+    db.commit()
+    db.refresh(file_meta)
+
+    file_path = storage_path(file_meta.id, filename)
+    digest = hashlib.sha256()
+    try:
+        versions.rebuild(base_path, parsed, data.file if data else io.BytesIO(), file_path, digest)
+        if digest.hexdigest() != sha256.lower():
+            remove_quietly(file_path)
+            raise versions.DeltaError("The rebuilt file doesn't match sha256; upload the whole file instead")
     except Exception as e:
-        print(f"Error during upload: {str(e)}")
+        logger.error(f"Error rebuilding delta upload of file {base_file_id}: {str(e)}")
         db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+        db.delete(file_meta)
+        record_usage(db, base.client_id, None, -size, 0)
+        db.commit()
+        if isinstance(e, versions.DeltaError):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+
+    file_meta.path = file_path
+    file_meta.size = size
+    file_meta.sha256 = digest.hexdigest()
+    settle_quota(db, file_meta.client_id, user.id, size, size)
+    db.add(LogEntry(user=user.username, action="upload", file_id=file_meta.id))
+    db.commit()
+
+    content_index.schedule_indexing([file_meta.id])
+    validation.schedule_validation([file_meta])
+    cache.invalidate_tags(file_tags([file_meta]))
+    events.publish([events.file_event("file.uploaded", file_meta)])
+    received = sum(op[1] for op in parsed if op[0] == "data")
+    logger.info(f"Delta upload of file {file_meta.id} (version {file_meta.version}) by {user.username}: "
+                f"{received} of {size} bytes sent")
+    return {
+        "msg": "File uploaded successfully",
+        "file_id": file_meta.id,
+        "version": file_meta.version,
+        "previous_version_id": file_meta.previous_version_id,
+        "bytes_received": received
+    }
 
 @router.get("/list")
 def list_files(db: Session = Depends(get_db), user=Depends(get_current_user)):
     if user.role == "admin":
-        return db.query(FileMeta).all()
+        query, scope = db.query(FileMeta), "files"
     elif user.role == "employee":
-        return db.query(FileMeta).filter(FileMeta.client_id == user.client_id).all()
+        query, scope = db.query(FileMeta).filter(FileMeta.client_id == user.client_id), f"client:{user.client_id}"
     else:
-        return db.query(FileMeta).filter(FileMeta.uploaded_by == user.id).all()
+        query, scope = db.query(FileMeta).filter(FileMeta.uploaded_by == user.id), f"uploader:{user.id}"
+
+    def load():
+        results = []
+        for session in sharding.sessions(db, user):
+            results.extend(jsonable_encoder(query.with_session(session).all()))
+        return results
+
+    return cache.get_or_compute(f"list:{scope}", QUERY_CACHE_TTL, load, tags=[scope])
 
 @router.delete("/delete/{file_id}")
 def delete_file(
@@ -600,6 +993,14 @@ def delete_file(
             os.remove(file_meta.path)
 
         # Delete from database
+        content_index.remove_files(db, [file_id])
+        validation.remove_reports(db, [file_id])
+        columnar.remove_files([file_id])
+        blob_cache.invalidate(file_meta.sha256)
+        remove_thawed(file_meta)
+        release_usage(db, [file_meta])
+        deleted_event = events.file_event("file.deleted", file_meta)
+        tags = file_tags([file_meta])
         db.delete(file_meta)
         db.commit()
 
@@ -607,56 +1008,98 @@ def delete_file(
         log = LogEntry(user=user.username, action="delete", file_id=file_id)
         db.add(log)
         db.commit()
+        cache.invalidate_tags(tags)
+        events.publish([deleted_event])
 
         return {"msg": "File deleted successfully"}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi.responses import FileResponse
-
-@router.get("/download/{file_id}")
-def download_file(
-    file_id: int,
+@router.post("/delete/bulk")
+def delete_files_bulk(
+    request: BulkDeleteRequest,
     db: Session = Depends(get_db),
-    token: str = Query(None),
     user=Depends(get_current_user)
 ):
-    try:
-        # If token is provided as query parameter, validate it
-        if token:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            user = db.query(User).filter(User.username == payload.get("sub")).first()
-            if not user:
-                raise HTTPException(status_code=401, detail="User not found")
-    except (JWTError, AttributeError):
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    file_meta = db.query(FileMeta).filter(FileMeta.id == file_id).first()
-    
-    if not file_meta:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    # Check if user has permission to download
-    if user.role == "admin":
-        pass  # Admins can download any file
-    elif user.role == "employee":
-        if file_meta.client_id != user.client_id:
-            raise HTTPException(status_code=403, detail="Not authorized to download this file")
-    elif user.role == "client":
-        if file_meta.uploaded_by != user.id:
-            raise HTTPException(status_code=403, detail="Not authorized to download this file")
+    """
+    Delete many files by id list and/or filter (client, date range, uploaded
+    before). Files the user may not manage are skipped and reported; the
+    stored blobs are removed in the background after the commit.
+    """
+    criteria = []
+    if request.client_id is not None:
+        criteria.append(FileMeta.client_id == request.client_id)
+    if request.start_date is not None:
+        criteria.append(FileMeta.start_date >= request.start_date)
+    if request.end_date is not None:
+        criteria.append(FileMeta.end_date <= request.end_date)
+    if request.uploaded_before is not None:
+        criteria.append(FileMeta.uploaded_at < request.uploaded_before)
+    if not criteria and request.file_ids is None:
+        raise HTTPException(status_code=400, detail="Provide file_ids or at least one filter")
+    # Listed ids are selected in batches as well
+    if request.file_ids is not None:
+        listed = list(dict.fromkeys(request.file_ids))
+        selections = [
+            FileMeta.id.in_(listed[i:i + IN_BATCH_SIZE]) for i in range(0, len(listed), IN_BATCH_SIZE)
+        ]
     else:
-        raise HTTPException(status_code=403, detail="Not authorized to download this file")
-    
-    # Log the download
-    log = LogEntry(user=user.username, action="download", file_id=file_id)
-    db.add(log)
-    db.commit()
-    
-    # Return the file
-    return FileResponse(
-        file_meta.path,  # Use the stored path
-        filename=file_meta.name,
-        media_type=file_meta.type
-    )
+        selections = [true()]
+
+    if user.role == "admin" and request.client_id is not None:
+        sharding.bind_client(db, request.client_id)
+
+    # One transaction per database: with shards, those committed before a failure stay deleted
+    rows, file_ids, error = [], [], None
+    for session in sharding.sessions(db, user):
+        try:
+            # Selection and permission check in a single query per batch
+            found = []
+            for selection in selections:
+                found.extend(session.execute(
+                    select(
+                        FileMeta.id, FileMeta.filename, FileMeta.path, FileMeta.client_id, FileMeta.uploaded_by,
+                        FileMeta.size, FileMeta.sha256, FileMeta.compression
+                    )
+                    .where(selection, *criteria, file_visibility_clause(user))
+                ).all())
+            found_ids = [row.id for row in found]
+
+            for i in range(0, len(found_ids), IN_BATCH_SIZE):
+                batch = found_ids[i:i + IN_BATCH_SIZE]
+                session.execute(delete(FileMeta).where(FileMeta.id.in_(batch)))
+            content_index.remove_files(session, found_ids)
+            validation.remove_reports(session, found_ids)
+            release_usage(session, found)
+            if found_ids:
+                session.execute(insert(LogEntry), [
+                    {"user": user.username, "action": "delete", "file_id": file_id} for file_id in found_ids
+                ])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error in bulk delete: {str(e)}")
+            error = e
+            break
+        rows.extend(found)
+        file_ids.extend(found_ids)
+
+    schedule_removal(row.path for row in rows)
+    columnar.remove_files(file_ids)
+    for row in rows:
+        blob_cache.invalidate(row.sha256)
+        remove_thawed(row)
+    if rows:
+        cache.invalidate_tags(file_tags(rows))
+    events.publish(events.file_event("file.deleted", row) for row in rows)
+    if error is not None:
+        raise HTTPException(status_code=500, detail=str(error))
+
+    skipped = sorted(set(request.file_ids or []) - set(file_ids))
+    logger.info(f"Bulk delete by {user.username}: {len(file_ids)} deleted, {len(skipped)} skipped")
+    return {
+        "msg": f"{len(file_ids)} files deleted",
+        "deleted": file_ids,
+        "skipped": skipped  # not found or not authorized
+    }
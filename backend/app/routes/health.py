@@ -0,0 +1,40 @@
+import os
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from ..database import engine
+from ..config import UPLOAD_DIR
+from ..process import rss_bytes
+from ..profiling import ProfiledRoute
+
+router = APIRouter(prefix="/health", tags=["health"], route_class=ProfiledRoute)
+
+@router.get("/live")
+def liveness():
+    """The worker is up and serving requests. Does not touch dependencies."""
+    return {"status": "alive"}
+
+@router.get("/ready")
+def readiness(request: Request):
+    """The worker can serve traffic: the database answers and storage is writable."""
+    checks = {}
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"error: {str(e)}"
+
+    if not os.path.isdir(UPLOAD_DIR):
+        checks["storage"] = f"error: {UPLOAD_DIR} does not exist"
+    elif not os.access(UPLOAD_DIR, os.W_OK):
+        checks["storage"] = f"error: {UPLOAD_DIR} is not writable"
+    else:
+        checks["storage"] = "ok"
+
+    ready = all(result == "ok" for result in checks.values())
+    worker = dict(getattr(request.app.state, "startup", {}), rss_mb=round(rss_bytes() / 2**20, 1))
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "unavailable", "checks": checks, "worker": worker},
+    )
@@ -0,0 +1,67 @@
+import logging
+from sqlalchemy import inspect, text
+from .database import Base
+from .search import ensure_search_index
+from .database import SessionLocal
+from .config import SHARDING_ENABLED
+from . import usage, sharding
+
+logger = logging.getLogger(__name__)
+
+
+def _tables(names=None):
+    return [table for table in Base.metadata.sorted_tables if names is None or table.name in names]
+
+
+def missing_schema(engine, tables=None):
+    """Return the tables and (table, column) pairs the database is missing (of tables, default all)."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    missing_tables, missing_columns = [], []
+    for table in _tables(tables):
+        if table.name not in existing_tables:
+            missing_tables.append(table.name)
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        missing_columns.extend((table.name, column) for column in table.columns if column.name not in existing_columns)
+    return missing_tables, missing_columns
+
+
+def ensure_schema(engine, tables=None) -> bool:
+    """
+    Create missing tables and add missing (nullable) columns, limited to the
+    named tables if given. Returns False without issuing any DDL when the
+    schema is already current.
+    """
+    missing_tables, missing_columns = missing_schema(engine, tables)
+    if not missing_tables and not missing_columns:
+        return False
+
+    if missing_tables:
+        logger.info(f"Creating tables: {', '.join(missing_tables)}")
+        Base.metadata.create_all(bind=engine, tables=_tables(tables))
+    with engine.begin() as conn:
+        for table_name, column in missing_columns:
+            column_type = column.type.compile(dialect=engine.dialect)
+            logger.info(f"Adding column {table_name}.{column.name} ({column_type})")
+            conn.execute(text(f'ALTER TABLE {table_name} ADD COLUMN "{column.name}" {column_type}'))
+    return True
+
+
+def prepare_database(engine):
+    """Bring tables, columns and auxiliary indexes (search) up to date."""
+    new_tables = missing_schema(engine)[0]
+    ensure_schema(engine)
+    ensure_search_index(engine)
+    if SHARDING_ENABLED and engine.dialect.name == "sqlite":
+        sharding.use_wal(engine)
+        for shard in sharding.shard_engines():
+            # Shards hold only the tenant tables; users and clients come from the catalog
+            ensure_schema(shard, sharding.TENANT_TABLES)
+    if "client_usage" in new_tables:
+        # First start with usage accounting: build the counters from existing files
+        db = SessionLocal()
+        try:
+            usage.reconcile(db)
+        finally:
+            db.close()
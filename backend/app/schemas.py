@@ -1,5 +1,6 @@
-from typing import Optional
-from pydantic import BaseModel
+from datetime import date, datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
 
 class User(BaseModel):
     id: Optional[int] = None
@@ -27,3 +28,32 @@ class LogEntry(BaseModel):
     action: str
     file_id: int
     timestamp: str
+
+class BulkDeleteRequest(BaseModel):
+    file_ids: Optional[List[int]] = None
+    client_id: Optional[int] = None
+    start_date: Optional[date] = None  # files whose period starts on or after this date
+    end_date: Optional[date] = None  # files whose period ends on or before this date
+    uploaded_before: Optional[datetime] = None
+
+class QuotaUpdate(BaseModel):
+    quota_bytes: Optional[int] = Field(None, ge=0)  # None falls back to DEFAULT_CLIENT_QUOTA_BYTES, 0 = unlimited
+
+class LifecycleUpdate(BaseModel):
+    # Days after a file's end_date; None falls back to the LIFECYCLE_* defaults, 0 = never
+    cold_after_days: Optional[int] = None
+    purge_after_days: Optional[int] = None
+
+class DownloadLinksRequest(BaseModel):
+    file_ids: List[int]
+    expires_in: Optional[int] = None  # seconds, defaults to DOWNLOAD_URL_TTL
+
+class BootstrapQuery(BaseModel):
+    name: str  # files, history, clients, overview, logs, usage
+    key: Optional[str] = None  # key of the result, defaults to name
+    client_id: Optional[int] = None  # history
+    activity_days: int = 30  # overview
+    limit: Optional[int] = None  # logs
+
+class BootstrapRequest(BaseModel):
+    queries: List[BootstrapQuery]
@@ -0,0 +1,194 @@
+import logging
+import re
+from sqlalchemy import text, select, or_, func, column, table, literal_column
+from .models import FileMeta, Client, User
+
+logger = logging.getLogger(__name__)
+
+# Minimum share of a query token's trigrams that must occur in a field for a
+# fuzzy match (same idea as pg_trgm's word_similarity).
+FUZZY_THRESHOLD = 0.4
+
+# SQLite: an FTS5 trigram index over filename, client name and uploader, kept
+# in sync with the source tables by triggers. The trigram tokenizer answers
+# substring (and so prefix) matches from the index.
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS files_fts
+       USING fts5(filename, client_name, uploader, tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+         INSERT INTO files_fts(rowid, filename, client_name, uploader) VALUES (
+           new.id, new.filename,
+           (SELECT name FROM clients WHERE id = new.client_id),
+           (SELECT username FROM users WHERE id = new.uploaded_by));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+         DELETE FROM files_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF filename, client_id, uploaded_by ON files BEGIN
+         DELETE FROM files_fts WHERE rowid = old.id;
+         INSERT INTO files_fts(rowid, filename, client_name, uploader) VALUES (
+           new.id, new.filename,
+           (SELECT name FROM clients WHERE id = new.client_id),
+           (SELECT username FROM users WHERE id = new.uploaded_by));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS clients_fts_update AFTER UPDATE OF name ON clients BEGIN
+         UPDATE files_fts SET client_name = new.name
+         WHERE rowid IN (SELECT id FROM files WHERE client_id = new.id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username ON users BEGIN
+         UPDATE files_fts SET uploader = new.username
+         WHERE rowid IN (SELECT id FROM files WHERE uploaded_by = new.id);
+       END""",
+]
+
+# Tenant shards (app/sharding.py) keep their own index. Shard connections see
+# clients and users only in the attached catalog, which stored triggers may not
+# reference, so each connection creates the files triggers as TEMP triggers.
+# Renaming a client or user does not update the shards' indexes.
+SQLITE_SHARD_INDEX = SQLITE_DDL[0]
+SQLITE_SHARD_TRIGGERS = [
+    statement.replace("CREATE TRIGGER", "CREATE TEMP TRIGGER", 1).replace(" ON files BEGIN", " ON main.files BEGIN", 1)
+    for statement in SQLITE_DDL[1:4]
+]
+
+SQLITE_BACKFILL = """
+    INSERT INTO files_fts(rowid, filename, client_name, uploader)
+    SELECT files.id, files.filename, clients.name, users.username
+    FROM files
+    LEFT JOIN clients ON clients.id = files.client_id
+    LEFT JOIN users ON users.id = files.uploaded_by
+"""
+
+# PostgreSQL: trigram GIN indexes serve ILIKE '%...%' and similarity matches.
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_files_filename_trgm ON files USING gin (filename gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_clients_name_trgm ON clients USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)",
+]
+
+files_fts = table("files_fts", column("rowid"), column("rank"),
+                  column("filename"), column("client_name"), column("uploader"))
+
+
+def ensure_search_index(engine):
+    """Create the search index and its sync triggers, backfilling if needed."""
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            for statement in SQLITE_DDL:
+                conn.execute(text(statement))
+            index_empty = conn.execute(text("SELECT 1 FROM files_fts LIMIT 1")).first() is None
+            if index_empty and conn.execute(text("SELECT 1 FROM files LIMIT 1")).first() is not None:
+                logger.info("Backfilling filename search index")
+                conn.execute(text(SQLITE_BACKFILL))
+        elif engine.dialect.name == "postgresql":
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+
+
+def trigrams(value: str):
+    """Unpadded trigrams, as stored by the FTS5 trigram tokenizer."""
+    value = value.lower()
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def word_trigrams(value: str):
+    """Trigrams of each word padded like pg_trgm, so word edges count too."""
+    grams = set()
+    for word in re.findall(r"[a-z0-9]+", value.lower()):
+        grams |= trigrams(f"  {word} ")
+    return grams
+
+
+def word_similarity(token: str, value) -> float:
+    """Share of the token's trigrams found in value."""
+    token_trigrams = word_trigrams(token)
+    if not value or not token_trigrams:
+        return 0.0
+    return len(token_trigrams & word_trigrams(value)) / len(token_trigrams)
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def tokenize_query(q: str):
+    return [token for token in re.split(r"\s+", q.strip()) if token]
+
+
+def search_files(db, q: str, fuzzy: bool, filters, limit: int):
+    """
+    Return (FileMeta, client name, uploader) rows matching every token of q in
+    the filename, client name or uploader. `filters` are extra SQL conditions
+    (visibility, date range). Fuzzy mode tolerates typos by matching on shared
+    trigrams and re-ranking candidates by word similarity.
+    """
+    tokens = tokenize_query(q)
+    if not tokens:
+        return []
+
+    query = (
+        select(FileMeta, Client.name, User.username)
+        .outerjoin(Client, Client.id == FileMeta.client_id)
+        .outerjoin(User, User.id == FileMeta.uploaded_by)
+        .where(*filters)
+    )
+    dialect = db.get_bind().dialect.name
+    candidate_limit = limit * 10 if fuzzy else limit
+
+    if dialect == "sqlite":
+        long_tokens = [token for token in tokens if len(token) >= 3]
+        short_tokens = [token for token in tokens if len(token) < 3]
+        query = query.join(files_fts, files_fts.c.rowid == FileMeta.id)
+        if long_tokens:
+            if fuzzy:
+                # Rank candidates sharing the most trigrams first
+                grams = sorted(set().union(*(trigrams(token) for token in long_tokens)))
+                match = " OR ".join(_fts_phrase(gram) for gram in grams)
+                query = query.order_by(files_fts.c.rank)
+            else:
+                match = " AND ".join(_fts_phrase(token) for token in long_tokens)
+            query = query.where(literal_column("files_fts").op("MATCH")(match))
+        # Newest first; walking the index in rowid order lets LIMIT stop early
+        # even when a common word matches most files.
+        query = query.order_by(files_fts.c.rowid.desc())
+        # Trigrams need 3 characters; shorter tokens fall back to prefix matches
+        for token in short_tokens:
+            pattern = token.replace("%", r"\%").replace("_", r"\_") + "%"
+            query = query.where(or_(
+                files_fts.c.filename.like(pattern, escape="\\"),
+                files_fts.c.client_name.like(pattern, escape="\\"),
+                files_fts.c.uploader.like(pattern, escape="\\"),
+            ))
+    elif dialect == "postgresql" and fuzzy:
+        scores = [func.greatest(
+            func.word_similarity(token, FileMeta.filename),
+            func.word_similarity(token, func.coalesce(Client.name, "")),
+            func.word_similarity(token, func.coalesce(User.username, "")),
+        ) for token in tokens]
+        query = query.where(*(score >= FUZZY_THRESHOLD for score in scores)).order_by(sum(scores).desc())
+    else:
+        for token in tokens:
+            pattern = "%" + token.replace("%", r"\%").replace("_", r"\_") + "%"
+            query = query.where(or_(
+                FileMeta.filename.ilike(pattern, escape="\\"),
+                Client.name.ilike(pattern, escape="\\"),
+                User.username.ilike(pattern, escape="\\"),
+            ))
+
+    if dialect != "sqlite":
+        query = query.order_by(FileMeta.uploaded_at.desc())
+    rows = db.execute(query.limit(candidate_limit)).all()
+    if not (fuzzy and dialect == "sqlite"):
+        return rows[:limit]
+
+    scored = []
+    for row in rows:
+        fields = (row[0].filename, row[1], row[2])
+        # Short tokens were already matched as prefixes in SQL
+        scores = [max(word_similarity(token, field) for field in fields) if len(token) >= 3 else 1.0
+                  for token in tokens]
+        if min(scores) >= FUZZY_THRESHOLD:
+            scored.append((sum(scores), row))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return [row for _, row in scored[:limit]]
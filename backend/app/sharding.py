@@ -0,0 +1,257 @@
+"""
+Tenant sharding (SHARDING_ENABLED).
+
+A client split off with scripts/split_tenants.py gets its own SQLite database
+under SHARD_DIR for its rows of the tenant tables (files, logs, cell index,
+validation reports, usage counters) and its own storage root under
+UPLOAD_DIR/tenants/<client_id>/, so uploads, deletes and audit writes of
+different tenants no longer queue on one write lock. The main database is
+the catalog: users, clients, tenant_shards, what all workers share (events,
+admission, cache tags) and the rows of clients not split off. Shard
+connections ATTACH the catalog, so users and clients resolve in every
+session and queries need no changes.
+
+File ids stay unique without coordination: a shard's files and logs tables
+count from client_id << TENANT_ID_SHIFT, so a new file's tenant is its id
+shifted back. Files moved by the split keep their ids and are looked up in
+sharded_files.
+
+get_db() routes each request by its token: a client or employee goes to its
+tenant, an admin to the tenant of the file_id or client_id in the URL, and
+to the catalog otherwise, where sessions() runs cross-tenant views over
+every shard.
+"""
+import datetime
+import logging
+import threading
+import time
+from typing import Optional
+from jose import JWTError, jwt
+from sqlalchemy import MetaData, create_engine, event, select, text
+from .config import SHARDING_ENABLED, SHARD_DIR, SECRET_KEY, ALGORITHM
+from .database import Base, engine, SessionLocal
+from .models import TenantShard, ShardedFile
+from .search import SQLITE_SHARD_INDEX, SQLITE_SHARD_TRIGGERS
+from .storage import TENANT_ID_SHIFT, tenant_root
+
+logger = logging.getLogger(__name__)
+
+TENANT_TABLES = (
+    "files", "logs", "cell_postings", "cell_index_status", "validation_reports", "client_usage", "user_usage"
+)
+# Tables whose ids must be unique across shards
+SEQUENCE_TABLES = ("files", "logs")
+# Seconds a client's unsplit state is trusted before it is read again (an
+# active shard stays active). Splits wait longer than this before their last sweep.
+STATE_TTL = 5.0
+
+_engines = {}  # database url -> engine
+_states = {}  # client_id -> (active database url or None, read at)
+_lock = threading.Lock()
+
+
+def _connect_shard(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS catalog", (engine.url.database,))
+    for statement in SQLITE_SHARD_TRIGGERS:
+        cursor.execute(statement)
+    cursor.close()
+
+
+def shard_engine(url: str):
+    """Engine of a shard database, with the catalog attached."""
+    with _lock:
+        shard = _engines.get(url)
+        if shard is None:
+            shard = create_engine(url, connect_args={"check_same_thread": False})
+            event.listen(shard, "connect", _connect_shard)
+            _engines[url] = shard
+    return shard
+
+
+def shard_url(client_id: int) -> str:
+    return "sqlite:///" + str(SHARD_DIR / f"tenant_{client_id}.db")
+
+
+def _active_url(client_id: int) -> Optional[str]:
+    now = time.monotonic()
+    cached = _states.get(client_id)
+    if cached is not None and (cached[0] or now - cached[1] < STATE_TTL):
+        return cached[0]
+    db = SessionLocal()
+    try:
+        url = db.execute(
+            select(TenantShard.database_url)
+            .where(TenantShard.client_id == client_id, TenantShard.state == "active")
+        ).scalar_one_or_none()
+    finally:
+        db.close()
+    _states[client_id] = (url, now)
+    return url
+
+
+def engine_for(client_id: Optional[int]):
+    """Engine holding a client's tenant rows: its shard once active, the catalog otherwise."""
+    if not SHARDING_ENABLED or client_id is None:
+        return engine
+    url = _active_url(client_id)
+    return shard_engine(url) if url else engine
+
+
+def file_client(file_id: Optional[int]) -> Optional[int]:
+    """Client whose shard holds a file, or None for files of the catalog."""
+    if not SHARDING_ENABLED or file_id is None:
+        return None
+    if file_id >> TENANT_ID_SHIFT:
+        return file_id >> TENANT_ID_SHIFT
+    db = SessionLocal()
+    try:
+        return db.execute(select(ShardedFile.client_id).where(ShardedFile.file_id == file_id)).scalar_one_or_none()
+    finally:
+        db.close()
+
+
+def session_for_client(client_id: Optional[int]):
+    return SessionLocal(bind=engine_for(client_id))
+
+
+def session_for_file(file_id: Optional[int]):
+    """Session on the database holding a file, for work outside a request."""
+    return session_for_client(file_client(file_id))
+
+
+def bind_client(db, client_id: Optional[int]):
+    """Point a request's session at a client's shard (admins acting for a client)."""
+    target = engine_for(client_id)
+    if db.get_bind() is not target:
+        db.close()
+        db.bind = target
+
+
+def route_request(db, request):
+    """Bind the session of a request to the database its token and URL point at (see get_db)."""
+    authorization = request.headers.get("authorization", "")
+    token = authorization[7:] if authorization.startswith("Bearer ") else request.query_params.get("token")
+    if not token:
+        return
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return  # get_current_user rejects it
+    client_id = claims.get("client_id")
+    try:
+        if client_id is None and claims.get("role") == "admin":
+            if "file_id" in request.path_params:
+                client_id = file_client(int(request.path_params["file_id"]))
+            else:
+                client_id = request.path_params.get("client_id") or request.query_params.get("client_id")
+        if client_id is not None:
+            db.bind = engine_for(int(client_id))
+    except ValueError:
+        return  # the route's own validation answers
+
+
+def active_urls() -> list:
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(TenantShard.database_url).where(TenantShard.state == "active").order_by(TenantShard.client_id)
+        ).scalars().all()
+    finally:
+        db.close()
+
+
+def sessions(db, user=None):
+    """
+    db, then a session on every active shard when db is the catalog and the
+    user (if given) is an admin: run a query in each to cover all tenants.
+    The shard sessions are closed as the iteration moves on.
+    """
+    yield db
+    if not SHARDING_ENABLED or db.get_bind() is not engine or (user is not None and user.role != "admin"):
+        return
+    for url in active_urls():
+        session = SessionLocal(bind=shard_engine(url))
+        try:
+            yield session
+        finally:
+            session.close()
+
+
+def shard_engines() -> list:
+    """Engines of every shard database, whatever its state."""
+    if not SHARDING_ENABLED:
+        return []
+    db = SessionLocal()
+    try:
+        urls = db.execute(select(TenantShard.database_url).order_by(TenantShard.client_id)).scalars().all()
+    finally:
+        db.close()
+    return [shard_engine(url) for url in urls]
+
+
+def use_wal(target):
+    """
+    Switch a SQLite database to write-ahead logging, so readers (such as shard
+    connections reading users from the catalog) never hold up its writers.
+    """
+    try:
+        with target.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    except Exception as e:
+        logger.warning(f"Could not enable WAL on {target.url}: {str(e)}")
+
+
+def _shard_metadata() -> MetaData:
+    metadata = MetaData()
+    for table in Base.metadata.sorted_tables:
+        copy = table.to_metadata(metadata)
+        if table.name in SEQUENCE_TABLES:
+            # AUTOINCREMENT: ids continue from the seeded base and are never reused
+            copy.dialect_options["sqlite"]["autoincrement"] = True
+    return metadata
+
+
+def create_shard(client_id: int) -> str:
+    """
+    Create a client's shard database with empty tenant tables and register it
+    as "copying" (requests keep going to the catalog). Returns its URL.
+    """
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("Tenant shards require a SQLite catalog database")
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    url = shard_url(client_id)
+    # Plain engine: the attached catalog and TEMP triggers need the tables to exist first
+    plain = create_engine(url)
+    try:
+        use_wal(plain)
+        metadata = _shard_metadata()
+        metadata.create_all(plain, tables=[metadata.tables[name] for name in TENANT_TABLES])
+        with plain.begin() as conn:
+            for name in SEQUENCE_TABLES:
+                if conn.execute(text("SELECT 1 FROM sqlite_sequence WHERE name = :name"), {"name": name}).first() is None:
+                    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                                 {"name": name, "seq": client_id << TENANT_ID_SHIFT})
+            conn.execute(text(SQLITE_SHARD_INDEX))
+    finally:
+        plain.dispose()
+
+    db = SessionLocal()
+    try:
+        if db.get(TenantShard, client_id) is None:
+            db.add(TenantShard(client_id=client_id, database_url=url, storage_root=tenant_root(client_id)))
+            db.commit()
+    finally:
+        db.close()
+    logger.info(f"Created shard for client {client_id} at {url}")
+    return url
+
+
+def activate(db, client_id: int):
+    """Route the client to its shard from now on (the caller commits)."""
+    db.execute(
+        TenantShard.__table__.update()
+        .where(TenantShard.client_id == client_id)
+        .values(state="active", activated_at=datetime.datetime.utcnow())
+    )
+    _states.pop(client_id, None)
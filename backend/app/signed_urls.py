@@ -0,0 +1,82 @@
+"""
+Short-lived signed download URLs.
+
+A link token is base64url(JSON claims) + "." + base64url(HMAC-SHA256). The
+claims bind the file id, storage path, size, content hash, download filename,
+the user it was issued to and the expiry, so serving it needs no database access: the
+signature proves the access check already happened when the link was issued.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from .config import DOWNLOAD_SIGNING_KEY, UPLOAD_DIR, COLD_STORAGE_DIR
+
+
+class InvalidSignedURL(Exception):
+    """The token is malformed, tampered with, expired or its file changed."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(payload: str) -> str:
+    return _b64encode(hmac.new(DOWNLOAD_SIGNING_KEY.encode(), payload.encode(), hashlib.sha256).digest())
+
+
+def sign_download(file_meta, user, expires_in: int) -> tuple:
+    """Return (token, expires_at) for downloading file_meta as user."""
+    expires_at = int(time.time()) + expires_in
+    path = os.path.join(UPLOAD_DIR, file_meta.path)
+    claims = {
+        "fid": file_meta.id,
+        "path": path,
+        "size": os.path.getsize(path),
+        "sha": file_meta.sha256,
+        "name": file_meta.filename,
+        "uid": user.id,
+        "user": user.username,
+        "cid": user.client_id,
+        "exp": expires_at,
+    }
+    if file_meta.compression:
+        claims["z"] = file_meta.compression  # the stored blob is decompressed when served
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_signature(payload)}", expires_at
+
+
+def verify_download(token: str, check_file: bool = True) -> dict:
+    """Claims of a valid, unexpired token whose file is unchanged; raises InvalidSignedURL otherwise."""
+    payload, _, signature = token.partition(".")
+    if not payload or not hmac.compare_digest(signature, _signature(payload)):
+        raise InvalidSignedURL("Invalid signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidSignedURL("Malformed token")
+    if claims.get("exp", 0) < time.time():
+        raise InvalidSignedURL("Link expired")
+    if check_file:
+        check_signed_file(claims)
+    return claims
+
+
+def check_signed_file(claims: dict):
+    """Raise InvalidSignedURL unless the linked file is inside storage (or the cold tier) and unchanged."""
+    path = os.path.realpath(claims["path"])
+    roots = [os.path.realpath(UPLOAD_DIR), os.path.realpath(COLD_STORAGE_DIR)]
+    if not any(os.path.commonpath([path, root]) == root for root in roots):
+        raise InvalidSignedURL("Path outside storage")
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        raise InvalidSignedURL("File no longer exists")
+    if size != claims["size"]:
+        raise InvalidSignedURL("File changed since the link was issued")
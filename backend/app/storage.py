@@ -0,0 +1,256 @@
+import glob
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import threading
+from typing import Optional
+from .config import UPLOAD_DIR, LIFECYCLE_ZSTD_LEVEL, LIFECYCLE_THAW_CACHE_FILES
+
+try:
+    import zstandard
+except ImportError:  # optional: cold-tier blobs are then stored uncompressed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# Decompressed copies of cold-tier blobs for parsers (see readable_path)
+THAW_DIR = os.path.join(UPLOAD_DIR, ".thawed")
+ZIP_MAGIC = b"PK\x03\x04"
+# Ids of files created in a tenant shard start at client_id << TENANT_ID_SHIFT
+TENANT_ID_SHIFT = 32
+
+
+def tenant_root(client_id: int) -> str:
+    """Storage directory of a client's shard."""
+    return os.path.join(UPLOAD_DIR, "tenants", str(client_id))
+
+
+def is_plain_filename(filename: Optional[str]) -> bool:
+    """Whether a client-supplied name is a single file name, with no directory parts."""
+    return bool(filename) and "/" not in filename and "\\" not in filename and filename not in (".", "..")
+
+
+def storage_path(file_id: int, filename: str) -> str:
+    """
+    Where the blob of a FileMeta row is stored; files of a shard go to its
+    tenant root, which is created if needed. Only the last part of filename is
+    used, and ValueError is raised if the path would still leave the root.
+    """
+    client_id = file_id >> TENANT_ID_SHIFT
+    root = tenant_root(client_id) if client_id else UPLOAD_DIR
+    name = os.path.basename(filename.replace("\\", "/"))
+    path = os.path.join(root, f"{file_id}_{name}")
+    if not is_plain_filename(name) or os.path.dirname(os.path.realpath(path)) != os.path.realpath(root):
+        raise ValueError(f"Invalid file name {filename!r}")
+    os.makedirs(root, exist_ok=True)
+    return path
+
+
+class StorageLimitExceeded(Exception):
+    """A stream was larger than the bytes it was allowed to write."""
+
+
+def save_stream(source, path: str, limit: Optional[int] = None, digest=None) -> int:
+    """
+    Copy a file-like object to path in chunks and return the bytes written.
+    With a limit, the copy stops as soon as it is exceeded: the partial file
+    is removed and StorageLimitExceeded is raised. A hashlib object passed as
+    digest is updated with the content as it is copied.
+    """
+    if limit is None and digest is None:
+        with open(path, "wb") as buffer:
+            shutil.copyfileobj(source, buffer, CHUNK_SIZE)
+            return buffer.tell()
+
+    written = 0
+    with open(path, "wb") as buffer:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                return written
+            written += len(chunk)
+            if limit is not None and written > limit:
+                break
+            if digest is not None:
+                digest.update(chunk)
+            buffer.write(chunk)
+    remove_quietly(path)
+    raise StorageLimitExceeded(f"Upload exceeds the remaining {limit} bytes of storage quota")
+
+
+def content_hash(path: str) -> str:
+    """SHA-256 hex digest of a stored blob."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def choose_compression(path: str) -> Optional[str]:
+    """
+    How to store a blob in the cold tier: "zstd", or None when zstandard is
+    missing or the blob is a zip container (.xlsx) that wouldn't shrink.
+    """
+    if zstandard is None:
+        return None
+    with open(path, "rb") as f:
+        return None if f.read(len(ZIP_MAGIC)) == ZIP_MAGIC else "zstd"
+
+
+def check_compression():
+    """Warn at startup when the cold tier would store blobs uncompressed."""
+    if zstandard is None:
+        logger.warning("zstandard is not installed: files moved to the cold tier won't be compressed")
+
+
+def copy_blob(source: str, target: str, compression: Optional[str] = None, digest=None) -> int:
+    """
+    Copy a blob to target (compressed with compression, if given) through a
+    temporary file, updating digest with the original content. Returns the
+    bytes written.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(source, "rb") as src, open(partial, "wb") as out:
+            writer = out
+            if compression == "zstd":
+                size = os.fstat(src.fileno()).st_size
+                writer = zstandard.ZstdCompressor(level=LIFECYCLE_ZSTD_LEVEL).stream_writer(out, size=size, closefd=False)
+            elif compression is not None:
+                raise ValueError(f"Unknown compression {compression!r}")
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                if digest is not None:
+                    digest.update(chunk)
+                writer.write(chunk)
+            if writer is not out:
+                writer.close()  # ends the frame
+            written = out.tell()
+        os.replace(partial, target)
+    except BaseException:
+        remove_quietly(partial)
+        raise
+    return written
+
+
+def iter_blob(path: str, compression: Optional[str] = None):
+    """Contents of a stored blob in chunks, decompressed as they are read."""
+    if compression not in (None, "zstd"):
+        raise ValueError(f"Unknown compression {compression!r}")
+    if compression and zstandard is None:
+        raise RuntimeError("Reading compressed cold-tier files requires the zstandard package")
+    with open(path, "rb") as f:
+        if compression:
+            yield from zstandard.ZstdDecompressor().read_to_iter(f, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+        else:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+
+def _thawed_path(file_meta) -> str:
+    # Named by content, keeping the extension parsers pick the format by
+    key = file_meta.sha256 or f"file-{file_meta.id}"
+    return os.path.join(THAW_DIR, key + os.path.splitext(file_meta.filename or "")[1].lower())
+
+
+def readable_path(file_meta) -> str:
+    """
+    Path of a stored file's original contents for parsers (file_meta is a
+    FileMeta or a row with id, filename, path, sha256 and compression): the
+    blob itself, or for a compressed cold-tier blob a decompressed copy kept
+    among the LIFECYCLE_THAW_CACHE_FILES most recently used.
+    """
+    if not file_meta.compression:
+        return file_meta.path
+    target = _thawed_path(file_meta)
+    if os.path.exists(target):
+        os.utime(target)
+        return target
+    thaw_to(file_meta, target)
+    _prune_thawed(target)
+    return target
+
+
+def thaw_to(file_meta, target: str) -> str:
+    """
+    Decompress a cold-tier blob to target, through a temporary file. For
+    callers that need the copy to outlive the thaw cache (copies of their
+    own, which they remove). Returns target.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(partial, "wb") as out:
+            for chunk in iter_blob(file_meta.path, file_meta.compression):
+                out.write(chunk)
+        os.replace(partial, target)
+    except BaseException:
+        remove_quietly(partial)
+        raise
+    return target
+
+
+def _prune_thawed(keep: str):
+    copies = []
+    for path in glob.glob(os.path.join(THAW_DIR, "*")):
+        try:
+            if not path.endswith(".tmp") and path != keep:
+                copies.append((os.path.getmtime(path), path))
+        except OSError:  # pruned by another worker meanwhile
+            continue
+    copies.sort(reverse=True)
+    for _, stale in copies[max(0, LIFECYCLE_THAW_CACHE_FILES - 1):]:
+        remove_quietly(stale)
+
+
+def remove_thawed(file_meta):
+    """Drop the decompressed copy of a deleted cold-tier file, if any."""
+    if file_meta.compression:
+        remove_quietly(_thawed_path(file_meta))
+
+
+def remove_quietly(path: str):
+    """Delete a stored blob, ignoring blobs that are already gone."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Blobs of deleted rows are unlinked by a background thread so bulk deletes
+# don't wait on thousands of filesystem calls.
+_removal_queue = queue.Queue()
+_removal_thread = None
+_removal_lock = threading.Lock()
+
+
+def _removal_worker():
+    while True:
+        path = _removal_queue.get()
+        try:
+            remove_quietly(path)
+        except OSError as e:
+            logger.error(f"Error removing {path}: {str(e)}")
+        finally:
+            _removal_queue.task_done()
+
+
+def schedule_removal(paths):
+    """Queue stored blobs for deletion in the background."""
+    global _removal_thread
+    with _removal_lock:
+        if _removal_thread is None:
+            _removal_thread = threading.Thread(target=_removal_worker, name="blob-removal", daemon=True)
+            _removal_thread.start()
+    for path in paths:
+        if path:
+            _removal_queue.put(path)
+
+
+def drain_removals():
+    """Block until every queued removal has been processed."""
+    if _removal_thread is not None:
+        _removal_queue.join()
@@ -0,0 +1,165 @@
+"""
+Per-client and per-user storage usage counters.
+
+Upload and delete adjust the counters in the same transaction as the FileMeta
+change, so reading usage never scans files or the filesystem. reconcile()
+recomputes them from FileMeta to repair any drift.
+"""
+import logging
+import os
+from collections import defaultdict
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select, func, delete, update, or_
+from sqlalchemy.dialects import sqlite, postgresql
+from .models import ClientUsage, UserUsage, FileMeta
+from .config import DEFAULT_CLIENT_QUOTA_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def _upsert_add(db, model, key_column: str, key, nbytes: int, nfiles: int):
+    dialect = db.get_bind().dialect.name
+    values = {key_column: key, "bytes": nbytes, "files": nfiles}
+    if dialect in ("sqlite", "postgresql"):
+        insert = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(model).values(**values)
+        db.execute(insert.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={"bytes": model.bytes + nbytes, "files": model.files + nfiles},
+        ))
+        return
+    updated = db.execute(
+        model.__table__.update()
+        .where(getattr(model, key_column) == key)
+        .values(bytes=model.bytes + nbytes, files=model.files + nfiles)
+    )
+    if updated.rowcount == 0:
+        db.add(model(**values))
+
+
+def record_usage(db, client_id: Optional[int], user_id: Optional[int], nbytes: int, nfiles: int = 1):
+    """Add (or with negative values, subtract) usage. The caller commits."""
+    if client_id is not None:
+        _upsert_add(db, ClientUsage, "client_id", client_id, nbytes, nfiles)
+    if user_id is not None:
+        _upsert_add(db, UserUsage, "user_id", user_id, nbytes, nfiles)
+
+
+def release_usage(db, rows):
+    """Subtract the usage of deleted files given as rows with client_id, uploaded_by and size."""
+    by_client = defaultdict(lambda: [0, 0])
+    by_user = defaultdict(lambda: [0, 0])
+    for row in rows:
+        if row.client_id is not None:
+            by_client[row.client_id][0] += row.size or 0
+            by_client[row.client_id][1] += 1
+        if row.uploaded_by is not None:
+            by_user[row.uploaded_by][0] += row.size or 0
+            by_user[row.uploaded_by][1] += 1
+    for client_id, (nbytes, nfiles) in by_client.items():
+        _upsert_add(db, ClientUsage, "client_id", client_id, -nbytes, -nfiles)
+    for user_id, (nbytes, nfiles) in by_user.items():
+        _upsert_add(db, UserUsage, "user_id", user_id, -nbytes, -nfiles)
+
+
+def remaining_quota(db, client_id: Optional[int]) -> Optional[int]:
+    """Bytes the client may still store, or None when it has no quota."""
+    if client_id is None:
+        return None
+    usage = db.get(ClientUsage, client_id)
+    quota = usage.quota_bytes if usage and usage.quota_bytes is not None else DEFAULT_CLIENT_QUOTA_BYTES
+    if not quota:
+        return None
+    return max(0, quota - (usage.bytes if usage else 0))
+
+
+def check_quota(db, client_id: Optional[int], nbytes: Optional[int]) -> Optional[int]:
+    """Raise 413 if nbytes doesn't fit in the client's quota; return the remaining bytes."""
+    remaining = remaining_quota(db, client_id)
+    if remaining is not None and nbytes is not None and nbytes > remaining:
+        raise HTTPException(status_code=413, detail=f"Storage quota exceeded: {remaining} bytes remaining")
+    return remaining
+
+
+def reserve_quota(db, client_id: Optional[int], nbytes: int) -> bool:
+    """
+    Add nbytes to the client's usage if they fit in its quota. Check and add
+    are one conditional UPDATE, so concurrent uploads can't both take the
+    last bytes. The caller commits; an unused reservation is given back with
+    record_usage(db, client_id, None, -nbytes, 0).
+    """
+    if client_id is None:
+        return True
+    _upsert_add(db, ClientUsage, "client_id", client_id, 0, 0)  # make sure the row exists
+    quota = func.coalesce(ClientUsage.quota_bytes, DEFAULT_CLIENT_QUOTA_BYTES)
+    result = db.execute(
+        update(ClientUsage)
+        .where(ClientUsage.client_id == client_id, or_(quota == 0, ClientUsage.bytes + nbytes <= quota))
+        .values(bytes=ClientUsage.bytes + nbytes)
+    )
+    return result.rowcount == 1
+
+
+def settle_quota(db, client_id: Optional[int], user_id: Optional[int], reserved: int, nbytes: int) -> bool:
+    """
+    Record a stored file of nbytes against a reservation of reserved bytes,
+    reserving any bytes beyond it. Returns False, changing nothing, when those
+    don't fit. The caller commits.
+    """
+    if nbytes > reserved and not reserve_quota(db, client_id, nbytes - reserved):
+        return False
+    record_usage(db, client_id, None, min(nbytes - reserved, 0), 1)
+    record_usage(db, None, user_id, nbytes)
+    return True
+
+
+def reconcile(db, fill_sizes: bool = True):
+    """
+    Recompute all counters from FileMeta and return the clients whose
+    counters had drifted. With fill_sizes, files without a recorded size get
+    it from disk first. Quotas are kept.
+    """
+    if fill_sizes:
+        missing = db.execute(select(FileMeta.id, FileMeta.path).where(FileMeta.size.is_(None))).all()
+        for file_id, path in missing:
+            try:
+                size = os.path.getsize(path) if path else 0
+            except OSError:
+                size = 0
+            db.query(FileMeta).filter(FileMeta.id == file_id).update({"size": size}, synchronize_session=False)
+        if missing:
+            logger.info(f"Recorded sizes for {len(missing)} files")
+
+    client_totals = {
+        client_id: (nbytes or 0, nfiles)
+        for client_id, nbytes, nfiles in db.execute(
+            select(FileMeta.client_id, func.sum(FileMeta.size), func.count(FileMeta.id))
+            .where(FileMeta.client_id.is_not(None))
+            .group_by(FileMeta.client_id)
+        )
+    }
+    user_totals = {
+        user_id: (nbytes or 0, nfiles)
+        for user_id, nbytes, nfiles in db.execute(
+            select(FileMeta.uploaded_by, func.sum(FileMeta.size), func.count(FileMeta.id))
+            .where(FileMeta.uploaded_by.is_not(None))
+            .group_by(FileMeta.uploaded_by)
+        )
+    }
+
+    drift = []
+    counters = {usage.client_id: usage for usage in db.query(ClientUsage)}
+    for client_id in set(counters) | set(client_totals):
+        nbytes, nfiles = client_totals.get(client_id, (0, 0))
+        usage = counters.get(client_id)
+        if usage is None:
+            usage = ClientUsage(client_id=client_id, bytes=0, files=0)
+            db.add(usage)
+        if (usage.bytes, usage.files) != (nbytes, nfiles):
+            drift.append({"client_id": client_id, "bytes": [usage.bytes, nbytes], "files": [usage.files, nfiles]})
+            usage.bytes, usage.files = nbytes, nfiles
+
+    db.execute(delete(UserUsage))
+    db.add_all(UserUsage(user_id=user_id, bytes=nbytes, files=nfiles) for user_id, (nbytes, nfiles) in user_totals.items())
+    db.commit()
+    return drift
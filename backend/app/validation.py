@@ -0,0 +1,309 @@
+"""
+Content validation of uploaded workbooks.
+
+The first sheet is read in chunks of CHUNK_ROWS rows; within a chunk the date
+and numeric columns are converted to typed numpy arrays (cell by cell only
+when a column holds text) and every rule is checked over the whole array at
+once. Without numpy the same checks run as plain loops:
+
+    required   VALIDATION_REQUIRED_COLUMNS exist and have no empty cells
+    date       VALIDATION_DATE_COLUMNS hold dates within the file's declared
+               start_date..end_date
+    numeric    VALIDATION_NUMERIC_COLUMNS hold numbers, optionally within
+               bounds ("Amount:0:" = at least 0)
+
+Files are checked off the request path on a process pool and the outcome is
+stored per file in validation_reports.
+"""
+import datetime
+import json
+import logging
+import math
+import time
+from concurrent.futures import wait
+from sqlalchemy import delete, select
+from .database import IN_BATCH_SIZE
+from .sharding import session_for_file
+from .models import FileMeta, ValidationReport
+from .workbook import Workbook
+from .process import WorkerPool
+from .config import (
+    VALIDATION_ENABLED, VALIDATION_WORKERS, VALIDATION_REQUIRED_COLUMNS, VALIDATION_DATE_COLUMNS,
+    VALIDATION_NUMERIC_COLUMNS
+)
+
+try:
+    import numpy as np
+except ImportError:  # optional: chunks are then checked with plain loops
+    np = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 10_000
+MAX_EXAMPLES = 5
+
+# Date ordinals of cells that are empty or not a date
+EMPTY, INVALID = 0, -1
+# Cell types converted without going through the per-cell parsers
+DATE_TYPES = {datetime.date, datetime.datetime}
+NUMBER_TYPES = {int, float, type(None)}
+
+_pool = WorkerPool("validation", VALIDATION_WORKERS)
+
+
+def _names(setting: str) -> list:
+    return [name.strip() for name in setting.split(",") if name.strip()]
+
+
+def _numeric_rules(setting: str) -> list:
+    """(column, minimum, maximum) from "Quantity,Amount:0:1e9"; blank bounds are open."""
+    rules = []
+    for entry in _names(setting):
+        name, _, bounds = entry.partition(":")
+        low, _, high = bounds.partition(":")
+        rules.append((name.strip(), float(low) if low.strip() else None, float(high) if high.strip() else None))
+    return rules
+
+
+def default_rules() -> dict:
+    return {
+        "required": _names(VALIDATION_REQUIRED_COLUMNS),
+        "dates": _names(VALIDATION_DATE_COLUMNS),
+        "numeric": _numeric_rules(VALIDATION_NUMERIC_COLUMNS),
+    }
+
+
+def _date_ordinal(value) -> int:
+    if value is None or value == "":
+        return EMPTY
+    if isinstance(value, datetime.date):  # datetimes included
+        return value.toordinal()
+    if isinstance(value, str):
+        try:
+            return datetime.date.fromisoformat(value.strip()[:10]).toordinal()
+        except ValueError:
+            return INVALID
+    return INVALID
+
+
+def _number(value) -> float:
+    """Float value; nan for empty cells, None for non-numeric ones."""
+    if value is None or value == "":
+        return math.nan
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(",", ""))
+        except ValueError:
+            return None
+    return None
+
+
+def _date_violations(values, low, high):
+    """Positions of (invalid, out-of-range) cells in a chunk of a date column."""
+    if np is not None:
+        # Columns of dates only skip the per-cell parser (numpy's own
+        # datetime64 conversion of date objects is many times slower)
+        convert = datetime.date.toordinal if set(map(type, values)) <= DATE_TYPES else _date_ordinal
+        ordinals = np.fromiter(map(convert, values), dtype=np.int64, count=len(values))
+        present = ordinals > 0
+        invalid = ordinals == INVALID
+        out_of_range = np.zeros(len(values), dtype=bool)
+        if low is not None:
+            out_of_range |= present & (ordinals < low)
+        if high is not None:
+            out_of_range |= present & (ordinals > high)
+        return np.flatnonzero(invalid).tolist(), np.flatnonzero(out_of_range).tolist()
+    ordinals = [_date_ordinal(value) for value in values]
+    invalid = [i for i, value in enumerate(ordinals) if value == INVALID]
+    out_of_range = [
+        i for i, value in enumerate(ordinals)
+        if value > 0 and ((low is not None and value < low) or (high is not None and value > high))
+    ]
+    return invalid, out_of_range
+
+
+def _number_violations(values, low, high):
+    """Positions of (non-numeric, out-of-range) cells in a chunk of a numeric column."""
+    if np is not None:
+        if set(map(type, values)) <= NUMBER_TYPES:
+            invalid = []
+        else:
+            values = list(map(_number, values))
+            invalid = [i for i, value in enumerate(values) if value is None]
+        numbers = np.array(values, dtype=np.float64)  # empty and non-numeric cells become nan
+        out_of_range = np.zeros(len(numbers), dtype=bool)
+        if low is not None:
+            out_of_range |= numbers < low
+        if high is not None:
+            out_of_range |= numbers > high
+        return invalid, np.flatnonzero(out_of_range).tolist()
+    numbers = [_number(value) for value in values]
+    invalid = [i for i, value in enumerate(numbers) if value is None]
+    out_of_range = [
+        i for i, value in enumerate(numbers)
+        if value is not None and ((low is not None and value < low) or (high is not None and value > high))
+    ]
+    return invalid, out_of_range
+
+
+class _Issues:
+    """Violation counts per (rule, column) with a few example cells each."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, rule, column, positions, row_numbers, values):
+        if not positions:
+            return
+        entry = self.entries.setdefault((rule, column), {"rule": rule, "column": column, "count": 0, "examples": []})
+        entry["count"] += len(positions)
+        for position in positions[:MAX_EXAMPLES - len(entry["examples"])]:
+            value = values[position]
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            entry["examples"].append({"row": row_numbers[position], "value": value})
+
+    def as_list(self):
+        return list(self.entries.values())
+
+
+def _check_chunk(chunk, columns, rules, window, issues):
+    row_numbers = [row_number for row_number, _ in chunk]
+
+    def column_values(index):
+        return [values[index] if index < len(values) else None for _, values in chunk]
+
+    for name in rules["required"]:
+        if name.lower() in columns:
+            values = column_values(columns[name.lower()])
+            issues.add("required", name, [i for i, value in enumerate(values) if value is None or value == ""],
+                       row_numbers, values)
+    for name in rules["dates"]:
+        if name.lower() in columns:
+            values = column_values(columns[name.lower()])
+            invalid, out_of_range = _date_violations(values, *window)
+            issues.add("date_type", name, invalid, row_numbers, values)
+            issues.add("date_range", name, out_of_range, row_numbers, values)
+    for name, low, high in rules["numeric"]:
+        if name.lower() in columns:
+            values = column_values(columns[name.lower()])
+            invalid, out_of_range = _number_violations(values, low, high)
+            issues.add("numeric_type", name, invalid, row_numbers, values)
+            issues.add("numeric_range", name, out_of_range, row_numbers, values)
+
+
+def validate_workbook(path: str, start_date, end_date, rules: dict) -> dict:
+    """Process pool task: check the first sheet of a workbook and return its report."""
+    started = time.perf_counter()
+    window = (start_date.toordinal() if start_date else None, end_date.toordinal() if end_date else None)
+    issues = _Issues()
+    rows, sheet = 0, None
+    with Workbook(path) as book:
+        names = book.sheet_names()
+        sheet = names[0] if names else None
+        row_iter = book.iter_rows(sheet)
+        header = next(row_iter, (None, []))[1]
+        columns = {}
+        for index, value in enumerate(header):
+            if value is not None:
+                columns.setdefault(str(value).strip().lower(), index)
+        for name in rules["required"]:
+            if name.lower() not in columns:
+                issues.add("required_column", name, [0], [1], [None])
+
+        chunk = []
+        for row_number, values in row_iter:
+            if all(value is None for value in values):
+                continue
+            chunk.append((row_number, values))
+            if len(chunk) >= CHUNK_ROWS:
+                _check_chunk(chunk, columns, rules, window, issues)
+                rows += len(chunk)
+                chunk = []
+        if chunk:
+            _check_chunk(chunk, columns, rules, window, issues)
+            rows += len(chunk)
+
+    found = issues.as_list()
+    return {
+        "status": "failed" if found else "passed",
+        "sheet": sheet,
+        "rows": rows,
+        "issues": found,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def _store(file_id: int, future):
+    if future.cancelled():
+        return
+    try:
+        report = future.result()
+    except Exception as e:
+        logger.error(f"Error validating file {file_id}: {str(e)}")
+        report = {"status": "error", "rows": 0, "issues": [], "error": str(e)}
+    db = session_for_file(file_id)
+    try:
+        # The file may have been deleted while it was being checked
+        if db.execute(select(FileMeta.id).where(FileMeta.id == file_id)).first() is None:
+            return
+        db.merge(ValidationReport(
+            file_id=file_id,
+            status=report["status"],
+            rows=report["rows"],
+            issues=sum(issue["count"] for issue in report["issues"]),
+            report=json.dumps(report, default=str),
+            validated_at=datetime.datetime.utcnow()
+        ))
+        db.commit()
+        logger.info(f"Validation of file {file_id}: {report['status']}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error storing validation report of file {file_id}: {str(e)}")
+    finally:
+        db.close()
+
+
+def schedule_validation(files):
+    """
+    Validate the given files (objects with id, path, start_date, end_date) in
+    the background. Never raises: the files are already stored, and unchecked
+    ones can be picked up by scripts/validate_files.py.
+    """
+    if not VALIDATION_ENABLED:
+        return
+    try:
+        rules = default_rules()
+        for file in files:
+            future = _pool.submit(validate_workbook, file.path, file.start_date, file.end_date, rules)
+            future.add_done_callback(lambda future, file_id=file.id: _store(file_id, future))
+    except Exception as e:
+        logger.error(f"Error scheduling validation: {str(e)}")
+
+
+def validate_now(files):
+    """Validate files on the pool and store their reports, yielding each file id as it is done."""
+    rules = default_rules()
+    futures = [
+        (file.id, _pool.submit(validate_workbook, file.path, file.start_date, file.end_date, rules)) for file in files
+    ]
+    for file_id, future in futures:
+        wait([future])
+        _store(file_id, future)
+        yield file_id
+
+
+def stop_validation():
+    """Drop queued checks; unchecked files can be picked up by scripts/validate_files.py."""
+    _pool.shutdown()
+
+
+def remove_reports(db, file_ids):
+    """Delete the reports of files being deleted (caller commits)."""
+    file_ids = list(file_ids)
+    for i in range(0, len(file_ids), IN_BATCH_SIZE):
+        db.execute(delete(ValidationReport).where(ValidationReport.file_id.in_(file_ids[i:i + IN_BATCH_SIZE])))
@@ -0,0 +1,155 @@
+"""
+File versions and delta uploads.
+
+Uploading a file with the same client, filename and period as an existing
+one makes it the next version of that report: it gets its own FileMeta (the
+previous versions stay downloadable) linked by previous_version_id.
+
+A new version can also be sent as a delta against one the client already
+has, rsync-style, instead of transferring the whole file:
+
+1. GET /files/{id}/signatures returns, for each block_size block of that
+   version, its Adler-32 checksum (weak: cheap to roll over a file byte by
+   byte) and the first 16 bytes of its SHA-256 (strong).
+2. The client rolls Adler-32 over its new file; where a window's checksum
+   is in the table and the strong hash agrees, that block is reused,
+   everything else is literal data.
+3. POST /files/upload/delta sends the operations ({"copy": [first_block,
+   count]} or {"data": length}, in file order), the literal bytes in one
+   part and the SHA-256 of the whole new file. The server rebuilds the file
+   from the base and the literals and only keeps it if the hash matches.
+
+scripts/delta_upload.py is a reference client.
+"""
+import hashlib
+import json
+import os
+import zlib
+from typing import Optional
+from sqlalchemy import select
+from .models import FileMeta
+from .storage import CHUNK_SIZE, remove_quietly
+
+MIN_BLOCK_SIZE = 1024
+MAX_BLOCK_SIZE = 1024 * 1024
+STRONG_HASH_BYTES = 16
+
+
+class DeltaError(Exception):
+    """The delta doesn't describe a file that can be built from the base."""
+
+
+def previous_version(db, client_id, filename: str, start_date, end_date) -> Optional[FileMeta]:
+    """Latest stored file of the same report (client, filename and period), which a new upload replaces."""
+    return db.execute(
+        select(FileMeta)
+        .where(
+            FileMeta.client_id == client_id,
+            FileMeta.filename == filename,
+            FileMeta.start_date == start_date,
+            FileMeta.end_date == end_date,
+            FileMeta.path.isnot(None)
+        )
+        .order_by(FileMeta.id.desc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def link_version(file_meta: FileMeta, previous: Optional[FileMeta]):
+    """Make file_meta the version after previous (or the first version)."""
+    file_meta.previous_version_id = previous.id if previous else None
+    file_meta.version = (previous.version or 1) + 1 if previous else 1
+
+
+def version_chain(db, file_meta: FileMeta) -> list:
+    """Every version of file_meta's report that still exists, oldest first."""
+    older = []
+    current = file_meta
+    while current.previous_version_id is not None:
+        current = db.get(FileMeta, current.previous_version_id)
+        if current is None:  # deleted: the chain ends there
+            break
+        older.append(current)
+    newer = []
+    current = file_meta
+    while True:
+        # With concurrent re-uploads of one version, the latest of them continues the chain
+        current = db.execute(
+            select(FileMeta).where(FileMeta.previous_version_id == current.id).order_by(FileMeta.id.desc()).limit(1)
+        ).scalar_one_or_none()
+        if current is None:
+            break
+        newer.append(current)
+    return older[::-1] + [file_meta] + newer
+
+
+def block_signatures(path: str, block_size: int) -> list:
+    """[adler32, strong hash hex] of each block of a file."""
+    signatures = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            signatures.append([zlib.adler32(block), hashlib.sha256(block).hexdigest()[:2 * STRONG_HASH_BYTES]])
+    return signatures
+
+
+def parse_ops(raw: str, base_size: int, block_size: int) -> tuple:
+    """
+    Validate the operations of a delta against the base; returns them as
+    ("copy", offset, length) / ("data", length) tuples and the size of the
+    file they build.
+    """
+    try:
+        ops = json.loads(raw)
+    except ValueError:
+        raise DeltaError("ops must be a JSON list")
+    if not isinstance(ops, list):
+        raise DeltaError("ops must be a JSON list")
+    blocks = -(-base_size // block_size)
+    parsed, size = [], 0
+    for op in ops:
+        if isinstance(op, dict) and set(op) == {"copy"}:
+            first, count = op["copy"] if isinstance(op["copy"], list) and len(op["copy"]) == 2 else (None, None)
+            if not (isinstance(first, int) and isinstance(count, int) and 0 <= first < first + count <= blocks):
+                raise DeltaError(f"Invalid copy operation {op}: the base has {blocks} blocks")
+            offset = first * block_size
+            length = min((first + count) * block_size, base_size) - offset
+            parsed.append(("copy", offset, length))
+        elif isinstance(op, dict) and set(op) == {"data"} and isinstance(op["data"], int) and op["data"] > 0:
+            length = op["data"]
+            parsed.append(("data", length))
+        else:
+            raise DeltaError(f"Invalid operation {op}")
+        size += length
+    return parsed, size
+
+
+def rebuild(base_path: str, ops: list, literals, target: str, digest) -> int:
+    """
+    Write the file described by parsed ops to target: ranges of the base and
+    the next bytes of literals (a file-like object, which must hold exactly
+    the data the ops use). Returns the bytes written; raises DeltaError and
+    removes the partial file if the data doesn't match.
+    """
+    written = 0
+    try:
+        with open(base_path, "rb") as base, open(target, "wb") as out:
+            for op in ops:
+                if op[0] == "copy":
+                    source, remaining = base, op[2]
+                    base.seek(op[1])
+                else:
+                    source, remaining = literals, op[1]
+                while remaining:
+                    chunk = source.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise DeltaError("The literal data is shorter than the operations require")
+                    digest.update(chunk)
+                    out.write(chunk)
+                    remaining -= len(chunk)
+                    written += len(chunk)
+            if literals.read(1):
+                raise DeltaError("The literal data is longer than the operations require")
+    except BaseException:
+        remove_quietly(target)
+        raise
+    return written
@@ -0,0 +1,270 @@
+"""
+Streaming spreadsheet reader.
+
+XLSX sheets are parsed incrementally with iterparse straight from the zip
+archive, so memory stays flat regardless of row count (only the shared
+strings table is held in memory). Legacy XLS files are read with xlrd when it
+is installed.
+"""
+import datetime
+import functools
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+try:
+    import xlrd
+except ImportError:  # optional: only needed for legacy .xls files
+    xlrd = None
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Built-in number formats that render as dates/times
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+EXCEL_EPOCH_1904 = datetime.datetime(1904, 1, 1)
+
+
+class WorkbookError(Exception):
+    """The file is not a readable XLS/XLSX workbook or lacks the sheet."""
+
+
+def _tag(name):
+    return f"{{{MAIN_NS}}}{name}"
+
+
+# Resolved once: these are looked up for every cell of every row
+ROW_TAG, CELL_TAG, VALUE_TAG, TEXT_TAG, SHEET_DATA_TAG = (_tag(name) for name in ("row", "c", "v", "t", "sheetData"))
+
+
+@functools.lru_cache(maxsize=4096)
+def _letters_index(letters: str) -> int:
+    index = 0
+    for char in letters:
+        index = index * 26 + (ord(char.upper()) - 64)
+    return index - 1
+
+
+def column_index(ref: str) -> int:
+    """Zero-based column index of a cell reference such as "AB12"."""
+    return _letters_index(ref.rstrip("0123456789"))
+
+
+def column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell_ref(row: int, column: int) -> str:
+    """A1-style reference from a one-based row and zero-based column."""
+    return f"{column_letter(column)}{row}"
+
+
+def _is_date_format(code: str) -> bool:
+    # Drop quoted literals, escapes and [color]/[$-locale] sections first
+    code = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', "", code)
+    return bool(re.search(r"[dmyhs]", code, re.IGNORECASE))
+
+
+def _serial_to_datetime(value: float, date1904: bool):
+    epoch = EXCEL_EPOCH_1904 if date1904 else EXCEL_EPOCH
+    moment = epoch + datetime.timedelta(days=value)
+    return moment.date() if moment.time() == datetime.time() else moment
+
+
+class _XlsxWorkbook:
+    def __init__(self, path):
+        try:
+            self.archive = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError) as e:
+            raise WorkbookError(f"Not a valid XLSX file: {str(e)}")
+        try:
+            self._load()
+        except (KeyError, ET.ParseError) as e:
+            self.archive.close()
+            raise WorkbookError(f"Malformed XLSX file: {str(e)}")
+
+    def _rels(self, part):
+        rels_path = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+        targets = {}
+        if rels_path not in self.archive.namelist():
+            return targets
+        for rel in ET.fromstring(self.archive.read(rels_path)).iter(f"{{{PKG_REL_NS}}}Relationship"):
+            target = rel.get("Target")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+            targets[rel.get("Id")] = (rel.get("Type", "").rsplit("/", 1)[-1], target)
+        return targets
+
+    def _load(self):
+        root_rels = self._rels("")
+        workbook_part = next((t for kind, t in root_rels.values() if kind == "officeDocument"), "xl/workbook.xml")
+        workbook_rels = self._rels(workbook_part)
+        workbook = ET.fromstring(self.archive.read(workbook_part))
+
+        properties = workbook.find(_tag("workbookPr"))
+        self.date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+        self.sheets = {}
+        for sheet in workbook.iter(_tag("sheet")):
+            kind, target = workbook_rels[sheet.get(f"{{{REL_NS}}}id")]
+            self.sheets[sheet.get("name")] = target
+
+        by_kind = {kind: target for kind, target in workbook_rels.values()}
+        self.shared_strings = []
+        if "sharedStrings" in by_kind:
+            with self.archive.open(by_kind["sharedStrings"]) as f:
+                for _, element in ET.iterparse(f):
+                    if element.tag == _tag("si"):
+                        self.shared_strings.append("".join(t.text or "" for t in element.iter(_tag("t"))))
+                        element.clear()
+
+        self.date_styles = set()
+        if "styles" in by_kind:
+            styles = ET.fromstring(self.archive.read(by_kind["styles"]))
+            custom_dates = {
+                int(fmt.get("numFmtId")) for fmt in styles.iter(_tag("numFmt"))
+                if _is_date_format(fmt.get("formatCode", ""))
+            }
+            cell_xfs = styles.find(_tag("cellXfs"))
+            if cell_xfs is not None:
+                for index, xf in enumerate(cell_xfs.iter(_tag("xf"))):
+                    format_id = int(xf.get("numFmtId", 0))
+                    if format_id in BUILTIN_DATE_FORMATS or format_id in custom_dates:
+                        self.date_styles.add(index)
+
+    def sheet_names(self):
+        return list(self.sheets)
+
+    def _value(self, cell):
+        kind = cell.get("t", "n")
+        if kind == "inlineStr":
+            return "".join(t.text or "" for t in cell.iter(TEXT_TAG))
+        raw = cell.findtext(VALUE_TAG)
+        if raw is None:
+            return None
+        if kind == "s":
+            return self.shared_strings[int(raw)]
+        if kind == "b":
+            return raw == "1"
+        if kind in ("str", "e"):
+            return raw
+        try:
+            number = int(raw) if raw.lstrip("-").isdigit() else float(raw)
+        except ValueError:
+            return raw
+        if cell.get("s") and int(cell.get("s")) in self.date_styles:
+            return _serial_to_datetime(number, self.date1904)
+        return number
+
+    def iter_rows(self, sheet):
+        with self.archive.open(self.sheets[sheet]) as f:
+            next_row = 1
+            sheet_data = None
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if element.tag == SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag != ROW_TAG:
+                    continue
+                row_number = int(element.get("r", next_row))
+                next_row = row_number + 1
+                values = []
+                for position, cell in enumerate(element.iter(CELL_TAG)):
+                    ref = cell.get("r")
+                    column = column_index(ref) if ref else position
+                    if column >= len(values):
+                        values.extend([None] * (column - len(values) + 1))
+                    values[column] = self._value(cell)
+                # Drop parsed rows so memory stays flat on large sheets
+                if sheet_data is not None:
+                    sheet_data.clear()
+                yield row_number, values
+
+    def close(self):
+        self.archive.close()
+
+
+class _XlsWorkbook:
+    def __init__(self, path):
+        if xlrd is None:
+            raise WorkbookError("Reading .xls files requires the xlrd package")
+        try:
+            self.book = xlrd.open_workbook(path, on_demand=True)
+        except Exception as e:
+            raise WorkbookError(f"Not a valid XLS file: {str(e)}")
+
+    def sheet_names(self):
+        return self.book.sheet_names()
+
+    def iter_rows(self, sheet):
+        worksheet = self.book.sheet_by_name(sheet)
+        for index in range(worksheet.nrows):
+            values = []
+            for cell in worksheet.row(index):
+                if cell.ctype == xlrd.XL_CELL_EMPTY or cell.ctype == xlrd.XL_CELL_BLANK:
+                    values.append(None)
+                elif cell.ctype == xlrd.XL_CELL_DATE:
+                    moment = xlrd.xldate.xldate_as_datetime(cell.value, self.book.datemode)
+                    values.append(moment.date() if moment.time() == datetime.time() else moment)
+                elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                    values.append(bool(cell.value))
+                elif cell.ctype == xlrd.XL_CELL_NUMBER and float(cell.value).is_integer():
+                    values.append(int(cell.value))
+                else:
+                    values.append(cell.value)
+            yield index + 1, values
+        self.book.unload_sheet(sheet)
+
+    def close(self):
+        self.book.release_resources()
+
+
+class Workbook:
+    """
+    Read-only workbook opened from a path:
+
+        with Workbook(path) as book:
+            for row_number, values in book.iter_rows(book.sheet_names()[0]):
+                ...
+
+    Row numbers are one-based; values are str, int, float, bool,
+    date/datetime or None for empty cells.
+    """
+
+    def __init__(self, path: str):
+        if str(path).lower().endswith(".xls"):
+            self._book = _XlsWorkbook(path)
+        else:
+            self._book = _XlsxWorkbook(path)
+
+    def sheet_names(self):
+        return self._book.sheet_names()
+
+    def iter_rows(self, sheet=None):
+        names = self.sheet_names()
+        if sheet is None:
+            if not names:
+                raise WorkbookError("Workbook has no sheets")
+            sheet = names[0]
+        elif sheet not in names:
+            raise WorkbookError(f"Sheet {sheet!r} not found")
+        return self._book.iter_rows(sheet)
+
+    def close(self):
+        self._book.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
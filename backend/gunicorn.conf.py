@@ -0,0 +1,54 @@
+"""
+Production server settings.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+The app is imported once in the master and workers are forked from it, so
+they share its memory pages. Schema creation and demo seeding also run once in
+the master before forking; worker lifespans then find the schema current.
+"""
+import multiprocessing
+import os
+import time
+
+from app.config import WEB_CONCURRENCY, GRACEFUL_TIMEOUT, LOG_LEVEL
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = WEB_CONCURRENCY or max(2, multiprocessing.cpu_count())
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+# On SIGTERM workers stop accepting connections and get this long to finish
+# in-flight requests (large uploads/downloads) before they are killed.
+graceful_timeout = GRACEFUL_TIMEOUT
+timeout = 120
+keepalive = 5
+loglevel = LOG_LEVEL.lower()
+
+_started = time.perf_counter()
+
+
+def on_starting(server):
+    from app.database import engine
+    from app.schema import prepare_database
+    from app.routes.auth import seed_demo_users
+
+    prepare_database(engine)
+    seed_demo_users()
+    # Don't hand pooled connections from the master to the forked workers
+    engine.dispose()
+
+
+def when_ready(server):
+    from app.process import rss_bytes
+
+    server.log.info(
+        f"Master ready in {(time.perf_counter() - _started) * 1000:.0f} ms "
+        f"({rss_bytes() / 2**20:.1f} MB RSS), starting {workers} workers"
+    )
+
+
+def post_worker_init(worker):
+    from app.process import rss_bytes
+
+    worker.log.info(f"Worker {worker.pid} booted ({rss_bytes() / 2**20:.1f} MB RSS)")
@@ -0,0 +1,43 @@
+"""
+Apply the storage lifecycle rules once (see app/lifecycle.py): delete files
+past their client's purge age, then move files past the cold-tier age to
+COLD_STORAGE_DIR, compressing them with zstd where that helps. Run it from
+cron, or set LIFECYCLE_INTERVAL to have the API do it. With tenant shards,
+the catalog and every active shard are processed.
+
+Usage (from the backend directory):
+    python scripts/apply_lifecycle.py             # apply
+    python scripts/apply_lifecycle.py --dry-run   # only count the files affected
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.schema import prepare_database
+from app.storage import drain_removals, zstandard
+from app import lifecycle
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="count the files to purge and move, change nothing")
+    args = parser.parse_args()
+
+    prepare_database(engine)
+    if zstandard is None:
+        print("zstandard is not installed: cold-tier files will be stored uncompressed")
+    totals = lifecycle.run(dry_run=args.dry_run)
+    drain_removals()
+
+    verb = "would be" if args.dry_run else "were"
+    print(f"{totals['purged']} files {verb} purged, {totals['archived']} {verb} moved to the cold tier")
+    if totals["hot_bytes"]:
+        print(f"Moved {totals['hot_bytes']} bytes into {totals['cold_bytes']} "
+              f"({totals['cold_bytes'] / totals['hot_bytes']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
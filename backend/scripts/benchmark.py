@@ -0,0 +1,462 @@
+"""
+Load and benchmark suite for the backend API.
+
+Seeds an isolated database and storage directory with a reproducible dataset,
+starts the API in a subprocess against it and drives login, upload, download,
+history and logs requests under concurrency. Results (p50/p95/p99 latency and
+throughput per scenario) are written as JSON and compared with the stored
+baselines; the script exits with status 1 when a scenario regresses.
+
+Usage (from the backend directory):
+    python scripts/benchmark.py --scale 1k
+    python scripts/benchmark.py --scale 100k --concurrency 32 --output results.json
+    python scripts/benchmark.py --scale 1k --save-baseline
+"""
+import argparse
+import datetime
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baseline.json"
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+FILES_PER_CLIENT = 100
+LOGS_PER_FILE = 2
+BLOB_COUNT = 20
+BENCH_PASSWORD = "bench123"
+INSERT_BATCH_SIZE = 10_000
+
+# Requests issued per scenario. Logs and admin history return every row, so
+# they get fewer requests than the scoped endpoints.
+SCENARIO_REQUESTS = {
+    "login": 50,
+    "upload": 100,
+    "download": 500,
+    "history": 500,
+    "history_admin_client": 500,
+    "logs": 20,
+}
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def make_xlsx(rows, rng, start_date=None):
+    """Build a minimal but valid single-sheet XLSX workbook in memory."""
+    start_date = start_date or datetime.date(2024, 1, 1)
+    header = ["Date", "Invoice", "Customer", "Quantity", "Amount"]
+    sheet_rows = [header]
+    for i in range(rows):
+        sheet_rows.append([
+            (start_date + datetime.timedelta(days=i % 28)).isoformat(),
+            f"INV-{rng.randint(1000, 9999)}",
+            f"Customer {rng.randint(1, 500)}",
+            rng.randint(1, 100),
+            round(rng.uniform(1, 10_000), 2),
+        ])
+
+    xml_rows = []
+    for r, values in enumerate(sheet_rows, start=1):
+        cells = []
+        for c, value in enumerate(values):
+            ref = f"{_column_letter(c)}{r}"
+            if isinstance(value, (int, float)):
+                cells.append(f'<c r="{ref}"><v>{value}</v></c>')
+            else:
+                cells.append(f'<c r="{ref}" t="inlineStr"><is><t>{value}</t></is></c>')
+        xml_rows.append(f'<row r="{r}">{"".join(cells)}</row>')
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'
+        ))
+        workbook.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        workbook.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        workbook.writestr("xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>'
+        ))
+        workbook.writestr("xl/worksheets/sheet1.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f'<sheetData>{"".join(xml_rows)}</sheetData></worksheet>'
+        ))
+    return buffer.getvalue()
+
+
+def seed(scale, seed_value, storage_dir):
+    """Populate the configured database with clients, users, files and logs."""
+    # Imported lazily so DATABASE_URL/UPLOAD_DIR from the environment apply.
+    from sqlalchemy import insert
+    from app.database import Base, engine, SessionLocal
+    from app.models import Client, User, FileMeta, LogEntry
+    from app.utils import get_password_hash
+
+    rng = random.Random(seed_value)
+    Base.metadata.create_all(bind=engine)
+
+    blobs = []
+    for i in range(BLOB_COUNT):
+        path = storage_dir / f"blob_{i}.xlsx"
+        path.write_bytes(make_xlsx(rng.randint(10, 2_000), rng))
+        blobs.append(str(path))
+
+    client_count = max(1, scale // FILES_PER_CLIENT)
+    password = get_password_hash(BENCH_PASSWORD)
+    db = SessionLocal()
+    try:
+        db.execute(insert(Client), [{"id": i, "name": f"Client {i}"} for i in range(1, client_count + 1)])
+        users = [{"id": 1, "username": "bench_admin", "password": password, "role": "admin", "client_id": None}]
+        for client_id in range(1, client_count + 1):
+            users.append({"id": len(users) + 1, "username": f"employee{client_id}", "password": password,
+                          "role": "employee", "client_id": client_id})
+            users.append({"id": len(users) + 1, "username": f"client{client_id}", "password": password,
+                          "role": "client", "client_id": client_id})
+        db.execute(insert(User), users)
+
+        base_time = datetime.datetime(2024, 1, 1)
+        for batch_start in range(1, scale + 1, INSERT_BATCH_SIZE):
+            files, logs = [], []
+            for file_id in range(batch_start, min(batch_start + INSERT_BATCH_SIZE, scale + 1)):
+                client_id = rng.randint(1, client_count)
+                start = datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randint(0, 1800))
+                uploaded_at = base_time + datetime.timedelta(minutes=file_id)
+                uploader = 2 * client_id + 1  # the client's "client" user
+                files.append({
+                    "id": file_id,
+                    "filename": f"report_{file_id}.xlsx",
+                    "path": blobs[file_id % BLOB_COUNT],
+                    "uploaded_by": uploader,
+                    "client_id": client_id,
+                    "start_date": start,
+                    "end_date": start + datetime.timedelta(days=30),
+                    "uploaded_at": uploaded_at,
+                })
+                for n in range(LOGS_PER_FILE):
+                    logs.append({
+                        "user": f"client{client_id}",
+                        "action": "upload" if n == 0 else "download",
+                        "file_id": file_id,
+                        "timestamp": uploaded_at + datetime.timedelta(minutes=n),
+                    })
+            db.execute(insert(FileMeta), files)
+            db.execute(insert(LogEntry), logs)
+            db.commit()
+    finally:
+        db.close()
+    return {"clients": client_count, "users": len(users), "files": scale, "logs": scale * LOGS_PER_FILE}
+
+
+# ---------------------------------------------------------------------------
+# HTTP driver
+# ---------------------------------------------------------------------------
+
+class ApiClient:
+    """Keep-alive HTTP client with one connection per worker thread."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=300)
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            payload = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            self._local.connection = None
+            raise
+        return response.status, payload
+
+    def login(self, username, password):
+        body = urllib.parse.urlencode({"username": username, "password": password})
+        status, payload = self.request("POST", "/auth/login", body,
+                                       {"Content-Type": "application/x-www-form-urlencoded"})
+        if status != 200:
+            raise RuntimeError(f"Login failed for {username}: {status} {payload[:200]!r}")
+        return json.loads(payload)["access_token"]
+
+
+def multipart(fields, file_field, filename, content):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append((
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n'
+    ).encode() + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def run_scenario(name, count, concurrency, make_request):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = make_request(i)
+        except Exception:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    result = {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": round(quantiles[49], 2),
+        "p95_ms": round(quantiles[94], 2),
+        "p99_ms": round(quantiles[98], 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "throughput_rps": round(count / wall, 2),
+    }
+    print(f"  {name:<22} p50={result['p50_ms']:>9.2f}ms p95={result['p95_ms']:>9.2f}ms "
+          f"p99={result['p99_ms']:>9.2f}ms {result['throughput_rps']:>8.2f} req/s errors={errors}")
+    return result
+
+
+def drive(api, dataset, concurrency, seed_value, requests_scale):
+    rng = random.Random(seed_value)
+    clients = dataset["clients"]
+    counts = {name: max(1, int(n * requests_scale)) for name, n in SCENARIO_REQUESTS.items()}
+
+    admin_token = api.login("bench_admin", BENCH_PASSWORD)
+    employee_ids = [rng.randint(1, clients) for _ in range(min(clients, concurrency))]
+    employee_tokens = [api.login(f"employee{client_id}", BENCH_PASSWORD) for client_id in employee_ids]
+    upload_blob = make_xlsx(500, rng)
+    file_ids = [rng.randint(1, dataset["files"]) for _ in range(counts["download"])]
+    client_ids = [rng.randint(1, clients) for _ in range(counts["history_admin_client"])]
+
+    def auth(token):
+        return {"Authorization": f"Bearer {token}"}
+
+    def login(i):
+        username = f"employee{employee_ids[i % len(employee_ids)]}"
+        return api.login(username, BENCH_PASSWORD) is not None
+
+    def upload(i):
+        body, content_type = multipart({"start_date": "2024-01-01", "end_date": "2024-01-31"},
+                                       "file", f"bench_{i}.xlsx", upload_blob)
+        headers = {**auth(employee_tokens[i % len(employee_tokens)]), "Content-Type": content_type}
+        status, _ = api.request("POST", "/files/upload", body, headers)
+        return status == 200
+
+    def download(i):
+        status, _ = api.request("GET", f"/files/download/{file_ids[i]}?token={admin_token}")
+        return status == 200
+
+    def history(i):
+        status, _ = api.request("GET", "/files/history", headers=auth(employee_tokens[i % len(employee_tokens)]))
+        return status == 200
+
+    def history_admin_client(i):
+        status, _ = api.request("GET", f"/files/history?client_id={client_ids[i]}", headers=auth(admin_token))
+        return status == 200
+
+    def logs(i):
+        status, _ = api.request("GET", "/analytics/logs", headers=auth(admin_token))
+        return status == 200
+
+    scenarios = {
+        "login": login,
+        "upload": upload,
+        "download": download,
+        "history": history,
+        "history_admin_client": history_admin_client,
+        "logs": logs,
+    }
+    return {name: run_scenario(name, counts[name], concurrency, fn) for name, fn in scenarios.items()}
+
+
+# ---------------------------------------------------------------------------
+# Server lifecycle and baselines
+# ---------------------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env, port, workers, log_path):
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning", "--workers", str(workers)]
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API server did not start within 60 seconds")
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions of results against a baseline entry."""
+    regressions = []
+    for name, expected in baseline.items():
+        actual = results.get(name)
+        if actual is None:
+            continue
+        if actual["errors"] > expected.get("errors", 0):
+            regressions.append(f"{name}: {actual['errors']} errors (baseline {expected.get('errors', 0)})")
+        if actual["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {actual['p95_ms']}ms > baseline {expected['p95_ms']}ms")
+        if actual["throughput_rps"] < expected["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {actual['throughput_rps']} req/s < baseline {expected['throughput_rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a large dataset and benchmark the API")
+    parser.add_argument("--scale", choices=SCALES, default="1k", help="number of FileMeta rows to seed")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests-scale", type=float, default=1.0, help="multiplier for requests per scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="directory for the benchmark database and storage (default: temporary)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="dashboard-bench-"))
+    storage_dir = workdir / "storage"
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    database_path = workdir / f"bench_{args.scale}.db"
+    if database_path.exists():
+        database_path.unlink()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    os.environ["UPLOAD_DIR"] = str(storage_dir)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    print(f"Seeding {args.scale} dataset in {workdir} ...")
+    seed_started = time.perf_counter()
+    dataset = seed(SCALES[args.scale], args.seed, storage_dir)
+    seed_seconds = time.perf_counter() - seed_started
+    print(f"  {dataset} in {seed_seconds:.1f}s")
+
+    port = free_port()
+    # Measure the server itself, not the per-user admission limits
+    server_env = dict(os.environ, ADMISSION_ENABLED="false")
+    server = start_server(server_env, port, args.workers, workdir / "server.log")
+    try:
+        print(f"Driving API on port {port} with concurrency {args.concurrency} ...")
+        results = drive(ApiClient("127.0.0.1", port), dataset, args.concurrency, args.seed, args.requests_scale)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    report = {
+        "meta": {
+            "scale": args.scale,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "seed": args.seed,
+            "dataset": dataset,
+            "seed_seconds": round(seed_seconds, 2),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.datetime.utcnow().isoformat(),
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    print(output)
+
+    baselines = json.loads(Path(args.baseline).read_text()) if Path(args.baseline).exists() else {}
+    if args.save_baseline:
+        baselines[args.scale] = results
+        Path(args.baseline).write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"Baseline for {args.scale} saved to {args.baseline}")
+        return 0
+
+    if args.scale not in baselines:
+        print(f"No baseline stored for {args.scale}; run with --save-baseline to create one")
+        return 0
+    regressions = compare(results, baselines[args.scale], args.tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Compare download throughput of large files served by Python with the same
+downloads offloaded to nginx via X-Accel-Redirect (DOWNLOAD_OFFLOAD=nginx).
+
+Modes:
+    python   client -> uvicorn, bytes streamed by FileResponse
+    proxied  client -> nginx -> uvicorn, bytes streamed by FileResponse
+    offload  client -> nginx -> uvicorn (auth + log only), bytes sent by nginx
+
+The proxied and offload modes need an nginx binary (--nginx or on PATH) and
+are skipped without one. Reports MB/s, latency percentiles and the CPU time
+the API process spent per mode.
+
+Usage (from the backend directory):
+    python scripts/benchmark_offload.py --size-mb 100 --requests 20 --concurrency 4
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from benchmark import BACKEND_DIR, free_port, start_server
+
+READ_CHUNK = 1024 * 1024
+
+NGINX_CONF = """
+worker_processes 1;
+pid {workdir}/nginx.pid;
+error_log {workdir}/nginx-error.log;
+events {{ worker_connections 1024; }}
+http {{
+    access_log off;
+    client_body_temp_path {workdir}/nginx-tmp;
+    proxy_temp_path {workdir}/nginx-tmp;
+    server {{
+        listen 127.0.0.1:{port};
+        location / {{
+            proxy_pass http://127.0.0.1:{backend_port};
+            proxy_http_version 1.1;
+            proxy_set_header Connection "";
+        }}
+        location /protected-storage/ {{
+            internal;
+            alias {storage}/;
+            sendfile on;
+            tcp_nopush on;
+            sendfile_max_chunk 2m;
+        }}
+    }}
+}}
+"""
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process and its children (uvicorn workers)."""
+    total = 0.0
+    ticks = os.sysconf("SC_CLK_TCK")
+    pids = [pid]
+    children_path = f"/proc/{pid}/task/{pid}/children"
+    if os.path.exists(children_path):
+        pids += [int(child) for child in open(children_path).read().split()]
+    for each in pids:
+        try:
+            fields = open(f"/proc/{each}/stat").read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+
+def seed(workdir, size_mb):
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/offload.db"
+    os.environ["UPLOAD_DIR"] = str(workdir / "storage")
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app.database import SessionLocal, engine
+    from app.schema import prepare_database
+    from app.routes.auth import seed_demo_users
+    from app.models import FileMeta, User
+    from app.storage import storage_path
+
+    prepare_database(engine)
+    seed_demo_users()
+    db = SessionLocal()
+    try:
+        admin = db.query(User).filter(User.username == "admin").first()
+        file_meta = FileMeta(filename="large.xlsx", uploaded_by=admin.id, client_id=None, size=size_mb * READ_CHUNK)
+        db.add(file_meta)
+        db.flush()
+        file_meta.path = storage_path(file_meta.id, file_meta.filename)
+        with open(file_meta.path, "wb") as f:
+            block = os.urandom(READ_CHUNK)
+            for _ in range(size_mb):
+                f.write(block)
+        db.commit()
+        return file_meta.id
+    finally:
+        db.close()
+
+
+def login(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    connection.request("POST", "/auth/login", body="username=admin&password=admin123",
+                       headers={"Content-Type": "application/x-www-form-urlencoded"})
+    return json.loads(connection.getresponse().read())["access_token"]
+
+
+def drive(port, token, file_id, expected_bytes, requests, concurrency):
+    local = threading.local()
+
+    def one(_):
+        connection = getattr(local, "connection", None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+        started = time.perf_counter()
+        connection.request("GET", f"/files/download/{file_id}", headers={"Authorization": f"Bearer {token}"})
+        response = connection.getresponse()
+        received = 0
+        while True:
+            chunk = response.read(READ_CHUNK)
+            if not chunk:
+                break
+            received += len(chunk)
+        if response.status != 200 or received != expected_bytes:
+            raise RuntimeError(f"status {response.status}, {received} of {expected_bytes} bytes")
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": requests,
+        "throughput_mb_s": round(requests * expected_bytes / READ_CHUNK / wall, 1),
+        "p50_ms": round(quantiles[49], 1),
+        "p95_ms": round(quantiles[94], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Python-served vs nginx-offloaded downloads")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--nginx", default=shutil.which("nginx"), help="nginx binary (default: from PATH)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="dashboard-offload-"))
+    (workdir / "nginx-tmp").mkdir()
+    print(f"Writing a {args.size_mb} MB file in {workdir} ...")
+    file_id = seed(workdir, args.size_mb)
+    expected_bytes = args.size_mb * READ_CHUNK
+
+    modes = ["python"]
+    if args.nginx:
+        modes += ["proxied", "offload"]
+    else:
+        print("nginx not found: only the python mode is measured (pass --nginx to compare)")
+
+    results = {}
+    for mode in modes:
+        backend_port = free_port()
+        env = dict(os.environ, ADMISSION_ENABLED="false",
+                   DOWNLOAD_OFFLOAD="nginx" if mode == "offload" else "none")
+        server = start_server(env, backend_port, 1, workdir / f"server-{mode}.log")
+        nginx = None
+        try:
+            port = backend_port
+            if mode != "python":
+                port = free_port()
+                conf = workdir / "nginx.conf"
+                conf.write_text(NGINX_CONF.format(workdir=workdir, port=port, backend_port=backend_port,
+                                                  storage=workdir / "storage"))
+                nginx = subprocess.Popen([args.nginx, "-p", str(workdir), "-c", str(conf), "-g", "daemon off;"])
+                time.sleep(0.5)
+            token = login(port)
+            cpu_before = cpu_seconds(server.pid)
+            result = drive(port, token, file_id, expected_bytes, args.requests, args.concurrency)
+            result["api_cpu_seconds"] = round(cpu_seconds(server.pid) - cpu_before, 2)
+            results[mode] = result
+            print(f"  {mode:<8} {result['throughput_mb_s']:>8.1f} MB/s p50={result['p50_ms']:>8.1f}ms "
+                  f"p95={result['p95_ms']:>8.1f}ms api cpu={result['api_cpu_seconds']}s")
+        finally:
+            if nginx is not None:
+                nginx.terminate()
+                nginx.wait(timeout=30)
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {"size_mb": args.size_mb, "concurrency": args.concurrency, "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Upload throughput as tenants are added, with every client in the shared
+database (sharding off) and with every client in its own shard (on).
+
+For each tenant count a fresh database is seeded with that many clients (one
+employee each) and, for the sharded run, an empty active shard per client.
+The API is started with --workers processes and --uploads uploads are driven
+at --concurrency, spread evenly over the clients' employees. Validation and
+cell indexing are off so the runs measure the upload path itself: metadata
+insert, usage counters and audit log. Reports uploads/s, latency and errors
+per run and the sharded/shared throughput ratio per tenant count.
+
+Throughput only improves where the write lock is what limits it (several
+cores, slow fsync). So each run also probes the databases the uploads write
+to (the shared database, or every shard): every --probe-interval seconds the
+probe takes the write lock with BEGIN IMMEDIATE, releases it at once and
+records how long it waited. That wait is what an upload's commit waits
+behind other writers, and the probe measures it on any host.
+
+Usage (from the backend directory):
+    python scripts/benchmark_sharding.py --tenants 1 2 4 8 --workers 4 --uploads 400
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from benchmark import (
+    BACKEND_DIR, BENCH_PASSWORD, ApiClient, free_port, make_xlsx, multipart, run_scenario, start_server
+)
+
+
+def seed(tenants: int, sharded: bool):
+    """Runs in a subprocess so the app modules pick up this run's DATABASE_URL."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from sqlalchemy import insert
+    from app.database import engine, SessionLocal
+    from app.models import Client, User
+    from app.schema import prepare_database
+    from app.utils import get_password_hash
+    from app import sharding
+
+    prepare_database(engine)
+    password = get_password_hash(BENCH_PASSWORD)
+    db = SessionLocal()
+    try:
+        db.execute(insert(Client), [{"id": i, "name": f"Client {i}"} for i in range(1, tenants + 1)])
+        db.execute(insert(User), [
+            {"username": f"employee{i}", "password": password, "role": "employee", "client_id": i}
+            for i in range(1, tenants + 1)
+        ])
+        db.commit()
+        if sharded:
+            for client_id in range(1, tenants + 1):
+                sharding.create_shard(client_id)
+            for client_id in range(1, tenants + 1):
+                sharding.activate(db, client_id)
+            db.commit()
+    finally:
+        db.close()
+
+
+class LockProbe:
+    """Samples the wait for the write lock of SQLite databases, round robin, from a thread."""
+
+    def __init__(self, paths, interval: float):
+        self._paths = paths
+        self._interval = interval
+        self._waits = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._probe, daemon=True)
+
+    def _probe(self):
+        connections = [sqlite3.connect(path, timeout=60, isolation_level=None) for path in self._paths]
+        try:
+            while not self._stopped.is_set():
+                for conn in connections:
+                    started = time.perf_counter()
+                    conn.execute("BEGIN IMMEDIATE")
+                    self._waits.append((time.perf_counter() - started) * 1000)
+                    conn.execute("ROLLBACK")
+                self._stopped.wait(self._interval)
+        finally:
+            for conn in connections:
+                conn.close()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stopped.set()
+        self._thread.join()
+        waits = sorted(self._waits) or [0.0]
+        quantiles = statistics.quantiles(waits, n=100, method="inclusive") if len(waits) > 1 else waits * 99
+        return {
+            "lock_probes": len(self._waits),
+            "lock_wait_mean_ms": round(statistics.fmean(waits), 2),
+            "lock_wait_p95_ms": round(quantiles[94], 2),
+            "lock_wait_max_ms": round(waits[-1], 2),
+        }
+
+
+def run(tenants: int, sharded: bool, args, workdir: Path) -> dict:
+    run_dir = workdir / f"{tenants}-{'sharded' if sharded else 'shared'}"
+    (run_dir / "storage").mkdir(parents=True)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{run_dir / 'app.db'}",
+        UPLOAD_DIR=str(run_dir / "storage"),
+        SHARD_DIR=str(run_dir / "shards"),
+        SHARDING_ENABLED="true" if sharded else "false",
+        ADMISSION_ENABLED="false",
+        VALIDATION_ENABLED="false",
+        CELL_INDEX_ENABLED="false",
+    )
+    command = [sys.executable, __file__, "--seed-tenants", str(tenants)] + (["--seed-sharded"] if sharded else [])
+    subprocess.run(command, env=env, check=True)
+
+    port = free_port()
+    server = start_server(env, port, args.workers, run_dir / "server.log")
+    try:
+        api = ApiClient("127.0.0.1", port)
+        tokens = [api.login(f"employee{client_id}", BENCH_PASSWORD) for client_id in range(1, tenants + 1)]
+        blob = make_xlsx(args.rows, random.Random(args.seed))
+
+        def upload(i):
+            body, content_type = multipart({"start_date": "2024-01-01", "end_date": "2024-01-31"},
+                                           "file", f"bench_{i}.xlsx", blob)
+            headers = {"Authorization": f"Bearer {tokens[i % tenants]}", "Content-Type": content_type}
+            status, _ = api.request("POST", "/files/upload", body, headers)
+            return status == 200
+
+        name = f"{tenants} tenants, {'sharded' if sharded else 'shared'}"
+        databases = sorted((run_dir / "shards").glob("*.db")) if sharded else [run_dir / "app.db"]
+        probe = LockProbe(databases, args.probe_interval)
+        probe.start()
+        try:
+            result = run_scenario(name, args.uploads, args.concurrency, upload)
+        finally:
+            locks = probe.stop()
+        result.update(locks)
+        print(f"  {'':<22} write lock wait: mean={result['lock_wait_mean_ms']:.2f}ms "
+              f"p95={result['lock_wait_p95_ms']:.2f}ms max={result['lock_wait_max_ms']:.2f}ms "
+              f"({result['lock_probes']} probes)")
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--uploads", type=int, default=400, help="uploads per run")
+    parser.add_argument("--rows", type=int, default=50, help="rows of the uploaded workbook")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--probe-interval", type=float, default=0.01,
+                        help="seconds between write lock probes of the databases")
+    parser.add_argument("--workdir", help="directory for the databases and storage (default: temporary)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--seed-tenants", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--seed-sharded", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_tenants:
+        seed(args.seed_tenants, args.seed_sharded)
+        return 0
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="dashboard-shards-"))
+    print(f"Uploading {args.uploads} files per run with {args.workers} workers, concurrency {args.concurrency}")
+    results = {}
+    for tenants in args.tenants:
+        shared = run(tenants, False, args, workdir)
+        sharded = run(tenants, True, args, workdir)
+        results[tenants] = {
+            "shared": shared,
+            "sharded": sharded,
+            "speedup": round(sharded["throughput_rps"] / max(shared["throughput_rps"], 0.01), 2),
+        }
+
+    print(f"\n{'tenants':>8} {'shared/s':>10} {'sharded/s':>10} {'speedup':>8} {'shared wait':>12} {'sharded wait':>13}")
+    for tenants, result in results.items():
+        print(f"{tenants:>8} {result['shared']['throughput_rps']:>10.1f} "
+              f"{result['sharded']['throughput_rps']:>10.1f} {result['speedup']:>7.2f}x "
+              f"{result['shared']['lock_wait_mean_ms']:>10.2f}ms {result['sharded']['lock_wait_mean_ms']:>11.2f}ms")
+    report = {
+        "meta": {key: getattr(args, key)
+                 for key in ("workers", "concurrency", "uploads", "rows", "seed", "probe_interval")},
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
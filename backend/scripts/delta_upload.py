@@ -0,0 +1,132 @@
+"""
+Upload a new version of a stored file as a delta against it (see
+app/versions.py): fetches the block signatures of the base file, finds the
+blocks the new file still contains with a rolling Adler-32 and sends only the
+rest. Falls back to a whole-file upload if the server rejects the delta.
+
+Usage (from the backend directory, with the API running):
+    python scripts/delta_upload.py --username client1 --password client123 \\
+        --base 42 --file report.xls --start-date 2024-01-01 --end-date 2024-01-31
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from benchmark import ApiClient, multipart
+
+ADLER_MOD = 65521
+STRONG_HASH_HEX = 32  # versions.STRONG_HASH_BYTES in hex
+
+
+def _roll(a, b, out_byte, in_byte, block_size):
+    """Adler-32 parts of the window moved one byte: out_byte leaves, in_byte enters."""
+    a = (a - out_byte + in_byte) % ADLER_MOD
+    b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+    return a, b
+
+
+def compute_delta(content: bytes, blocks: list, block_size: int):
+    """Operations and literal bytes that build content from the base's blocks."""
+    table = {}
+    for index, (weak, strong) in enumerate(blocks):
+        table.setdefault(weak, {}).setdefault(strong, index)
+    ops, literals = [], bytearray()
+    literal_start = 0
+
+    def flush_literals(end):
+        if end > literal_start:
+            literals.extend(content[literal_start:end])
+            if ops and "data" in ops[-1]:
+                ops[-1]["data"] += end - literal_start
+            else:
+                ops.append({"data": end - literal_start})
+
+    def copy(index):
+        if ops and "copy" in ops[-1] and sum(ops[-1]["copy"]) == index:
+            ops[-1]["copy"][1] += 1
+        else:
+            ops.append({"copy": [index, 1]})
+
+    position = 0
+    a = b = None
+    while position < len(content):
+        window = content[position:position + block_size]
+        if a is None:
+            checksum = zlib.adler32(window)
+            a, b = checksum & 0xFFFF, checksum >> 16
+        candidates = table.get((b << 16) | a)
+        if candidates:
+            index = candidates.get(hashlib.sha256(window).hexdigest()[:STRONG_HASH_HEX])
+            # Only the base's last block may be short
+            if index is not None and (len(window) == block_size or index == len(blocks) - 1):
+                flush_literals(position)
+                copy(index)
+                position += len(window)
+                literal_start = position
+                a = None
+                continue
+        if position + block_size < len(content):
+            a, b = _roll(a, b, content[position], content[position + block_size], block_size)
+        else:
+            a = None  # the window runs past the end: shrink it instead
+        position += 1
+    flush_literals(len(content))
+    return ops, bytes(literals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--base", type=int, required=True, help="id of the stored version to send the delta against")
+    parser.add_argument("--file", required=True, help="the new version")
+    parser.add_argument("--start-date", required=True)
+    parser.add_argument("--end-date", required=True)
+    args = parser.parse_args()
+
+    api = ApiClient(args.host, args.port)
+    auth = {"Authorization": f"Bearer {api.login(args.username, args.password)}"}
+    status, payload = api.request("GET", f"/files/{args.base}/signatures", headers=auth)
+    if status != 200:
+        sys.exit(f"Couldn't get the signatures of file {args.base}: {status} {payload[:200]!r}")
+    signatures = json.loads(payload)
+
+    content = Path(args.file).read_bytes()
+    ops, literals = compute_delta(content, signatures["blocks"], signatures["block_size"])
+    filename = os.path.basename(args.file)
+    fields = {
+        "base_file_id": args.base,
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+        "block_size": signatures["block_size"],
+        "ops": json.dumps(ops),
+        "sha256": hashlib.sha256(content).hexdigest(),
+        "filename": filename,
+    }
+    body, content_type = multipart(fields, "data", "delta", literals)
+    status, payload = api.request("POST", "/files/upload/delta", body, {**auth, "Content-Type": content_type})
+    if status == 200:
+        result = json.loads(payload)
+        print(f"Uploaded version {result['version']} as file {result['file_id']}: "
+              f"sent {len(literals)} of {len(content)} bytes ({len(literals) / max(len(content), 1):.0%})")
+        return
+
+    print(f"Delta rejected ({status} {payload[:200]!r}), uploading the whole file")
+    fields = {"start_date": args.start_date, "end_date": args.end_date}
+    body, content_type = multipart(fields, "file", filename, content)
+    status, payload = api.request("POST", "/files/upload", body, {**auth, "Content-Type": content_type})
+    if status != 200:
+        sys.exit(f"Upload failed: {status} {payload[:200]!r}")
+    result = json.loads(payload)
+    print(f"Uploaded version {result.get('version')} as file {result['file_id']}")
+
+
+if __name__ == "__main__":
+    main()
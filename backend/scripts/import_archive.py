@@ -0,0 +1,384 @@
+"""
+Import an archive of spreadsheets directly into the database and storage,
+without going through the API (e.g. onboarding a client's past reports).
+
+The files come from a directory tree, with the client and period read from
+each file's path relative to it by --pattern, or from a CSV manifest with
+the columns path, client, start_date, end_date (paths relative to the
+manifest). Pattern groups:
+    client          client name, or id if numeric
+    start, end      dates as YYYY-MM-DD or YYYYMMDD
+    year [, month]  the whole year or month, when there's no start/end
+--client, --start-date and --end-date fill in what the paths don't give.
+
+A pool of --workers threads hashes and copies the files into storage; the
+rows of each batch of --batch-size files of one client (FileMeta, "upload"
+audit entries, usage counters) are inserted in one transaction, in the
+client's tenant shard if it has one. Re-imported reports become new versions
+of the stored ones, like re-uploads. Quotas are not enforced.
+
+Each committed source path is appended to the checkpoint file, and a run
+skips the paths already in it, so an interrupted import continues where it
+stopped. If it is killed between a commit and the checkpoint write, that one
+batch is imported again.
+
+Run scripts/index_cells.py and scripts/validate_files.py afterwards to index
+and validate the imported files.
+
+Usage (from the backend directory):
+    python scripts/import_archive.py --root /archive                # /archive/<client>/<year>/[<month>/]*.xls[x]
+    python scripts/import_archive.py --root /acme --client AcmeCorp \\
+        --pattern '(?P<start>\\d{8})-(?P<end>\\d{8})'                # /acme/**/sales_20190101-20190331.xlsx
+    python scripts/import_archive.py --manifest files.csv --dry-run
+"""
+import argparse
+import calendar
+import csv
+import datetime
+import hashlib
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, insert, update
+from app.config import UPLOAD_DIR
+from app.database import SessionLocal, engine
+from app.models import FileMeta, LogEntry, Client, User
+from app.schema import prepare_database
+from app.storage import storage_path, copy_blob, remove_quietly
+from app.usage import record_usage
+from app.access import file_tags
+from app.cache import cache
+from app import sharding
+
+DEFAULT_PATTERN = r"^(?P<client>[^/]+)/(?P<year>\d{4})/(?:(?P<month>\d{1,2})/)?"
+EXTENSIONS = (".xls", ".xlsx")
+MAX_FILE_SIZE = 100 * 1024 * 1024  # the upload limit
+# Files being copied go here first, then are renamed into place once they have ids
+STAGING_DIR = os.path.join(UPLOAD_DIR, ".import")
+
+
+def _parse_date(value: str) -> datetime.date:
+    for format in ("%Y-%m-%d", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(value, format).date()
+        except ValueError:
+            pass
+    raise ValueError(f"not a date: {value!r}")
+
+
+def _period(groups: dict, args) -> tuple:
+    """(start_date, end_date) from the groups of a path, falling back to the command line."""
+    start = _parse_date(groups["start"]) if groups.get("start") else args.start_date
+    end = _parse_date(groups["end"]) if groups.get("end") else args.end_date
+    if groups.get("year") and (start is None or end is None):
+        year = int(groups["year"])
+        month = int(groups["month"]) if groups.get("month") else None
+        start = start or datetime.date(year, month or 1, 1)
+        end = end or datetime.date(year, month or 12, calendar.monthrange(year, month or 12)[1])
+    if start is None or end is None:
+        raise ValueError("no period")
+    if start > end:
+        raise ValueError("start after end")
+    return start, end
+
+
+def scan_tree(root: str, args):
+    """An entry (source, key, client, period) per spreadsheet under root, or (relative path, reason) to skip it."""
+    pattern = re.compile(args.pattern)
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            source = os.path.join(directory, filename)
+            relative = os.path.relpath(source, root).replace(os.sep, "/")
+            if not filename.lower().endswith(EXTENSIONS):
+                continue
+            match = pattern.search(relative)
+            groups = match.groupdict() if match else {}
+            try:
+                start, end = _period(groups, args)
+            except ValueError as e:
+                yield relative, f"period: {e}"
+                continue
+            client = args.client or groups.get("client")
+            if not client:
+                yield relative, "no client"
+                continue
+            yield SimpleNamespace(source=source, key=relative, client=client, start_date=start, end_date=end)
+
+
+def scan_manifest(manifest: str, args):
+    """Like scan_tree, from a CSV manifest."""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline="") as f:
+        for row in csv.DictReader(f):
+            relative = row["path"]
+            if not relative.lower().endswith(EXTENSIONS):
+                yield relative, "not a spreadsheet"
+                continue
+            try:
+                start, end = _period({"start": row.get("start_date"), "end": row.get("end_date")}, args)
+            except ValueError as e:
+                yield relative, f"period: {e}"
+                continue
+            client = row.get("client") or args.client
+            if not client:
+                yield relative, "no client"
+                continue
+            yield SimpleNamespace(
+                source=os.path.join(base, relative), key=relative, client=client, start_date=start, end_date=end
+            )
+
+
+def resolve_clients(names, create: bool) -> dict:
+    """Client id of each client name or id in the paths; unknown names are created if asked to."""
+    db = SessionLocal()
+    try:
+        clients, created = {}, False
+        by_name = dict(db.execute(select(Client.name, Client.id)).all())
+        ids = set(by_name.values())
+        for name in names:
+            if name in by_name:
+                clients[name] = by_name[name]
+            elif name.isdigit() and int(name) in ids:
+                clients[name] = int(name)
+            elif create:
+                client = Client(name=name)
+                db.add(client)
+                db.flush()
+                clients[name] = by_name[name] = client.id
+                created = True
+                print(f"Created client {name} ({client.id})")
+        db.commit()
+        if created:
+            cache.invalidate_tags(["clients"])
+        return clients
+    finally:
+        db.close()
+
+
+def read_checkpoint(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def stage(entry):
+    """Hash and copy one file into the staging directory."""
+    digest = hashlib.sha256()
+    staged = os.path.join(STAGING_DIR, f"{os.getpid()}_{entry.position}")
+    size = copy_blob(entry.source, staged, None, digest)
+    return SimpleNamespace(**{**vars(entry), "staged": staged, "size": size, "sha256": digest.hexdigest()})
+
+
+def _latest_versions(session, client_id: int, files) -> dict:
+    """(filename, start_date, end_date) -> (id, version) of the latest stored version of each report in the batch."""
+    latest = {}
+    rows = session.execute(
+        select(FileMeta.id, FileMeta.version, FileMeta.filename, FileMeta.start_date, FileMeta.end_date)
+        .where(
+            FileMeta.client_id == client_id,
+            FileMeta.filename.in_({file.filename for file in files}),
+            FileMeta.path.isnot(None)
+        )
+        .order_by(FileMeta.id)
+    ).all()
+    for row in rows:
+        latest[(row.filename, row.start_date, row.end_date)] = (row.id, row.version or 1)
+    return latest
+
+
+def commit_batch(client_id: int, user, files) -> list:
+    """Insert the rows of one client's staged files and move the files into storage; returns the FileMeta ids."""
+    session = sharding.session_for_client(client_id)
+    placed = []
+    try:
+        for file in files:
+            file.filename = os.path.basename(file.source)
+        ids = session.execute(
+            insert(FileMeta).returning(FileMeta.id, sort_by_parameter_order=True),
+            [{
+                "filename": file.filename, "uploaded_by": user.id, "client_id": client_id,
+                "start_date": file.start_date, "end_date": file.end_date, "size": file.size, "sha256": file.sha256
+            } for file in files]
+        ).scalars().all()
+
+        # Same report as a stored file or an earlier one of the batch: the next version
+        latest = _latest_versions(session, client_id, files)
+        changes = []
+        for file_id, file in zip(ids, files):
+            key = (file.filename, file.start_date, file.end_date)
+            previous_id, previous_version = latest.get(key, (None, 0))
+            path = storage_path(file_id, file.filename)
+            os.replace(file.staged, path)
+            placed.append(path)
+            changes.append({
+                "id": file_id, "path": path, "version": previous_version + 1, "previous_version_id": previous_id
+            })
+            latest[key] = (file_id, previous_version + 1)
+        session.execute(update(FileMeta), changes)
+        session.execute(insert(LogEntry), [
+            {"user": user.username, "action": "upload", "file_id": file_id} for file_id in ids
+        ])
+        record_usage(session, client_id, user.id, sum(file.size for file in files), len(files))
+        session.commit()
+    except BaseException:
+        session.rollback()
+        for path in placed:
+            remove_quietly(path)
+        raise
+    finally:
+        session.close()
+    cache.invalidate_tags(file_tags([SimpleNamespace(client_id=client_id, uploaded_by=user.id)]))
+    return ids
+
+
+def batches(entries, batch_size: int):
+    """The entries in batches of one client each, in order."""
+    by_client = defaultdict(list)
+    for entry in entries:
+        by_client[entry.client_id].append(entry)
+    for client_id, client_entries in by_client.items():
+        for start in range(0, len(client_entries), batch_size):
+            yield client_id, client_entries[start:start + batch_size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--root", help="directory tree to import")
+    source.add_argument("--manifest", help="CSV with path, client, start_date, end_date")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="regex for paths relative to --root")
+    parser.add_argument("--client", help="client of files whose path doesn't name one")
+    parser.add_argument("--start-date", type=_parse_date, help="period start of files whose path doesn't give one")
+    parser.add_argument("--end-date", type=_parse_date, help="period end of files whose path doesn't give one")
+    parser.add_argument("--create-clients", action="store_true", help="create clients that don't exist yet")
+    parser.add_argument("--user", default="admin", help="user recorded as the uploader (default: admin)")
+    parser.add_argument("--workers", type=int, default=8, help="files hashed and copied at once (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=500, help="files inserted per transaction (default: 500)")
+    parser.add_argument("--checkpoint", help="file of imported paths (default: <root or manifest>.checkpoint)")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would be imported")
+    args = parser.parse_args()
+    checkpoint_path = args.checkpoint or os.path.abspath(args.root or args.manifest).rstrip(os.sep) + ".checkpoint"
+
+    prepare_database(engine)
+    db = SessionLocal()
+    user = db.execute(select(User).where(User.username == args.user)).scalar_one_or_none()
+    db.close()
+    if user is None:
+        sys.exit(f"No user {args.user}")
+
+    done = read_checkpoint(checkpoint_path)
+    entries, skipped = [], Counter()
+    scanned = scan_tree(args.root, args) if args.root else scan_manifest(args.manifest, args)
+    for entry in scanned:
+        if isinstance(entry, tuple):
+            skipped[entry[1]] += 1
+            print(f"Skipping {entry[0]}: {entry[1]}")
+        elif entry.key in done:
+            skipped["imported before"] += 1
+        else:
+            entries.append(entry)
+
+    clients = resolve_clients({entry.client for entry in entries}, args.create_clients and not args.dry_run)
+    unknown = sorted({entry.client for entry in entries} - set(clients))
+    if unknown:
+        message = f"Unknown clients: {', '.join(unknown)} (--create-clients creates them)"
+        if not args.dry_run:
+            sys.exit(message)
+        print(message)
+    for position, entry in enumerate(entries):
+        entry.client_id = clients.get(entry.client)
+        entry.position = position
+        try:
+            entry.size = os.path.getsize(entry.source)
+        except OSError as e:
+            entry.size = None
+            skipped["unreadable"] += 1
+            print(f"Skipping {entry.key}: {e}")
+        else:
+            if entry.size > MAX_FILE_SIZE:
+                skipped["too large"] += 1
+                print(f"Skipping {entry.key}: larger than {MAX_FILE_SIZE} bytes")
+    entries = [entry for entry in entries if entry.size is not None and entry.size <= MAX_FILE_SIZE]
+
+    total_bytes = sum(entry.size for entry in entries)
+    print(f"{len(entries)} files ({total_bytes / 2**20:.1f} MB) to import; skipped: {dict(skipped) or 'none'}")
+    if args.dry_run:
+        for (client, start, end), count in sorted(Counter(
+            (entry.client, entry.start_date, entry.end_date) for entry in entries
+        ).items()):
+            print(f"  {client} {start} - {end}: {count} files")
+        return
+
+    started = time.perf_counter()
+    totals = Counter()
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=args.workers) as pool, open(checkpoint_path, "a") as checkpoint:
+
+        def finish(client_id, futures):
+            files = []
+            for future in futures:
+                try:
+                    files.append(future.result())
+                except OSError as e:
+                    totals["failed"] += 1
+                    print(f"Skipping a file: {e}")
+            if not files:
+                return
+            try:
+                commit_batch(client_id, user, files)
+            except BaseException:
+                for file in files:
+                    remove_quietly(file.staged)
+                raise
+            checkpoint.writelines(f"{file.key}\n" for file in files)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+            totals["files"] += len(files)
+            totals["bytes"] += sum(file.size for file in files)
+            elapsed = time.perf_counter() - started
+            print(f"  {totals['files']}/{len(entries)} files, {totals['files'] / elapsed:.1f} files/s, "
+                  f"{totals['bytes'] / 2**20 / elapsed:.1f} MB/s")
+
+        pending = None
+        for client_id, batch in batches(entries, args.batch_size):
+            # This batch is copied while the previous one is inserted
+            futures = [pool.submit(stage, entry) for entry in batch]
+            if pending is not None:
+                try:
+                    finish(*pending)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    for future in futures:
+                        if not future.cancelled() and future.exception() is None:
+                            remove_quietly(future.result().staged)
+                    raise
+            pending = (client_id, futures)
+        if pending is not None:
+            finish(*pending)
+    try:
+        os.rmdir(STAGING_DIR)
+    except OSError:
+        pass
+
+    imported, imported_bytes = totals["files"], totals["bytes"]
+    elapsed = time.perf_counter() - started
+    print(f"Imported {imported} files ({imported_bytes / 2**20:.1f} MB) in {elapsed:.1f}s: "
+          f"{imported / elapsed if elapsed else 0:.1f} files/s, {imported_bytes / 2**20 / elapsed if elapsed else 0:.1f} MB/s")
+    if totals["failed"]:
+        print(f"{totals['failed']} files couldn't be read; run again to retry them")
+    if imported:
+        print("Run scripts/index_cells.py and scripts/validate_files.py to index and validate them")
+
+
+if __name__ == "__main__":
+    main()
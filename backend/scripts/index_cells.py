@@ -0,0 +1,45 @@
+"""
+Index the cell contents of files that have no cell index yet (e.g. files
+uploaded before the index existed or while indexing was disabled).
+
+Usage (from the backend directory):
+    python scripts/index_cells.py            # only files without an index
+    python scripts/index_cells.py --all      # rebuild every file
+    python scripts/index_cells.py --failed   # retry files that failed
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from app.database import SessionLocal, engine
+from app.models import FileMeta, CellIndexStatus
+from app.content_index import index_file
+from app.schema import prepare_database
+from app.sharding import sessions
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("--all", action="store_true", help="re-index every file")
+parser.add_argument("--failed", action="store_true", help="also retry files whose indexing failed")
+args = parser.parse_args()
+
+prepare_database(engine)
+db = SessionLocal()
+query = select(FileMeta.id).outerjoin(CellIndexStatus, CellIndexStatus.file_id == FileMeta.id)
+if not args.all:
+    if args.failed:
+        query = query.where((CellIndexStatus.file_id.is_(None)) | (CellIndexStatus.status == "failed"))
+    else:
+        query = query.where(CellIndexStatus.file_id.is_(None))
+# The catalog's files, then those of every tenant shard
+file_ids = [file_id for session in sessions(db) for file_id in session.execute(query.order_by(FileMeta.id)).scalars()]
+db.close()
+
+print(f"Indexing {len(file_ids)} files")
+for position, file_id in enumerate(file_ids, start=1):
+    index_file(file_id)
+    if position % 100 == 0:
+        print(f"  {position}/{len(file_ids)}")
+print("Done")
@@ -0,0 +1,30 @@
+"""
+Recompute the per-client and per-user storage usage counters from the files
+table, repairing any drift (e.g. after files were removed outside the API).
+Files without a recorded size get it from disk. Quotas are left unchanged.
+With tenant shards, the catalog and every active shard are reconciled.
+
+Usage (from the backend directory):
+    python scripts/reconcile_usage.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal, engine
+from app.schema import prepare_database
+from app.usage import reconcile
+from app.sharding import sessions
+
+prepare_database(engine)
+db = SessionLocal()
+try:
+    drift = [entry for session in sessions(db) for entry in reconcile(session)]
+finally:
+    db.close()
+
+for entry in drift:
+    print(f"client {entry['client_id']}: bytes {entry['bytes'][0]} -> {entry['bytes'][1]}, "
+          f"files {entry['files'][0]} -> {entry['files'][1]}")
+print(f"Done, {len(drift)} clients corrected")
@@ -0,0 +1,297 @@
+"""
+Move clients out of the main database into their own tenant shards while the
+API keeps serving them (see app/sharding.py; SHARDING_ENABLED must be set for
+the API and this script).
+
+For each client:
+  1. create its shard database (state "copying") and start recording changes
+     to tenant tables in split_changes with triggers on the catalog
+  2. copy the client's rows in batches, then apply the recorded changes
+     until few are left
+  3. under the catalog's write lock, apply the rest and mark the shard
+     active: requests for the client go to the shard from then on
+  4. wait --grace seconds for requests routed to the catalog before the
+     switch, apply what they changed, stop recording and delete the client's
+     rows from the catalog
+  5. move the client's blobs into its storage root (unless --keep-blobs) and
+     recompute the usage counters of the shard and the catalog
+
+Until step 4 ends, admin listings over all clients show the client's files
+twice. Signed download links issued before the blobs moved stop working.
+Run one split at a time; if one fails, run it again: the copy restarts.
+
+Usage (from the backend directory):
+    python scripts/split_tenants.py --client 3 --client 7
+    python scripts/split_tenants.py --all --grace 60
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, delete, insert, update, or_
+from sqlalchemy.dialects import sqlite
+from app.database import SessionLocal, engine
+from app.models import (
+    FileMeta, LogEntry, CellPosting, CellIndexStatus, ValidationReport, ClientUsage, UserUsage, User, Client,
+    TenantShard, ShardedFile, SplitChange
+)
+from app.schema import prepare_database
+from app.storage import TENANT_ID_SHIFT, tenant_root, remove_quietly
+from app.config import SHARDING_ENABLED
+from app.cache import cache
+from app import sharding, usage
+
+BATCH_SIZE = 500  # keys per statement, under SQLite's bound-parameter limit
+POSTINGS_BATCH_SIZE = 20  # files per batch of cell postings
+CATCH_UP_ROUNDS = 10
+CATCH_UP_TARGET = 200  # changes left to apply under the catalog's write lock
+
+# Column identifying the rows of each tenant table in split_changes; files first
+KEYS = {
+    "files": FileMeta.id,
+    "logs": LogEntry.id,
+    "cell_postings": CellPosting.file_id,
+    "cell_index_status": CellIndexStatus.file_id,
+    "validation_reports": ValidationReport.file_id,
+    "client_usage": ClientUsage.client_id,
+    "user_usage": UserUsage.user_id,
+}
+
+
+def tenant_filters(client_id: int) -> dict:
+    """Condition selecting the client's rows of each tenant table in the catalog."""
+    files = select(FileMeta.id).where(FileMeta.client_id == client_id)
+    users = select(User.id).where(User.client_id == client_id)
+    usernames = select(User.username).where(User.client_id == client_id)
+    return {
+        "files": FileMeta.client_id == client_id,
+        "logs": or_(LogEntry.file_id.in_(files), LogEntry.user.in_(usernames)),
+        "cell_postings": CellPosting.file_id.in_(files),
+        "cell_index_status": CellIndexStatus.file_id.in_(files),
+        "validation_reports": ValidationReport.file_id.in_(files),
+        "client_usage": ClientUsage.client_id == client_id,
+        "user_usage": UserUsage.user_id.in_(users),
+    }
+
+
+def capture_triggers():
+    """(name, DDL) of the triggers recording changed keys of tenant tables."""
+    triggers = []
+    for name, column in KEYS.items():
+        for operation, rows in (("INSERT", ("new",)), ("UPDATE", ("old", "new")), ("DELETE", ("old",))):
+            trigger = f"split_capture_{name}_{operation.lower()}"
+            # Not INSERT OR IGNORE: an upsert's own conflict handling would override it
+            body = " ".join(
+                f"INSERT INTO split_changes (table_name, \"key\") SELECT '{name}', {row}.{column.name} "
+                f"WHERE NOT EXISTS (SELECT 1 FROM split_changes WHERE table_name = '{name}' "
+                f"AND \"key\" = {row}.{column.name});"
+                for row in rows
+            )
+            triggers.append((trigger, f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {operation} ON {name} BEGIN {body} END"))
+    return triggers
+
+
+def sync(catalog, shard, client_id, name, keys, filters) -> int:
+    """Make the shard's rows with these keys match the client's rows in the catalog."""
+    column = KEYS[name]
+    rows = catalog.execute(select(column.table).where(column.in_(keys), filters[name])).mappings().all()
+    shard.execute(delete(column.table).where(column.in_(keys)))
+    if rows:
+        shard.execute(insert(column.table), [dict(row) for row in rows])
+    if name == "files":
+        moved = [{"file_id": row["id"], "client_id": client_id} for row in rows if not row["id"] >> TENANT_ID_SHIFT]
+        if moved:
+            catalog.execute(sqlite.insert(ShardedFile).on_conflict_do_nothing(), moved)
+    return len(rows)
+
+
+def copy_all(catalog, shard_engine, client_id, filters):
+    for name, column in KEYS.items():
+        batch_size = POSTINGS_BATCH_SIZE if name == "cell_postings" else BATCH_SIZE
+        last, copied = None, 0
+        while True:
+            query = select(column).where(filters[name]).distinct().order_by(column).limit(batch_size)
+            if last is not None:
+                query = query.where(column > last)
+            keys = catalog.execute(query).scalars().all()
+            if not keys:
+                break
+            with shard_engine.begin() as shard:
+                copied += sync(catalog, shard, client_id, name, keys, filters)
+            last = keys[-1]
+        print(f"  {name}: {copied} rows")
+
+
+def drain(catalog, shard_engine, client_id, filters) -> int:
+    """Apply the changes recorded since the last drain; returns how many keys changed."""
+    changes = catalog.execute(delete(SplitChange).returning(SplitChange.table_name, SplitChange.key)).all()
+    by_table = defaultdict(list)
+    for name, key in changes:
+        by_table[name].append(key)
+    with shard_engine.begin() as shard:
+        for name in KEYS:
+            keys = by_table.get(name, [])
+            for i in range(0, len(keys), BATCH_SIZE):
+                sync(catalog, shard, client_id, name, keys[i:i + BATCH_SIZE], filters)
+    return len(changes)
+
+
+def purge(catalog, filters):
+    """Delete the client's rows from the catalog in batches (files last: the other filters use them)."""
+    for name in reversed(KEYS):
+        column = KEYS[name]
+        deleted = 0
+        while True:
+            keys = catalog.execute(select(column).where(filters[name]).distinct().limit(BATCH_SIZE)).scalars().all()
+            if not keys:
+                break
+            deleted += catalog.execute(delete(column.table).where(column.in_(keys), filters[name])).rowcount
+        print(f"  {name}: {deleted} rows removed from the catalog")
+
+
+def move_blobs(shard_engine, client_id) -> int:
+    """
+    Hard-link (or copy) blobs into the tenant root, repoint their rows, then
+    drop the old names. Cold-tier blobs stay where they are.
+    """
+    root = tenant_root(client_id)
+    os.makedirs(root, exist_ok=True)
+    moved = []
+    db = SessionLocal(bind=shard_engine)
+    try:
+        rows = db.execute(select(FileMeta.id, FileMeta.path).where(FileMeta.path.isnot(None), FileMeta.storage_tier.is_(None))).all()
+        for file_id, path in rows:
+            if os.path.dirname(os.path.abspath(path)) == os.path.abspath(root):
+                continue
+            target = os.path.join(root, os.path.basename(path))
+            try:
+                if not os.path.exists(target):
+                    try:
+                        os.link(path, target)
+                    except OSError:
+                        shutil.copy2(path, target)
+            except FileNotFoundError:
+                print(f"  missing blob of file {file_id}: {path}")
+                continue
+            db.execute(update(FileMeta).where(FileMeta.id == file_id).values(path=target))
+            moved.append(path)
+            if len(moved) % BATCH_SIZE == 0:
+                db.commit()
+        db.commit()
+    finally:
+        db.close()
+    for path in moved:
+        remove_quietly(path)
+    return len(moved)
+
+
+def invalidate_listings(client_id):
+    db = SessionLocal()
+    try:
+        users = db.execute(select(User.id).where(User.client_id == client_id)).scalars().all()
+    finally:
+        db.close()
+    cache.invalidate_tags(["files", "usage", f"client:{client_id}"] + [f"uploader:{user_id}" for user_id in users])
+
+
+def split(client_id: int, grace: float, keep_blobs: bool):
+    db = SessionLocal()
+    try:
+        shard_row = db.get(TenantShard, client_id)
+        if shard_row is not None and shard_row.state == "active":
+            print(f"Client {client_id} already has an active shard")
+            return
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    print(f"Splitting client {client_id}")
+    shard_engine = sharding.shard_engine(sharding.create_shard(client_id))
+    filters = tenant_filters(client_id)
+    catalog = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        for _, statement in capture_triggers():
+            catalog.exec_driver_sql(statement)
+        catalog.execute(delete(SplitChange))  # a full copy follows
+
+        copy_all(catalog, shard_engine, client_id, filters)
+        for round_number in range(1, CATCH_UP_ROUNDS + 1):
+            changed = drain(catalog, shard_engine, client_id, filters)
+            print(f"  catch-up {round_number}: {changed} changed keys")
+            if changed <= CATCH_UP_TARGET:
+                break
+
+        # No catalog write can commit between the last drain and the switch
+        catalog.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            changed = drain(catalog, shard_engine, client_id, filters)
+            sharding.activate(catalog, client_id)
+            catalog.exec_driver_sql("COMMIT")
+        except Exception:
+            catalog.exec_driver_sql("ROLLBACK")
+            raise
+        invalidate_listings(client_id)
+        print(f"  shard active after {time.perf_counter() - started:.1f}s ({changed} keys applied during the switch)")
+
+        # Workers re-read a client's state after STATE_TTL; requests already routed finish meanwhile
+        wait = max(grace, sharding.STATE_TTL + 1)
+        print(f"  waiting {wait:.0f}s for requests routed before the switch")
+        time.sleep(wait)
+        for trigger, _ in capture_triggers():
+            catalog.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+        print(f"  {drain(catalog, shard_engine, client_id, filters)} keys changed by those requests")
+
+        purge(catalog, filters)
+    finally:
+        catalog.close()
+
+    if not keep_blobs:
+        print(f"  {move_blobs(shard_engine, client_id)} blobs moved to {tenant_root(client_id)}")
+    for bind in (shard_engine, engine):
+        session = SessionLocal(bind=bind)
+        try:
+            usage.reconcile(session)
+        finally:
+            session.close()
+    invalidate_listings(client_id)
+    print(f"Client {client_id} split in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--client", type=int, action="append", default=[], help="client id (repeatable)")
+    parser.add_argument("--all", action="store_true", help="every client without a shard")
+    parser.add_argument("--grace", type=float, default=30, help="seconds to wait after the switch")
+    parser.add_argument("--keep-blobs", action="store_true", help="leave blobs where they are")
+    args = parser.parse_args()
+
+    if not SHARDING_ENABLED:
+        sys.exit("Set SHARDING_ENABLED=true (here and for the API) before splitting clients off")
+    if engine.dialect.name != "sqlite":
+        sys.exit("Tenant shards require a SQLite database")
+    prepare_database(engine)
+
+    client_ids = args.client
+    if args.all:
+        db = SessionLocal()
+        try:
+            client_ids = db.execute(
+                select(Client.id).where(Client.id.not_in(
+                    select(TenantShard.client_id).where(TenantShard.state == "active")
+                )).order_by(Client.id)
+            ).scalars().all()
+        finally:
+            db.close()
+    if not client_ids:
+        parser.error("name clients with --client or use --all")
+    for client_id in client_ids:
+        split(client_id, args.grace, args.keep_blobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Run the content validation of files that have no report yet (e.g. files
+uploaded before validation existed or while it was disabled).
+
+Usage (from the backend directory):
+    python scripts/validate_files.py            # only files without a report
+    python scripts/validate_files.py --all      # re-check every file
+    python scripts/validate_files.py --failed   # also re-check failed/errored files
+"""
+import argparse
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from app.database import SessionLocal, engine
+from app.models import FileMeta, ValidationReport
+from app.storage import readable_path
+from app import validation
+from app.schema import prepare_database
+from app.sharding import sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="re-check every file")
+    parser.add_argument("--failed", action="store_true", help="also re-check files that failed or errored")
+    args = parser.parse_args()
+
+    prepare_database(engine)
+    db = SessionLocal()
+    query = (
+        select(
+            FileMeta.id, FileMeta.filename, FileMeta.path, FileMeta.sha256, FileMeta.compression,
+            FileMeta.start_date, FileMeta.end_date
+        )
+        .outerjoin(ValidationReport, ValidationReport.file_id == FileMeta.id)
+        .where(FileMeta.path.isnot(None))
+    )
+    if not args.all:
+        if args.failed:
+            query = query.where(ValidationReport.file_id.is_(None) | (ValidationReport.status != "passed"))
+        else:
+            query = query.where(ValidationReport.file_id.is_(None))
+    # The catalog's files, then those of every tenant shard
+    files = [file for session in sessions(db) for file in session.execute(query.order_by(FileMeta.id)).all()]
+    db.close()
+    # Compressed cold-tier files are checked one at a time, each on a decompressed copy
+    batches = [[file for file in files if not file.compression]]
+    batches.extend([file] for file in files if file.compression)
+
+    print(f"Validating {len(files)} files")
+    position = 0
+    for batch in batches:
+        batch = [
+            SimpleNamespace(id=file.id, path=readable_path(file), start_date=file.start_date, end_date=file.end_date)
+            for file in batch
+        ]
+        for _ in validation.validate_now(batch):
+            position += 1
+            if position % 100 == 0:
+                print(f"  {position}/{len(files)}")
+    validation.stop_validation()
+    print("Done")
+
+
+if __name__ == "__main__":
+    main()
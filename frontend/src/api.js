@@ -30,4 +30,11 @@ instance.interceptors.response.use(
   }
 );
 
+// Several dashboard queries in one round trip (POST /dashboard/bootstrap):
+// resolves to { results, errors }, keyed by each query's key or name
+export const bootstrap = async (queries) => {
+  const response = await instance.post("/dashboard/bootstrap", { queries });
+  return response.data;
+};
+
 export default instance;
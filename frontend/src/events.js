@@ -0,0 +1,14 @@
+// Live file changes pushed by GET /events/files (server-sent events).
+// EventSource reconnects on its own and resumes from the last event id.
+export function subscribeFileEvents({ onUploaded, onDeleted, onReset }) {
+  const baseURL = import.meta.env.VITE_API_URL || "http://localhost:8000";
+  const token = encodeURIComponent(localStorage.getItem("token"));
+  const source = new EventSource(`${baseURL}/events/files?token=${token}`);
+
+  source.addEventListener("file.uploaded", (e) => onUploaded && onUploaded(JSON.parse(e.data)));
+  source.addEventListener("file.deleted", (e) => onDeleted && onDeleted(JSON.parse(e.data)));
+  // Missed events are no longer available: reload instead
+  source.addEventListener("reset", () => onReset && onReset());
+
+  return () => source.close();
+}
@@ -1,13 +1,16 @@
-import React, { useState, useEffect } from 'react';
-import axios from '../api';
+import React, { useState, useEffect, useRef } from 'react';
+import axios, { bootstrap } from '../api';
 import { format } from 'date-fns';
 import { ArrowUpTrayIcon, TrashIcon } from '@heroicons/react/24/outline';
 
 export default function AdminDashboard({ token }) {
   const [clients, setClients] = useState([]);
+  const [overview, setOverview] = useState([]);
   const [selectedClient, setSelectedClient] = useState(null);
   const [files, setFiles] = useState([]);
   const [loading, setLoading] = useState(true);
+  // Set when the selected client's files came with the bootstrap request
+  const preloaded = useRef(false);
 
   const fetchAllFiles = async () => {
     try {
@@ -52,14 +55,29 @@ export default function AdminDashboard({ token }) {
   useEffect(() => {
     const fetchClients = async () => {
       try {
-        const response = await axios.get('/admin/clients', {
-          headers: {
-            Authorization: `Bearer ${token}`
-          }
-        });
-        setClients(response.data);
-        if (response.data.length > 0) {
-          const firstClient = response.data[0];
+        // One request for the client list, every client's summary and the
+        // files of the client selected last time
+        const lastClient = localStorage.getItem('adminClient');
+        const queries = [{ name: 'overview' }];
+        if (lastClient) {
+          queries.push({ name: 'history', client_id: lastClient === 'all' ? null : Number(lastClient) });
+        }
+        const { results, errors } = await bootstrap(queries);
+        if (errors.overview) {
+          throw new Error(errors.overview.detail);
+        }
+        const clientList = results.overview.clients
+          .filter((client) => client.client_id !== null)
+          .map((client) => ({ id: client.client_id, name: client.client_name }));
+        setOverview(results.overview.clients);
+        setClients(clientList);
+        const remembered = lastClient === 'all' || clientList.some((client) => String(client.id) === lastClient);
+        if (remembered && results.history) {
+          preloaded.current = true;
+          setFiles(results.history);
+          setSelectedClient(lastClient === 'all' ? 'all' : Number(lastClient));
+        } else if (clientList.length > 0) {
+          const firstClient = clientList[0];
           console.log('Setting first client:', firstClient);
           setSelectedClient(firstClient.id);
         }
@@ -76,6 +94,11 @@ export default function AdminDashboard({ token }) {
   useEffect(() => {
     console.log('Selected client changed:', selectedClient);
     if (selectedClient) {
+      localStorage.setItem('adminClient', String(selectedClient));
+      if (preloaded.current) {
+        preloaded.current = false;
+        return;
+      }
       setLoading(true);
       fetchClientFiles();
     }
@@ -108,12 +131,22 @@ export default function AdminDashboard({ token }) {
     }
   };
 
-  const handleDownload = (file) => {
+  const handleDownload = async (file) => {
     try {
+      const response = await axios.post('/files/download-links', { file_ids: [file.id] }, {
+        headers: {
+          Authorization: `Bearer ${token}`
+        }
+      });
+      const [link] = response.data.links;
+      if (!link) {
+        alert('File is no longer available.');
+        return;
+      }
       // Create a new iframe to trigger the download
       const iframe = document.createElement('iframe');
       iframe.style.display = 'none';
-      iframe.src = `${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/files/download/${file.id}?token=${encodeURIComponent(localStorage.getItem('token'))}&filename=${encodeURIComponent(file.filename)}`;
+      iframe.src = `${import.meta.env.VITE_API_URL || 'http://localhost:8000'}${link.url}`;
       document.body.appendChild(iframe);
       setTimeout(() => {
         document.body.removeChild(iframe);
@@ -193,6 +226,39 @@ export default function AdminDashboard({ token }) {
           Debug Files
         </button>
       </div>
+      <div className="bg-white rounded-lg shadow-sm p-6 mb-8">
+        <h2 className="text-xl font-semibold text-gray-900 mb-4">Clients Overview</h2>
+        <table className="min-w-full divide-y divide-gray-200">
+          <thead className="bg-gray-50">
+            <tr>
+              <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Client</th>
+              <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Files</th>
+              <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Latest Upload</th>
+              <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Date Coverage</th>
+              <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Activity (30 days)</th>
+            </tr>
+          </thead>
+          <tbody className="bg-white divide-y divide-gray-200">
+            {overview.map((client) => (
+              <tr key={client.client_id ?? 'none'}>
+                <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{client.client_name}</td>
+                <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">{client.files}</td>
+                <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                  {client.latest_upload ? format(new Date(client.latest_upload), 'MMM d, yyyy HH:mm') : '-'}
+                </td>
+                <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                  {client.coverage_start
+                    ? `${format(new Date(client.coverage_start), 'MMM d, yyyy')} - ${format(new Date(client.coverage_end), 'MMM d, yyyy')}`
+                    : '-'}
+                </td>
+                <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-900">
+                  {Object.entries(client.activity).map(([action, count]) => `${count} ${action}`).join(', ') || '-'}
+                </td>
+              </tr>
+            ))}
+          </tbody>
+        </table>
+      </div>
       <div className="bg-white rounded-lg shadow-sm p-6">
         <h2 className="text-xl font-semibold text-gray-900 mb-4">Uploaded Files</h2>
         <table className="min-w-full divide-y divide-gray-200">
@@ -3,32 +3,17 @@ import axios from "../api";
 import { format } from "date-fns";
 import { ArrowDownTrayIcon, ArrowUpTrayIcon } from "@heroicons/react/24/outline";
 import { useNavigate } from "react-router-dom";
+import { subscribeFileEvents } from "../events";
 
-const downloadFile = (fileId, filename) => {
-  // Create a temporary form
-  const form = document.createElement('form');
-  form.method = 'GET';
-  form.action = `/files/download/${fileId}`;
-  form.target = '_self'; // Download in same tab
-
-  // Add hidden input for filename
-  const filenameInput = document.createElement('input');
-  filenameInput.type = 'hidden';
-  filenameInput.name = 'filename';
-  filenameInput.value = filename;
-  form.appendChild(filenameInput);
-
-  // Add hidden input for token
-  const tokenInput = document.createElement('input');
-  tokenInput.type = 'hidden';
-  tokenInput.name = 'token';
-  tokenInput.value = localStorage.getItem('token');
-  form.appendChild(tokenInput);
-
-  // Append form to body and submit
-  document.body.appendChild(form);
-  form.submit();
-  document.body.removeChild(form);
+const downloadFile = async (fileId) => {
+  // Short-lived signed link: the JWT never ends up in a URL
+  const res = await axios.post("/files/download-links", { file_ids: [fileId] });
+  const [link] = res.data.links;
+  if (!link) {
+    alert("File is no longer available");
+    return;
+  }
+  window.location.href = `${import.meta.env.VITE_API_URL || "http://localhost:8000"}${link.url}`;
 };
 
 export default function Dashboard({ token }) {
@@ -50,6 +35,19 @@ export default function Dashboard({ token }) {
       }
     };
     fetchFiles();
+
+    // Apply uploads and deletions as they happen instead of re-polling the list
+    return subscribeFileEvents({
+      onUploaded: (event) =>
+        setFiles((current) =>
+          current.some((file) => file.id === event.file_id)
+            ? current
+            : [...current, { ...event, id: event.file_id }]
+        ),
+      onDeleted: (event) =>
+        setFiles((current) => current.filter((file) => file.id !== event.file_id)),
+      onReset: fetchFiles,
+    });
   }, [token]);
 
   if (loading) {
@@ -136,7 +134,7 @@ export default function Dashboard({ token }) {
                     <button
                       onClick={() => {
                         if (window.confirm(`Download file: ${file.filename}?`)) {
-                          downloadFile(file.id, file.filename);
+                          downloadFile(file.id);
                         }
                       }}
                       className="inline-flex items-center px-4 py-2 border border-transparent text-sm font-medium rounded-md text-white bg-indigo-600 hover:bg-indigo-700 focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-indigo-500"